@@ -0,0 +1,66 @@
+"""
+asyncio client against the sync client wrapped in ``run_in_executor``.
+
+Runs GETs from a number of concurrent tasks and reports commands per second.
+Needs a Redis server on localhost; uses db 9. Python 3.6+.
+
+    python benchmarks/asyncio_benchmark.py
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from redis_namespace import StrictRedis, aio
+
+
+async def executor_worker(loop, executor, client, commands):
+    for _ in range(commands):
+        await loop.run_in_executor(executor, client.get, 'key')
+
+
+async def aio_worker(client, commands):
+    for _ in range(commands):
+        await client.get('key')
+
+
+async def pipeline_worker(client, commands, size=100):
+    for _ in range(commands // size):
+        pipe = client.pipeline(transaction=False)
+        for _ in range(size):
+            pipe.get('key')
+        await pipe.execute()
+
+
+def measure(loop, make_workers, tasks, commands):
+    start = time.time()
+    loop.run_until_complete(asyncio.gather(*make_workers()))
+    return tasks * commands / (time.time() - start)
+
+
+def run(commands=2000):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    sync_client = StrictRedis(namespace='bench:', db=9)
+    sync_client.set('key', 'value')
+    async_client = aio.StrictRedis(namespace='bench:', db=9)
+    for tasks in (1, 16, 64):
+        executor = ThreadPoolExecutor(tasks)
+        wrapped = measure(loop, lambda: [
+            executor_worker(loop, executor, sync_client, commands) for _ in range(tasks)],
+            tasks, commands)
+        native = measure(loop, lambda: [
+            aio_worker(async_client, commands) for _ in range(tasks)], tasks, commands)
+        pipelined = measure(loop, lambda: [
+            pipeline_worker(async_client, commands) for _ in range(tasks)], tasks, commands)
+        executor.shutdown()
+        print('%2d tasks  executor %7.0f/s  asyncio %7.0f/s (%.1fx)  '
+              'asyncio pipelines %7.0f/s' % (
+                  tasks, wrapped, native, native / wrapped, pipelined))
+    sync_client.delete('key')
+    async_client.connection_pool.disconnect()
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,54 @@
+"""
+Throughput and latency of GETs issued from many threads sharing one client.
+
+Compares a plain client with one created with ``auto_pipeline=True``. Needs a
+Redis server on localhost; uses (and flushes) db 9.
+
+    python benchmarks/auto_pipeline_benchmark.py
+"""
+from __future__ import print_function
+import threading
+import time
+
+from redis_namespace import StrictRedis
+
+
+def measure(client, threads, commands=2000):
+    latencies = []
+    lock = threading.Lock()
+
+    def work():
+        own = []
+        for _ in range(commands):
+            start = time.time()
+            client.get('key')
+            own.append(time.time() - start)
+        with lock:
+            latencies.extend(own)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start
+    latencies.sort()
+    return threads * commands / elapsed, latencies[int(len(latencies) * 0.99)]
+
+
+def run():
+    plain = StrictRedis(namespace='bench:', db=9)
+    auto = StrictRedis(namespace='bench:', db=9, auto_pipeline=True,
+                       auto_pipeline_window=0.0002)
+    plain.set('key', 'value')
+    for threads in (1, 8, 32):
+        for name, client in (('plain', plain), ('auto ', auto)):
+            ops, p99 = measure(client, threads)
+            print('%2d threads  %s  %8.0f ops/s  p99 %6.3f ms' % (
+                threads, name, ops, p99 * 1e3))
+    plain.flushdb()
+
+
+if __name__ == '__main__':
+    run()
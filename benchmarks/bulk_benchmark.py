@@ -0,0 +1,39 @@
+"""
+Prefixing cost for MGET/DEL with very large key lists.
+
+Compares calling ``add_namespace`` per key with ``add_namespace_bulk`` on a
+list, and, when numpy is installed, on a fixed-width byte array.
+
+    python benchmarks/bulk_benchmark.py
+"""
+from __future__ import print_function
+import timeit
+
+from redis_namespace import Namespace, add_namespace, add_namespace_bulk
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def run(repeat=5):
+    ns = Namespace('tenant:42:')
+    for count in (50000, 200000):
+        keys = [('cache:item:%d' % i).encode() for i in range(count)]
+        per_key = min(timeit.repeat(
+            lambda: [add_namespace(ns, k) for k in keys], number=1, repeat=repeat))
+        bulk = min(timeit.repeat(
+            lambda: add_namespace_bulk(ns, keys), number=1, repeat=repeat))
+        print('%6d keys  per-key %7.2f ms  bulk %7.2f ms  (%.2fx)' % (
+            count, per_key * 1e3, bulk * 1e3, per_key / bulk))
+        if numpy is not None:
+            array = numpy.array(keys)
+            vectorized = min(timeit.repeat(
+                lambda: add_namespace_bulk(ns, array), number=1, repeat=repeat))
+            print('%6d keys  numpy   %7.2f ms  (%.2fx)' % (
+                count, vectorized * 1e3, per_key / vectorized))
+
+
+if __name__ == '__main__':
+    run()
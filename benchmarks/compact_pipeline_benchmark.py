@@ -0,0 +1,45 @@
+"""
+Memory held by a queued pipeline, with and without ``compact=True``.
+
+Queues 100k SETs and reports the memory traced while they sit in the stack,
+next to the size of the packed commands and the time ``execute()`` takes
+against a Redis server on localhost (db 9, flushed). Python 3 only
+(tracemalloc).
+
+    python benchmarks/compact_pipeline_benchmark.py
+"""
+from __future__ import print_function
+import time
+import tracemalloc
+
+from redis_namespace import StrictRedis
+
+
+def queue(client, compact, count):
+    pipe = client.pipeline(transaction=False, compact=compact)
+    for i in range(count):
+        pipe.set('key:%d' % i, 'value:%d' % i)
+    return pipe
+
+
+def run(count=100000):
+    client = StrictRedis(namespace='bench:', db=9)
+    wire = len(b''.join(b''.join(client.connection_pool.get_encoder().encode(a)
+                                 for a in ('SET', 'bench:key:%d' % i, 'value:%d' % i))
+                        for i in range(count)))
+    print('%d SETs, about %.1f MB of arguments on the wire' % (count, wire / 1e6))
+    for compact in (False, True):
+        tracemalloc.start()
+        pipe = queue(client, compact, count)
+        queued = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.time()
+        pipe.execute()
+        elapsed = time.time() - start
+        print('compact=%-5s queued %7.1f MB  execute %6.1f ms' % (
+            compact, queued / 1e6, elapsed * 1e3))
+    client.flushdb()
+
+
+if __name__ == '__main__':
+    run()
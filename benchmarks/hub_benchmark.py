@@ -0,0 +1,60 @@
+"""
+Server-side cost of one subscriber connection per namespace versus a hub.
+
+Subscribes ``tenants`` namespaces to one channel each, first with a
+``PubSub`` per namespace and then with handles on one ``SubscriberHub``, and
+reports the connected clients and used memory the server gains. Needs a
+Redis server on localhost.
+
+    python benchmarks/hub_benchmark.py
+"""
+from __future__ import print_function
+import time
+
+from redis_namespace import StrictRedis
+from redis_namespace.hub import SubscriberHub
+
+
+def server_stats(client):
+    info = client.info()
+    return info['connected_clients'], info['used_memory']
+
+
+def per_namespace(tenants):
+    handles = []
+    for i in range(tenants):
+        p = StrictRedis(namespace='tenant%d:' % i).pubsub()
+        p.subscribe('events')
+        handles.append(p)
+    return handles, lambda: [p.close() for p in handles]
+
+
+def shared(tenants):
+    hub = SubscriberHub()
+    handles = []
+    for i in range(tenants):
+        p = hub.pubsub('tenant%d:' % i)
+        p.subscribe('events')
+        handles.append(p)
+    return handles, hub.close
+
+
+def measure(name, setup, tenants, admin):
+    clients, memory = server_stats(admin)
+    handles, close = setup(tenants)
+    time.sleep(0.2)
+    now_clients, now_memory = server_stats(admin)
+    print('%-14s %6d connections  %9.1f KiB' % (
+        name, now_clients - clients, (now_memory - memory) / 1024.0))
+    close()
+    time.sleep(0.2)
+
+
+def run(tenants=1000):
+    admin = StrictRedis()
+    measure('per namespace', per_namespace, tenants, admin)
+    measure('hub', shared, tenants, admin)
+
+
+if __name__ == '__main__':
+    run()
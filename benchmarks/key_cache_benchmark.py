@@ -0,0 +1,53 @@
+"""
+Effect of the prefixed key cache on a Zipfian key distribution.
+
+Rewrites and packs GET commands for keys drawn from a Zipf(s=1.2)
+distribution over 20k distinct keys, with and without ``key_cache_size``.
+
+    python benchmarks/key_cache_benchmark.py
+"""
+from __future__ import print_function
+import bisect
+import random
+import timeit
+
+from redis.connection import Connection
+
+from redis_namespace import KeyCache, Namespace, args_with_namespace
+
+
+def zipf_keys(count, distinct=20000, s=1.2, seed=0):
+    rnd = random.Random(seed)
+    cumulative = []
+    total = 0.0
+    for rank in range(1, distinct + 1):
+        total += 1.0 / rank ** s
+        cumulative.append(total)
+    return ['ratelimit:user:%d' % bisect.bisect(cumulative, rnd.random() * total)
+            for _ in range(count)]
+
+
+def run(count=200000):
+    keys = zipf_keys(count)
+    pack = Connection().pack_command
+
+    def issue(ns):
+        for key in keys:
+            pack(*args_with_namespace(ns, 'GET', key))
+
+    plain = Namespace('tenant:42:')
+    baseline = min(timeit.repeat(lambda: issue(plain), number=1, repeat=3))
+    print('no cache        %6.3f us/command' % (baseline / count * 1e6))
+
+    for size in (1024, 8192, 65536):
+        cached = Namespace('tenant:42:')
+        cached.key_cache = KeyCache(cached, size)
+        elapsed = min(timeit.repeat(lambda: issue(cached), number=1, repeat=3))
+        cache = cached.key_cache
+        print('cache %-9d %6.3f us/command  hit ratio %.1f%%  (%.2fx)' % (
+            size, elapsed / count * 1e6,
+            100.0 * cache.hits / (cache.hits + cache.misses), baseline / elapsed))
+
+
+if __name__ == '__main__':
+    run()
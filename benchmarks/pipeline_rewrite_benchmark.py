@@ -0,0 +1,67 @@
+"""
+Queueing and executing large namespaced pipelines.
+
+Compares rewriting each command as it is queued (the previous behaviour, kept
+here as ``EagerPipeline``) with the deferred bulk rewrite done by
+``Pipeline.execute``. The first column only queues and rewrites; the second
+also executes against a Redis server on localhost (db 9, flushed).
+
+    python benchmarks/pipeline_rewrite_benchmark.py
+"""
+from __future__ import print_function
+import timeit
+
+from redis.client import Pipeline as _Pipeline
+
+from redis_namespace import Pipeline, StrictRedis, args_with_namespace
+
+
+class EagerPipeline(Pipeline):
+
+    def execute_command(self, *args, **kwargs):
+        args = args_with_namespace(self._args_namespace, *args)
+        return _Pipeline.execute_command(self, *args, **kwargs)
+
+    def _rewrite_stack(self):
+        pass
+
+
+def make_pipeline(client, pipeline_class):
+    return pipeline_class(client.connection_pool, client.response_callbacks, False, None,
+                          namespace=client._namespace)
+
+
+def queue(pipe, count):
+    for i in range(count):
+        pipe.get('key:%d' % i)
+    return pipe
+
+
+def rewrite(client, pipeline_class, count):
+    pipe = queue(make_pipeline(client, pipeline_class), count)
+    pipe._rewrite_stack()
+    pipe.reset()
+
+
+def execute(client, pipeline_class, count):
+    queue(make_pipeline(client, pipeline_class), count).execute()
+
+
+def run(repeat=3):
+    client = StrictRedis(namespace='bench:', db=9)
+    for count in (1000, 10000, 100000):
+        row = []
+        for pipeline_class in (EagerPipeline, Pipeline):
+            row.append(min(timeit.repeat(
+                lambda: rewrite(client, pipeline_class, count), number=1, repeat=repeat)))
+            row.append(min(timeit.repeat(
+                lambda: execute(client, pipeline_class, count), number=1, repeat=repeat)))
+        print('%6d GETs  queue eager %7.2f ms  deferred %7.2f ms  (%.2fx)' % (
+            count, row[0] * 1e3, row[2] * 1e3, row[0] / row[2]))
+        print('%6d GETs  exec  eager %7.2f ms  deferred %7.2f ms  (%.2fx)' % (
+            count, row[1] * 1e3, row[3] * 1e3, row[1] / row[3]))
+    client.flushdb()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,40 @@
+"""
+Cost of prefixing a key and packing it into a RESP command.
+
+Compares the bytes-native ``add_namespace`` with the previous
+``'{}{}'.format(ns, nativestr(key))`` implementation.
+
+    python benchmarks/prefix_benchmark.py
+"""
+from __future__ import print_function
+import timeit
+
+from redis.connection import Connection
+from redis._compat import nativestr
+
+from redis_namespace import Namespace, add_namespace
+
+
+def legacy_add_namespace(ns, key):
+    if isinstance(key, bytes):
+        return '{}{}'.format(ns, nativestr(key))
+    return '{}{}'.format(ns, key)
+
+
+def run(number=200000):
+    ns = Namespace('tenant:42:')
+    pack = Connection().pack_command
+    for key in ('session:abcdef', b'session:abcdef'):
+        legacy = min(timeit.repeat(
+            lambda: pack('GET', legacy_add_namespace(ns, key)),
+            number=number, repeat=3))
+        native = min(timeit.repeat(
+            lambda: pack('GET', add_namespace(ns, key)),
+            number=number, repeat=3))
+        print('%-6s key  legacy %6.3f us  native %6.3f us  (%.2fx)' % (
+            type(key).__name__, legacy / number * 1e6,
+            native / number * 1e6, legacy / native))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,59 @@
+"""
+Draining a subscriber one message at a time versus in batches.
+
+Publishes the same burst of messages before each run and times how long the
+subscriber takes to consume them with ``get_message`` in a loop and with
+``get_messages``. Needs a Redis server on localhost; uses db 9.
+
+    python benchmarks/pubsub_benchmark.py
+"""
+from __future__ import print_function
+import time
+
+from redis_namespace import StrictRedis
+
+
+def publish(client, messages):
+    with client.pipeline(transaction=False) as pipe:
+        for i in range(messages):
+            pipe.publish('events', i)
+        pipe.execute()
+    # let the burst reach the subscriber's socket
+    time.sleep(0.2)
+
+
+def one_by_one(pubsub, messages):
+    received = 0
+    while received < messages:
+        if pubsub.get_message(timeout=1) is not None:
+            received += 1
+
+
+def batched(pubsub, messages, max_count):
+    received = 0
+    while received < messages:
+        received += len(pubsub.get_messages(max_count=max_count, timeout=1))
+
+
+def run(messages=50000):
+    client = StrictRedis(namespace='bench:', db=9)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe('events')
+    pubsub.get_message(timeout=1)
+    publish(client, messages)
+    start = time.time()
+    one_by_one(pubsub, messages)
+    baseline = time.time() - start
+    print('get_message      %9.0f msg/s' % (messages / baseline))
+    for max_count in (100, 1000, 10000):
+        publish(client, messages)
+        start = time.time()
+        batched(pubsub, messages, max_count)
+        elapsed = time.time() - start
+        print('get_messages(%-5d) %7.0f msg/s  (%.1fx)' % (
+            max_count, messages / elapsed, baseline / elapsed))
+    pubsub.close()
+
+
+if __name__ == '__main__':
+    run()
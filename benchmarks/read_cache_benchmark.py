@@ -0,0 +1,57 @@
+"""
+Effect of the client-side read cache on a read-heavy Zipfian workload.
+
+Issues GET commands for keys drawn from a Zipf(s=1.2) distribution over
+20k distinct keys, with one SET every 50 commands, against a local Redis
+server (db 9), with and without ``read_cache``.
+
+    PYTHONPATH=. python benchmarks/read_cache_benchmark.py
+"""
+from __future__ import print_function
+import bisect
+import random
+import time
+
+import redis_namespace
+
+
+def zipf_keys(count, distinct=20000, s=1.2, seed=0):
+    rnd = random.Random(seed)
+    cumulative = []
+    total = 0.0
+    for rank in range(1, distinct + 1):
+        total += 1.0 / rank ** s
+        cumulative.append(total)
+    return ['user:%d' % bisect.bisect(cumulative, rnd.random() * total)
+            for _ in range(count)]
+
+
+def issue(client, keys, write_every=50):
+    start = time.time()
+    for i, key in enumerate(keys):
+        if i % write_every:
+            client.get(key)
+        else:
+            client.set(key, i)
+    return time.time() - start
+
+
+def run(count=50000):
+    keys = zipf_keys(count)
+    plain = redis_namespace.StrictRedis(namespace='bench:', db=9)
+    baseline = issue(plain, keys)
+    print('no cache        %6.1f us/command' % (baseline / count * 1e6))
+
+    for entries in (1000, 10000):
+        client = redis_namespace.StrictRedis(namespace='bench:', db=9, read_cache=True,
+                                             read_cache_max_entries=entries)
+        elapsed = issue(client, keys)
+        cache = client.read_cache
+        print('cache %-9d %6.1f us/command  hit ratio %.1f%%  evictions %d  (%.1fx)' % (
+            entries, elapsed / count * 1e6, 100.0 * cache.hit_ratio, cache.evictions,
+            baseline / elapsed))
+    plain.delete(*set(keys))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,65 @@
+"""
+Recovery time of a subscriber with many channels after a reconnect.
+
+Subscribes ``channels`` namespaced channels, drops the connection and times
+how long it takes until the subscriber has resubscribed and read every
+confirmation. The stock path (one SUBSCRIBE through the namespace rewrite,
+confirmations read one by one with ``get_message``) is compared with
+chunked resubscription of the cached prefixed names and ``get_messages``.
+Needs a Redis server on localhost.
+
+    python benchmarks/resubscribe_benchmark.py
+"""
+from __future__ import print_function
+import time
+
+from redis.client import PubSub as _PubSub
+
+from redis_namespace import PubSub, StrictRedis
+
+
+class StockPubSub(PubSub):
+    on_connect = _PubSub.on_connect
+
+
+def recover_one_by_one(pubsub):
+    pubsub.ping()
+    while True:
+        message = pubsub.get_message(timeout=1)
+        if message is not None and message['type'] == 'pong':
+            return
+
+
+def recover_batched(pubsub):
+    pubsub.ping()
+    while True:
+        for message in pubsub.get_messages(max_count=10000, timeout=1):
+            if message['type'] == 'pong':
+                return
+
+
+def measure(name, pubsub, channels, recover):
+    pubsub.subscribe(*['events.%d' % i for i in range(channels)])
+    recover(pubsub)
+    pubsub.connection.disconnect()
+    start = time.time()
+    recover(pubsub)
+    elapsed = time.time() - start
+    pubsub.close()
+    print('%-8s %8.1f ms' % (name, elapsed * 1000))
+    return elapsed
+
+
+def run(channels=50000):
+    client = StrictRedis(namespace='bench:')
+    pool = client.connection_pool
+    baseline = measure('stock', StockPubSub(pool, ignore_subscribe_messages=True,
+                                            namespace='bench:'),
+                       channels, recover_one_by_one)
+    elapsed = measure('batched', client.pubsub(ignore_subscribe_messages=True),
+                      channels, recover_batched)
+    print('%.1fx faster' % (baseline / elapsed))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,90 @@
+"""
+Per-call overhead of rewriting command arguments with a namespace.
+
+Compares the compiled rewriter table used by ``args_with_namespace`` with the
+previous if/elif implementation, which is kept here as a reference.
+
+    python benchmarks/rewrite_benchmark.py
+"""
+from __future__ import print_function
+import timeit
+
+from redis.connection import Token
+from redis._compat import basestring, bytes
+
+from redis_namespace import add_namespace, args_with_namespace, get_handling
+
+
+def legacy_args_with_namespace(ns, *original_args):
+    args = list(original_args)
+    if not ns or len(args) < 2:
+        return original_args
+    command_name = args.pop(0)
+    before, _ = get_handling(command_name)
+    if not before:
+        return original_args
+    if before == 'first':
+        args[0] = add_namespace(ns, args[0])
+    elif before == 'all':
+        args = add_namespace(ns, args)
+    elif before == 'exclude_first':
+        args[1:] = add_namespace(ns, args[1:])
+    elif before == 'exclude_last':
+        args[:-1] = add_namespace(ns, args[:-1])
+    elif before == 'exclude_options':
+        args[0] = add_namespace(ns, args[0])
+        numkeys = args[1]
+        args[2:2 + numkeys] = add_namespace(ns, args[2:2 + numkeys])
+    elif before == 'alternate':
+        new_args = []
+        for i, k in enumerate(args):
+            if i % 2 == 0:
+                new_args.append(add_namespace(ns, k))
+            else:
+                new_args.append(k)
+        args = new_args
+    elif before == 'eval_style':
+        numkeys = args[1]
+        args[2:2 + numkeys] = add_namespace(ns, args[2:2 + numkeys])
+    elif before == 'scan_style':
+        is_custom_match = False
+        for i, a in enumerate(args):
+            if isinstance(a, (basestring, bytes, Token)) and str(a).lower() == 'match':
+                args[i + 1] = add_namespace(ns, args[i + 1])
+                is_custom_match = True
+                break
+        if not is_custom_match:
+            args.insert(1, 'match')
+            args.insert(2, add_namespace(ns, '*'))
+    args.insert(0, command_name)
+    return tuple(args)
+
+
+COMMANDS = [
+    ('GET', 'foo'),
+    ('SET', 'foo', 'bar', 'EX', 10),
+    ('MGET', 'a', 'b', 'c', 'd'),
+    ('MSET', 'a', 1, 'b', 2),
+    ('EVALSHA', 'sha', 2, 'a', 'b', 'arg'),
+    ('ZUNIONSTORE', 'd', 2, 'a', 'b'),
+]
+
+
+def run(number=200000):
+    ns = 'ns:'
+    for args in COMMANDS:
+        assert legacy_args_with_namespace(ns, *args) == \
+            args_with_namespace(ns, *args)
+        legacy = min(timeit.repeat(
+            lambda: legacy_args_with_namespace(ns, *args),
+            number=number, repeat=3))
+        compiled = min(timeit.repeat(
+            lambda: args_with_namespace(ns, *args),
+            number=number, repeat=3))
+        print('%-12s legacy %6.3f us  compiled %6.3f us  (%.2fx)' % (
+            args[0], legacy / number * 1e6, compiled / number * 1e6,
+            legacy / compiled))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,62 @@
+"""
+Consumer-group throughput with and without batching.
+
+Consumes the same stream once with one XREADGROUP and one XACK per message and
+once through ``StreamConsumer`` with COUNT reads and pipelined acks. Needs a
+Redis >= 5.0 server on localhost; uses (and flushes) db 9.
+
+    python benchmarks/stream_benchmark.py
+"""
+from __future__ import print_function
+import time
+
+from redis_namespace import StrictRedis
+
+
+def fill(client, count):
+    client.flushdb()
+    with client.pipeline(transaction=False) as pipe:
+        for i in range(count):
+            pipe.xadd('jobs', {'job': i})
+        pipe.execute()
+    client.xgroup_create('jobs', 'workers', 0)
+
+
+def one_by_one(client):
+    while True:
+        response = client.xreadgroup('workers', 'w1', {'jobs': '>'}, count=1)
+        if not response:
+            return
+        for stream, entries in response:
+            for message_id, fields in entries:
+                client.xack(stream, 'workers', message_id)
+
+
+def batched(client, count):
+    consumer = client.stream_consumer('jobs', 'workers', 'w1', count=count,
+                                      create_group=False)
+    with consumer:
+        for message in consumer:
+            pass
+
+
+def run(messages=20000):
+    client = StrictRedis(namespace='bench:', db=9)
+    fill(client, messages)
+    start = time.time()
+    one_by_one(client)
+    baseline = time.time() - start
+    print('one by one     %8.0f msg/s' % (messages / baseline))
+    for count in (10, 100, 1000):
+        fill(client, messages)
+        start = time.time()
+        batched(client, count)
+        elapsed = time.time() - start
+        assert client.xpending('jobs', 'workers')['pending'] == 0
+        print('count=%-5d     %8.0f msg/s  (%.1fx)' % (
+            count, messages / elapsed, baseline / elapsed))
+    client.flushdb()
+
+
+if __name__ == '__main__':
+    run()
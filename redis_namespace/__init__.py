@@ -8,11 +8,36 @@ from ._version import __version__ as current_version
 if not redis_version.startswith('.'.join(current_version.split('.')[:-1])):
     raise Exception('Version mismatch! redis version: %s, redis-namespace version: %s' % (redis_version, current_version))
 
+import copy
+import json
+import os
+import random
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from functools import partial
+from itertools import chain
+
 import redis
-from redis.client import Token, Pipeline as _Pipeline, PubSub as _PubSub, EMPTY_RESPONSE
-from redis.connection import ConnectionPool
-from redis.exceptions import ResponseError
-from redis._compat import nativestr, basestring, bytes
+from redis.client import (Token, Pipeline as _Pipeline, PubSub as _PubSub, EMPTY_RESPONSE,
+                          list_or_args)
+from redis.connection import (ConnectionPool, Connection, PythonParser, HiredisParser,
+                              SERVER_CLOSED_CONNECTION_ERROR, SYM_STAR, SYM_DOLLAR,
+                              SYM_CRLF, SYM_EMPTY)
+from redis.exceptions import (ConnectionError, DataError, InvalidResponse, RedisError,
+                              ResponseError, TimeoutError, WatchError)
+from redis.utils import HIREDIS_AVAILABLE
+from redis._compat import (byte_to_chr, iteritems, nativestr, basestring, bytes, long,
+                           unicode, xrange)
+
+try:
+    from functools import lru_cache
+except ImportError:
+    from backports.functools_lru_cache import lru_cache
+
+from .streams import StreamConsumer
 
 
 NAMESPACED_COMMANDS = {
@@ -40,8 +65,8 @@ NAMESPACED_COMMANDS = {
     "geohash": ['first'],
     "geopos": ['first'],
     "geodist": ['first'],
-    "georadius": [None],
-    "georadiusbymember": [None],
+    "georadius": ['georadius'],
+    "georadiusbymember": ['georadius'],
     "get": ['first'],
     "getbit": ['first'],
     "getrange": ['first'],
@@ -126,6 +151,7 @@ NAMESPACED_COMMANDS = {
     "smembers": ['first'],
     "smove": ['exclude_last'],
     "sort": ['sort'],
+    "sort_ro": ['sort'],
     "spop": ['first'],
     "srandmember": ['first'],
     "srem": ['first'],
@@ -139,6 +165,24 @@ NAMESPACED_COMMANDS = {
     "type": ['first'],
     "unlink": ['all'],
     "unsubscribe": ['all'],
+    "xack": ['first'],
+    "xadd": ['first'],
+    "xclaim": ['first'],
+    "xdel": ['first'],
+    "xgroup create": ['first'],
+    "xgroup delconsumer": ['first'],
+    "xgroup destroy": ['first'],
+    "xgroup setid": ['first'],
+    "xinfo consumers": ['first'],
+    "xinfo groups": ['first'],
+    "xinfo stream": ['first'],
+    "xlen": ['first'],
+    "xpending": ['first'],
+    "xrange": ['first'],
+    "xread": ['streams', 'streams'],
+    "xreadgroup": ['streams', 'streams'],
+    "xrevrange": ['first'],
+    "xtrim": ['first'],
     "zadd": ['first'],
     "zcard": ['first'],
     "zcount": ['first'],
@@ -198,9 +242,13 @@ ADMINISTRATIVE_COMMANDS = {
     "slaveof": [],
 }
 
+# registered with namespaced=False
+OTHER_COMMANDS = {}
+# learned from servers by apply_command_specs(); process-wide and only ever
+# added to, so the first server to report a command decides its handling
+SERVER_COMMANDS = {}
+# rebuilt from the tables above by compile_commands()
 COMMANDS = {}
-for cs in [NAMESPACED_COMMANDS, TRANSACTION_COMMANDS, HELPER_COMMANDS, ADMINISTRATIVE_COMMANDS]:
-    COMMANDS.update(cs)
 
 
 def get_handling(command_name):
@@ -214,95 +262,702 @@ def get_handling(command_name):
     return None, None
 
 
+def _rewrite_first(ns, args):
+    return (args[0], add_namespace(ns, args[1])) + args[2:]
+
+
+def _rewrite_all(ns, args):
+    return (args[0],) + tuple(add_namespace_bulk(ns, args[1:]))
+
+
+def _rewrite_exclude_first(ns, args):
+    return args[:2] + tuple(add_namespace_bulk(ns, args[2:]))
+
+
+def _rewrite_exclude_last(ns, args):
+    return (args[0],) + tuple(add_namespace_bulk(ns, args[1:-1])) + args[-1:]
+
+
+def _rewrite_exclude_options(ns, args):
+    end = 3 + int(args[2])
+    return ((args[0], add_namespace(ns, args[1]), args[2]) +
+            tuple([add_namespace(ns, k) for k in args[3:end]]) + args[end:])
+
+
+def _rewrite_alternate(ns, args):
+    new_args = list(args)
+    new_args[1::2] = add_namespace_bulk(ns, args[1::2])
+    return tuple(new_args)
+
+
+def _rewrite_sort(ns, args):
+    new_args = list(args)
+    for i in _keys_sort(args):
+        new_args[i] = add_namespace(ns, args[i])
+    return tuple(new_args)
+
+
+def _rewrite_georadius(ns, args):
+    new_args = list(args)
+    for i in _keys_georadius(args):
+        new_args[i] = add_namespace(ns, args[i])
+    return tuple(new_args)
+
+
+def _rewrite_eval_style(ns, args):
+    end = 3 + int(args[2])
+    return args[:3] + tuple([add_namespace(ns, k) for k in args[3:end]]) + args[end:]
+
+
+def _rewrite_scan_style(ns, args):
+    for i, a in enumerate(args):
+        if i and isinstance(a, (basestring, bytes, Token)) and str(a).lower() == 'match':
+            return args[:i + 1] + (add_namespace(ns, args[i + 1]),) + args[i + 2:]
+    return (args[0], args[1], 'match', add_namespace(ns, '*')) + args[2:]
+
+
+def _is_keyword(arg, keyword):
+    if isinstance(arg, Token):
+        arg = arg.value
+    elif isinstance(arg, bytes):
+        arg = arg.decode('latin-1')
+    elif not isinstance(arg, basestring):
+        return False
+    return arg.upper() == keyword
+
+
+def _streams_keys(args):
+    # XREADGROUP starts with GROUP <group> <consumer>, which may be named STREAMS
+    start = 4 if _is_keyword(args[1], 'GROUP') else 1
+    for i in xrange(start, len(args)):
+        if _is_keyword(args[i], 'STREAMS'):
+            return xrange(i + 1, i + 1 + (len(args) - i - 1) // 2)
+    return ()
+
+
+def _rewrite_streams(ns, args):
+    keys = _streams_keys(args)
+    if not keys:
+        return args
+    return (args[:keys[0]] + tuple(add_namespace_bulk(ns, args[keys[0]:keys[-1] + 1])) +
+            args[keys[-1] + 1:])
+
+
+REWRITER_FACTORIES = {
+    'first': _rewrite_first,
+    'all': _rewrite_all,
+    'exclude_first': _rewrite_exclude_first,
+    'exclude_last': _rewrite_exclude_last,
+    'exclude_options': _rewrite_exclude_options,
+    'alternate': _rewrite_alternate,
+    'sort': _rewrite_sort,
+    'georadius': _rewrite_georadius,
+    'eval_style': _rewrite_eval_style,
+    'scan_style': _rewrite_scan_style,
+    'streams': _rewrite_streams,
+}
+REWRITERS = {}
+
+
+def _keys_first(args):
+    return (1,)
+
+
+def _keys_all(args):
+    return xrange(1, len(args))
+
+
+def _keys_exclude_first(args):
+    return xrange(2, len(args))
+
+
+def _keys_exclude_last(args):
+    return xrange(1, len(args) - 1)
+
+
+def _keys_exclude_options(args):
+    return (1,) + tuple(xrange(3, 3 + int(args[2])))
+
+
+def _keys_alternate(args):
+    return xrange(1, len(args), 2)
+
+
+def _keys_eval_style(args):
+    return xrange(3, 3 + int(args[2]))
+
+
+def _keys_sort(args):
+    positions = [1]
+    i = 2
+    while i < len(args) - 1:
+        if _is_keyword(args[i], 'LIMIT'):
+            i += 3
+        elif _is_keyword(args[i], 'BY') or _is_keyword(args[i], 'STORE') or \
+                (_is_keyword(args[i], 'GET') and not _is_keyword(args[i + 1], '#')):
+            positions.append(i + 1)
+            i += 2
+        else:
+            i += 1
+    return positions
+
+
+def _keys_georadius(args):
+    # options follow GEORADIUS key longitude latitude radius unit or
+    # GEORADIUSBYMEMBER key member radius unit, a member may be named STORE
+    positions = [1]
+    start = 5 if _is_keyword(args[0], 'GEORADIUSBYMEMBER') else 6
+    for i in xrange(start, len(args) - 1):
+        if _is_keyword(args[i], 'STORE') or _is_keyword(args[i], 'STOREDIST'):
+            positions.append(i + 1)
+    return positions
+
+
+# handlings whose key positions can be located; scan_style adds
+# arguments and has to be rewritten
+KEY_LOCATOR_FACTORIES = {
+    'first': _keys_first,
+    'all': _keys_all,
+    'exclude_first': _keys_exclude_first,
+    'exclude_last': _keys_exclude_last,
+    'exclude_options': _keys_exclude_options,
+    'alternate': _keys_alternate,
+    'eval_style': _keys_eval_style,
+    'sort': _keys_sort,
+    'georadius': _keys_georadius,
+    'streams': _streams_keys,
+}
+KEY_LOCATORS = {}
+REPLY_KEYS = {}
+
+
+KeySpec = namedtuple('KeySpec', 'first last step')
+# key specs that have a named handling
+NAMED_KEY_SPECS = {
+    (1, 1, 1): 'first',
+    (1, -1, 1): 'all',
+    (1, -1, 2): 'alternate',
+    (1, -2, 1): 'exclude_last',
+    (2, -1, 1): 'exclude_first',
+}
+
+
+def _key_spec_slice(spec, args):
+    stop = spec.last + 1 if spec.last >= 0 else len(args) + spec.last + 1
+    return slice(spec.first, stop, spec.step)
+
+
+def _key_spec_rewriter(spec):
+    def rewrite(ns, args):
+        keys = _key_spec_slice(spec, args)
+        new_args = list(args)
+        new_args[keys] = add_namespace_bulk(ns, args[keys])
+        return tuple(new_args)
+    return rewrite
+
+
+def _key_spec_locator(spec):
+    def locate(args):
+        keys = _key_spec_slice(spec, args)
+        return xrange(*keys.indices(len(args)))
+    return locate
+
+
+def compile_commands():
+    COMMANDS.clear()
+    for cs in [SERVER_COMMANDS, NAMESPACED_COMMANDS, TRANSACTION_COMMANDS,
+               HELPER_COMMANDS, ADMINISTRATIVE_COMMANDS, OTHER_COMMANDS]:
+        COMMANDS.update(cs)
+    REWRITERS.clear()
+    KEY_LOCATORS.clear()
+    REPLY_KEYS.clear()
+    for command_name in COMMANDS:
+        before, after = get_handling(command_name)
+        if after is not None:
+            REPLY_KEYS[command_name] = after
+            REPLY_KEYS[command_name.upper()] = after
+        if isinstance(before, KeySpec):
+            rewriter = _key_spec_rewriter(before)
+            locator = _key_spec_locator(before)
+        else:
+            rewriter = REWRITER_FACTORIES.get(before)
+            locator = KEY_LOCATOR_FACTORIES.get(before)
+        if rewriter is not None:
+            REWRITERS[command_name] = rewriter
+            REWRITERS[command_name.upper()] = rewriter
+        if locator is not None:
+            KEY_LOCATORS[command_name] = locator
+            KEY_LOCATORS[command_name.upper()] = locator
+
+
+def register_command(command_name, handling, namespaced=True):
+    command_name = command_name.lower()
+    if namespaced:
+        NAMESPACED_COMMANDS[command_name] = handling
+    else:
+        OTHER_COMMANDS[command_name] = handling
+    compile_commands()
+
+
+compile_commands()
+
+
+def command_key_specs(command_reply):
+    specs = {}
+    for command in command_reply:
+        name, first, last, step = command[0], command[3], command[4], command[5]
+        flags = [nativestr(flag) for flag in command[2]]
+        # movable keys can't be described by a range
+        if first <= 0 or 'movablekeys' in flags:
+            continue
+        specs[nativestr(name).lower()] = (first, last, step)
+    return specs
+
+
+def apply_command_specs(specs):
+    added = False
+    for command_name, spec in specs.items():
+        # the tables and earlier servers win
+        if command_name in COMMANDS:
+            continue
+        spec = tuple(spec)
+        SERVER_COMMANDS[command_name] = [NAMED_KEY_SPECS.get(spec) or KeySpec(*spec)]
+        added = True
+    if added:
+        compile_commands()
+
+
+def load_command_specs(connection_pool, cache_dir=None):
+    if getattr(connection_pool, '_command_specs_version', None) is not None:
+        return
+    client = redis.StrictRedis(connection_pool=connection_pool)
+    version = nativestr(client.info('server')['redis_version'])
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'redis-namespace')
+    path = os.path.join(cache_dir, 'commands-%s.json' % version)
+    try:
+        with open(path) as f:
+            specs = json.load(f)
+    except (IOError, OSError, ValueError):
+        specs = command_key_specs(client.execute_command('COMMAND'))
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_path = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(specs, f)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            pass
+    apply_command_specs(specs)
+    connection_pool._command_specs_version = version
+
+
+def get_rewriter(command_name):
+    try:
+        return REWRITERS[command_name]
+    except KeyError:
+        return REWRITERS.get(command_name.lower())
+
+
+def get_key_locator(command_name):
+    try:
+        return KEY_LOCATORS[command_name]
+    except KeyError:
+        return KEY_LOCATORS.get(command_name.lower())
+
+
+def get_reply_keys(command_name):
+    try:
+        return REPLY_KEYS[command_name]
+    except KeyError:
+        return REPLY_KEYS.get(command_name.lower())
+
+
 def args_with_namespace(ns, *original_args):
-    args = list(original_args)
-    if not ns or len(args) < 2:
+    if not ns or len(original_args) < 2:
         return original_args
-    command_name = args.pop(0)
-    before, _ = get_handling(command_name)
-    if not before:
+    rewriter = get_rewriter(original_args[0])
+    if rewriter is None:
         return original_args
-    if before == 'first':
-        args[0] = add_namespace(ns, args[0])
-    elif before == 'all':
-        args = add_namespace(ns, args)
-    elif before == 'exclude_first':
-        args[1:] = add_namespace(ns, args[1:])
-    elif before == 'exclude_last':
-        args[:-1] = add_namespace(ns, args[:-1])
-    elif before == 'exclude_options':
-        args[0] = add_namespace(ns, args[0])
-        numkeys = args[1]
-        args[2:2 + numkeys] = add_namespace(ns, args[2:2 + numkeys])
-    elif before == 'alternate':
-        new_args = []
-        for i, k in enumerate(args):
-            if i % 2 == 0:
-                new_args.append(add_namespace(ns, k))
-            else:
-                new_args.append(k)
-        args = new_args
-    elif before == 'sort':
-        # TODO
-        pass
-    elif before == 'eval_style':
-        numkeys = args[1]
-        args[2:2+numkeys] = add_namespace(ns, args[2:2 + numkeys])
-    elif before == 'scan_style':
-        is_custom_match = False
-        for i, a in enumerate(args):
-            if isinstance(a, (basestring, bytes, Token)) and str(a).lower() == 'match':
-                args[i+1] = add_namespace(ns, args[i + 1])
-                is_custom_match = True
-                break
-        if not is_custom_match:
-            args.insert(1, 'match')
-            args.insert(2, add_namespace(ns, '*'))
-
-    args.insert(0, command_name)
-    return tuple(args)
+    return rewriter(ns, original_args)
 
 
-def response_rm_namespace(ns, command_name, response):
+def response_rm_namespace(ns, command_name, response, memoryviews=False):
     if not ns or not response:
         return response
-    _, after = get_handling(command_name)
-    if after == 'all':
-        response = rm_namespace(ns, response)
-    elif after == 'first':
-        response[0] = rm_namespace(ns, response[0])
-    elif after == 'second':
-        response[1] = rm_namespace(ns, response[1])
+    return strip_reply(ns, get_reply_keys(command_name), response, memoryviews)
+
+
+def strip_reply(ns, reply_keys, response, memoryviews=False):
+    if not ns or not response or isinstance(response, Exception):
+        return response
+    if reply_keys == 'all':
+        response = rm_namespace(ns, response, memoryviews)
+    elif reply_keys == 'first':
+        response[0] = rm_namespace(ns, response[0], memoryviews)
+    elif reply_keys == 'second':
+        response[1] = rm_namespace(ns, response[1], memoryviews)
+    elif reply_keys == 'streams':
+        for stream in response:
+            stream[0] = rm_namespace(ns, stream[0], memoryviews)
     return response
 
 
+def strip_replies(ns, reply_keys, responses, memoryviews=False):
+    # strips a list of replies, e.g. from EXEC, in one pass
+    for i, keys in enumerate(reply_keys):
+        if keys is not None and responses[i] and not isinstance(responses[i], Exception):
+            responses[i] = strip_reply(ns, keys, responses[i], memoryviews)
+    return responses
+
+
+class Namespace(unicode):
+    key_cache = None
+
+    def __new__(cls, namespace='', encoding='utf-8', encoding_errors='strict'):
+        if isinstance(namespace, bytes):
+            encoded = namespace
+            namespace = namespace.decode(encoding, encoding_errors)
+        else:
+            encoded = namespace.encode(encoding, encoding_errors)
+        self = unicode.__new__(cls, namespace)
+        self.encoded = encoded
+        self.encoding = encoding
+        self.encoding_errors = encoding_errors
+        return self
+
+
+def make_namespace(connection_pool, namespace):
+    encoder = connection_pool.get_encoder()
+    if isinstance(namespace, Namespace) and \
+            namespace.encoding == encoder.encoding and \
+            namespace.encoding_errors == encoder.encoding_errors:
+        # shared with the client, including its key cache
+        return namespace
+    return Namespace(namespace or '', encoder.encoding, encoder.encoding_errors)
+
+
+class KeyCache(object):
+
+    def __init__(self, ns, maxsize=1024):
+        self.ns = ns
+        self.maxsize = maxsize
+        self.get = lru_cache(maxsize)(self._prefix)
+
+    def _prefix(self, key):
+        ns = self.ns
+        if isinstance(key, unicode):
+            return (ns + key).encode(ns.encoding, ns.encoding_errors)
+        return ns.encoded + key
+
+    @property
+    def hits(self):
+        return self.get.cache_info().hits
+
+    @property
+    def misses(self):
+        return self.get.cache_info().misses
+
+    @property
+    def currsize(self):
+        return self.get.cache_info().currsize
+
+    def clear(self):
+        self.get.cache_clear()
+
+
+_KEY_TYPES = (basestring, bytes, bytearray, memoryview)
+
+
+def encoded_namespace(ns):
+    try:
+        return ns.encoded
+    except AttributeError:
+        if isinstance(ns, bytes):
+            return ns
+        return ns.encode('utf-8')
+
+
 def add_namespace(ns, key):
     if not ns or not key:
         return key
-    if isinstance(key, list):
+    if isinstance(key, unicode):
+        key_cache = getattr(ns, 'key_cache', None)
+        if key_cache is not None:
+            return key_cache.get(key)
+        return ns + key
+    elif isinstance(key, bytes):
+        key_cache = getattr(ns, 'key_cache', None)
+        if key_cache is not None:
+            return key_cache.get(key)
+        return encoded_namespace(ns) + key
+    elif isinstance(key, (bytearray, memoryview)):
+        return encoded_namespace(ns) + key
+    elif isinstance(key, list):
         return [add_namespace(ns, k) for k in key]
     elif isinstance(key, dict):
         return {add_namespace(ns, k): v for k, v in key.items()}
-    elif isinstance(key, basestring):
-        return '{}{}'.format(ns, key)
-    elif isinstance(key, bytes):
-        return '{}{}'.format(ns, nativestr(key))
     return key
 
 
-def rm_namespace(ns, key):
+def add_namespace_bulk(ns, keys):
     if not ns:
+        return list(keys)
+    # only use numpy when the caller already handed us an array
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and isinstance(keys, numpy.ndarray) and keys.dtype.kind in 'SU':
+        prefix = encoded_namespace(ns) if keys.dtype.kind == 'S' else unicode(ns)
+        return numpy.char.add(prefix, keys).tolist()
+    key_types = set(map(type, keys))
+    if len(key_types) == 1 and all(keys):
+        key_type = key_types.pop()
+        key_cache = getattr(ns, 'key_cache', None)
+        if key_cache is not None and key_type in (unicode, bytes):
+            return list(map(key_cache.get, keys))
+        if issubclass(key_type, unicode):
+            return [ns + k for k in keys]
+        if issubclass(key_type, bytes):
+            prefix = encoded_namespace(ns)
+            return [prefix + k for k in keys]
+    return [add_namespace(ns, k) for k in keys]
+
+
+def rm_namespace(ns, key, memoryviews=False):
+    if not ns:
+        return key
+    if isinstance(key, bytes):
+        prefix = encoded_namespace(ns)
+        if key.startswith(prefix):
+            if memoryviews:
+                return memoryview(key)[len(prefix):]
+            return key[len(prefix):]
         return key
-    if isinstance(key, list):
-        return [rm_namespace(ns, k) for k in key]
+    elif isinstance(key, unicode):
+        if key.startswith(ns):
+            return key[len(ns):]
+        return key
+    elif isinstance(key, list):
+        return rm_namespace_list(ns, key, memoryviews)
     elif isinstance(key, dict):
-        return {rm_namespace(ns, k): v for k, v in key.items()}
-    elif isinstance(key, (basestring, bytes)):
-        return key[len(ns):]
+        return {rm_namespace(ns, k, memoryviews): v for k, v in key.items()}
     return key
 
 
+def rm_namespace_list(ns, keys, memoryviews=False):
+    # strips in place so huge KEYS/SCAN replies are never held twice
+    prefix = encoded_namespace(ns)
+    size = len(prefix)
+    text_size = len(ns)
+    for i, key in enumerate(keys):
+        if isinstance(key, bytes):
+            if key.startswith(prefix):
+                keys[i] = memoryview(key)[size:] if memoryviews else key[size:]
+        elif isinstance(key, unicode):
+            if key.startswith(ns):
+                keys[i] = key[text_size:]
+        elif isinstance(key, (list, dict)):
+            keys[i] = rm_namespace(ns, key, memoryviews)
+    return keys
+
+
+class NamespaceParserMixin(object):
+    _reply_namespace = None
+    _reply_keys = None
+
+    def strip_next_reply(self, ns, reply_keys):
+        self._reply_namespace = ns
+        self._reply_keys = reply_keys
+
+
+class NamespacedPythonParser(NamespaceParserMixin, PythonParser):
+
+    def read_response(self):
+        reply_keys = self._reply_keys
+        if reply_keys is None:
+            return super(NamespacedPythonParser, self).read_response()
+        self._reply_keys = None
+        self._prefix = encoded_namespace(self._reply_namespace)
+        return self._read_reply(reply_keys)
+
+    def _read_reply(self, reply_keys):
+        response = self._buffer.readline()
+        if not response:
+            raise ConnectionError(SERVER_CLOSED_CONNECTION_ERROR)
+
+        byte, response = byte_to_chr(response[0]), response[1:]
+
+        if byte not in ('-', '+', ':', '$', '*'):
+            raise InvalidResponse("Protocol Error: %s, %s" %
+                                  (str(byte), str(response)))
+
+        if byte == '-':
+            response = nativestr(response)
+            error = self.parse_error(response)
+            if isinstance(error, ConnectionError):
+                raise error
+            return error
+        elif byte == '+':
+            pass
+        elif byte == ':':
+            return long(response)
+        elif byte == '$':
+            length = int(response)
+            if length == -1:
+                return None
+            if reply_keys == 'all':
+                response = self._read_key(length)
+            else:
+                response = self._buffer.read(length)
+        elif byte == '*':
+            length = int(response)
+            if length == -1:
+                return None
+            read = self._read_reply
+            if reply_keys is None:
+                return [read(None) for i in xrange(length)]
+            if reply_keys == 'all':
+                return [read('all') for i in xrange(length)]
+            if reply_keys == 'streams':
+                return [read('first') for i in xrange(length)]
+            key_index = 0 if reply_keys == 'first' else 1
+            return [read('all' if i == key_index else None) for i in xrange(length)]
+        return self.encoder.decode(response)
+
+    def _read_key(self, length):
+        # reads a bulk string, skipping the namespace instead of slicing it off
+        prefix = self._prefix
+        size = len(prefix)
+        buffer = self._buffer
+        if length < size:
+            return buffer.read(length)
+        if length + 2 > buffer.length:
+            buffer._read_from_socket(length + 2 - buffer.length)
+        raw = buffer._buffer
+        raw.seek(buffer.bytes_read)
+        head = raw.read(size)
+        if head == prefix:
+            data = raw.read(length - size)
+        else:
+            data = head + raw.read(length - size)
+        buffer.bytes_read += length + 2
+        if buffer.bytes_read == buffer.bytes_written:
+            buffer.purge()
+        return data
+
+
+class NamespacedHiredisParser(NamespaceParserMixin, HiredisParser):
+
+    def read_response(self):
+        reply_keys = self._reply_keys
+        self._reply_keys = None
+        response = super(NamespacedHiredisParser, self).read_response()
+        if reply_keys is None:
+            return response
+        # hiredis builds replies in C, so strip the finished reply right away
+        return strip_reply(self._reply_namespace, reply_keys, response)
+
+    def read_buffered(self, responses, max_count):
+        # appends the replies already fed to the reader without touching the
+        # socket; only used for pubsub messages, which are never stripped here
+        response, self._next_response = self._next_response, False
+        gets = self._reader.gets
+        if response is False:
+            response = gets()
+        while response is not False:
+            responses.append(response)
+            if len(responses) >= max_count:
+                return
+            response = gets()
+
+
+if HIREDIS_AVAILABLE:
+    DefaultParser = NamespacedHiredisParser
+else:
+    DefaultParser = NamespacedPythonParser
+
+
+class NamespacedConnection(Connection):
+
+    def __init__(self, namespace='', **kwargs):
+        kwargs.setdefault('parser_class', DefaultParser)
+        super(NamespacedConnection, self).__init__(**kwargs)
+        self.namespace = Namespace(
+            namespace or '', self.encoder.encoding, self.encoder.encoding_errors)
+
+    def pack_command(self, *args):
+        ns = self.namespace
+        positions = ()
+        if ns and len(args) > 1:
+            locator = get_key_locator(args[0])
+            if locator is not None:
+                positions = locator(args)
+            else:
+                rewriter = get_rewriter(args[0])
+                if rewriter is not None:
+                    args = rewriter(ns, args)
+
+        command = args[0]
+        if ' ' in command:
+            tokens = tuple(Token.get_token(s) for s in command.split())
+        else:
+            tokens = (Token.get_token(command),)
+        # positions are relative to the unsplit command name
+        offset = len(tokens) - 1
+        args = tokens + args[1:]
+
+        output = []
+        buff = SYM_EMPTY.join((SYM_STAR, str(len(args)).encode(), SYM_CRLF))
+        prefix = ns.encoded
+        prefix_length = len(prefix)
+        buffer_cutoff = self._buffer_cutoff
+        encode = self.encoder.encode
+        for i, arg in enumerate(args):
+            if i - offset in positions and arg and isinstance(arg, _KEY_TYPES):
+                if not isinstance(arg, (bytes, bytearray, memoryview)):
+                    arg = encode(arg)
+                length = str(prefix_length + len(arg)).encode()
+                if len(buff) > buffer_cutoff or len(arg) > buffer_cutoff:
+                    output.append(SYM_EMPTY.join(
+                        (buff, SYM_DOLLAR, length, SYM_CRLF, prefix)))
+                    output.append(arg)
+                    buff = SYM_CRLF
+                else:
+                    buff = SYM_EMPTY.join(
+                        (buff, SYM_DOLLAR, length, SYM_CRLF, prefix, arg, SYM_CRLF))
+                continue
+            arg = encode(arg)
+            if len(buff) > buffer_cutoff or len(arg) > buffer_cutoff:
+                output.append(SYM_EMPTY.join(
+                    (buff, SYM_DOLLAR, str(len(arg)).encode(), SYM_CRLF)))
+                output.append(arg)
+                buff = SYM_CRLF
+            else:
+                buff = SYM_EMPTY.join(
+                    (buff, SYM_DOLLAR, str(len(arg)).encode(), SYM_CRLF, arg, SYM_CRLF))
+        output.append(buff)
+        return output
+
+
+def connection_namespace(connection_pool):
+    connection_class = getattr(connection_pool, 'connection_class', None)
+    if isinstance(connection_class, type) and issubclass(connection_class, NamespacedConnection):
+        return connection_pool.connection_kwargs.get('namespace') or ''
+    return None
+
+
+def make_namespaces(connection_pool, namespace):
+    # returns the namespace used to strip replies and the one used to
+    # rewrite arguments, which is empty when the connection prefixes keys
+    packed_namespace = connection_namespace(connection_pool)
+    if packed_namespace is None:
+        namespace = make_namespace(connection_pool, namespace)
+        return namespace, namespace
+    return make_namespace(connection_pool, packed_namespace), ''
+
+
 class StrictRedis(redis.StrictRedis):
+    read_cache = None
 
     @classmethod
     def from_url(cls, url, db=None, namespace='', **kwargs):
@@ -310,83 +965,808 @@ class StrictRedis(redis.StrictRedis):
         return cls(connection_pool=connection_pool, namespace=namespace)
 
     def __init__(self, namespace='', *args, **kwargs):
+        memoryview_keys = kwargs.pop('memoryview_keys', False)
+        key_cache_size = kwargs.pop('key_cache_size', 0)
+        max_keys_per_command = kwargs.pop('max_keys_per_command', None)
+        command_specs = kwargs.pop('command_specs', False)
+        command_specs_dir = kwargs.pop('command_specs_dir', None)
+        auto_pipeline = kwargs.pop('auto_pipeline', False)
+        auto_pipeline_window = kwargs.pop('auto_pipeline_window', 0.0002)
+        auto_pipeline_batch = kwargs.pop('auto_pipeline_batch', 100)
+        read_cache = kwargs.pop('read_cache', False)
+        read_cache_commands = kwargs.pop('read_cache_commands', None)
+        read_cache_max_entries = kwargs.pop('read_cache_max_entries', 10000)
+        read_cache_max_bytes = kwargs.pop('read_cache_max_bytes', 64 * 1024 * 1024)
+        read_cache_ttl = kwargs.pop('read_cache_ttl', None)
         super(StrictRedis, self).__init__(*args, **kwargs)
-        self._namespace = namespace
+        if not kwargs.get('connection_pool'):
+            self.connection_pool.connection_kwargs.setdefault('parser_class', DefaultParser)
+        self._namespace, self._args_namespace = make_namespaces(
+            self.connection_pool, namespace)
+        self._memoryview_keys = memoryview_keys
+        self._max_keys_per_command = max_keys_per_command
+        if command_specs:
+            load_command_specs(self.connection_pool, command_specs_dir)
+        if key_cache_size and self._args_namespace:
+            self._namespace.key_cache = KeyCache(self._namespace, key_cache_size)
+        self.auto_pipeline = None
+        if auto_pipeline:
+            self.auto_pipeline = AutoPipeline(self, auto_pipeline_window, auto_pipeline_batch)
+        if read_cache:
+            self.read_cache = ReadCache(
+                self.connection_pool.get_encoder(), read_cache_commands,
+                read_cache_max_entries, read_cache_max_bytes, read_cache_ttl)
+
+    @property
+    def key_cache(self):
+        return self._namespace.key_cache
 
     def execute_command(self, *args, **options):
-        args = args_with_namespace(self._namespace, *args)
+        if self.read_cache is not None:
+            return self.read_cache.execute(self._execute_command, args, options)
+        return self._execute_command(*args, **options)
+
+    def _execute_command(self, *args, **options):
+        args = args_with_namespace(self._args_namespace, *args)
+        if self.auto_pipeline is not None and \
+                args[0].upper() not in AUTO_PIPELINE_EXCLUDED:
+            return self.auto_pipeline.execute(args, options)
         return super(StrictRedis, self).execute_command(*args, **options)
 
     def parse_response(self, connection, command_name, **options):
+        ns = self._namespace
+        reply_keys = get_reply_keys(command_name) if ns else None
+        if reply_keys is not None and not self._memoryview_keys:
+            parser = getattr(connection, '_parser', None)
+            if isinstance(parser, NamespaceParserMixin):
+                parser.strip_next_reply(ns, reply_keys)
+                reply_keys = None
         try:
             response = connection.read_response()
         except ResponseError:
             if EMPTY_RESPONSE in options:
                 return options[EMPTY_RESPONSE]
             raise
-        response = response_rm_namespace(self._namespace, command_name, response)
+        if reply_keys is not None:
+            response = strip_reply(ns, reply_keys, response, self._memoryview_keys)
         if command_name in self.response_callbacks:
             return self.response_callbacks[command_name](response, **options)
         return response
 
-    def pipeline(self, transaction=True, shard_hint=None):
+    def pipeline(self, transaction=True, shard_hint=None, auto_flush_commands=None,
+                 auto_flush_bytes=None, result_callback=None, compact=False):
         return Pipeline(
             self.connection_pool,
             self.response_callbacks,
             transaction,
             shard_hint,
-            namespace=self._namespace)
+            namespace=self._namespace,
+            memoryview_keys=self._memoryview_keys,
+            auto_flush_commands=auto_flush_commands,
+            auto_flush_bytes=auto_flush_bytes,
+            result_callback=result_callback,
+            compact=compact,
+            read_cache=self.read_cache)
 
-    def pubsub(self, **kwargs):
+    def pubsub(self, shared=False, **kwargs):
+        if shared:
+            # the hub module builds on this one
+            from .hub import shared_hub
+            namespace = make_namespaces(self.connection_pool, self._namespace)[0]
+            return shared_hub(self.connection_pool).pubsub(namespace, **kwargs)
         return PubSub(self.connection_pool, namespace=self._namespace, **kwargs)
 
-    def sort(self, name, start=None, num=None, by=None, get=None,
-             desc=False, alpha=False, store=None, groups=False):
-        args = [name, by, store]
-        name, by, store = add_namespace(self._namespace, args)
-        if get:
-            if isinstance(get, (basestring, bytes)):
-                get = add_namespace(self._namespace, get)
-            elif isinstance(get, (list, tuple)):
-                get = [add_namespace(self._namespace, i) if i != '#' else i for i in get]
-        return super(StrictRedis, self).sort(
-            name, start, num, by, get, desc, alpha, store, groups)
-
-    def georadius(self, name, longitude, latitude, radius, unit=None,
-                  withdist=False, withcoord=False, withhash=False, count=None,
-                  sort=None, store=None, store_dist=None):
-        args = [name, store, store_dist]
-        name, store, store_dist = add_namespace(self._namespace, args)
-        return super(StrictRedis, self).georadius(
-            name, longitude, latitude, radius, unit, withdist, withcoord, withhash, count,
-            sort, store, store_dist)
-
-    def georadiusbymember(self, name, member, radius, unit=None,
-                          withdist=False, withcoord=False, withhash=False,
-                          count=None, sort=None, store=None, store_dist=None):
-        args = [name, store, store_dist]
-        name, store, store_dist = add_namespace(self._namespace, args)
-        return super(StrictRedis, self).georadiusbymember(
-            name, member, radius, unit, withdist, withcoord, withhash,
-            count, sort, store, store_dist)
+    def stream_consumer(self, streams, group, consumer, **kwargs):
+        return StreamConsumer(self, streams, group, consumer, **kwargs)
+
+    def optimistic_transaction(self, func, *watches, **kwargs):
+        return OptimisticTransaction(self, func, *watches, **kwargs)
+
+    def _execute_prefixed(self, *args, **options):
+        if self.read_cache is not None:
+            return self.read_cache.execute(
+                partial(redis.StrictRedis.execute_command, self), args, options,
+                self._args_namespace)
+        return redis.StrictRedis.execute_command(self, *args, **options)
+
+    def _execute_bulk(self, command_name, args, merge, step=1):
+        size = self._max_keys_per_command
+        if not size or len(args) <= size * step:
+            return self._execute_prefixed(command_name, *args)
+        size *= step
+        with self.pipeline(transaction=False) as pipe:
+            for i in xrange(0, len(args), size):
+                pipe._execute_prefixed(command_name, *args[i:i + size])
+            return merge(pipe.execute())
+
+    def _bulk_keys(self, keys, args=()):
+        numpy = sys.modules.get('numpy')
+        if args or numpy is None or not isinstance(keys, numpy.ndarray):
+            keys = list_or_args(keys, args)
+        return add_namespace_bulk(self._args_namespace, keys)
+
+    def mget(self, keys, *args):
+        keys = self._bulk_keys(keys, args)
+        if not keys:
+            return self._execute_prefixed('MGET', **{EMPTY_RESPONSE: []})
+        return self._execute_bulk('MGET', keys, lambda r: list(chain.from_iterable(r)))
+
+    def mset(self, mapping):
+        keys = add_namespace_bulk(self._args_namespace, list(mapping))
+        items = [None] * (len(keys) * 2)
+        items[0::2] = keys
+        items[1::2] = [mapping[k] for k in mapping]
+        return self._execute_bulk('MSET', items, all, step=2)
+
+    def delete(self, *names):
+        return self._execute_bulk('DEL', self._bulk_names(names), sum)
+
+    def exists(self, *names):
+        return self._execute_bulk('EXISTS', self._bulk_names(names), sum)
+
+    def unlink(self, *names):
+        return self._execute_bulk('UNLINK', self._bulk_names(names), sum)
+
+    def _bulk_names(self, names):
+        numpy = sys.modules.get('numpy')
+        if len(names) == 1 and numpy is not None and isinstance(names[0], numpy.ndarray):
+            names = names[0]
+        return add_namespace_bulk(self._args_namespace, names)
 
 
 Redis = StrictRedis
 
 
+class OptimisticTransaction(object):
+    """
+    WATCH/MULTI/EXEC with bounded, jittered retries.
+
+    ``func`` gets a pipeline watching ``watches`` (prefixed once, up front)
+    and queues the transaction. A conflict is retried after a random delay
+    of up to ``backoff * 2 ** retry`` seconds (capped at ``backoff_cap``),
+    at most ``max_retries`` times. After ``fallback_after`` conflicts in one
+    call, or once the retries run out, ``fallback`` - usually a script from
+    ``register_script`` - is called with the watched keys and
+    ``fallback_args`` instead; without one a ``WatchError`` is raised.
+    """
+
+    def __init__(self, client, func, *watches, **kwargs):
+        self.client = client
+        self.func = func
+        self.keys = list(watches)
+        self.watches = add_namespace_bulk(client._args_namespace, watches)
+        self.shard_hint = kwargs.pop('shard_hint', None)
+        self.value_from_callable = kwargs.pop('value_from_callable', False)
+        self.max_retries = kwargs.pop('max_retries', 10)
+        self.backoff = kwargs.pop('backoff', 0.001)
+        self.backoff_cap = kwargs.pop('backoff_cap', 0.1)
+        self.fallback = kwargs.pop('fallback', None)
+        self.fallback_args = kwargs.pop('fallback_args', ())
+        self.fallback_after = kwargs.pop('fallback_after', None)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments: %s' % ', '.join(kwargs))
+        self.commits = 0
+        self.conflicts = 0
+        self.retries = 0
+        self.fallbacks = 0
+        self.failures = 0
+
+    def __call__(self):
+        return self.execute()
+
+    def execute(self):
+        conflicts = 0
+        while True:
+            with self.client.pipeline(True, self.shard_hint) as pipe:
+                try:
+                    if self.watches:
+                        pipe._execute_prefixed('WATCH', *self.watches)
+                    value = self.func(pipe)
+                    result = pipe.execute()
+                    self.commits += 1
+                    return value if self.value_from_callable else result
+                except WatchError:
+                    self.conflicts += 1
+                    conflicts += 1
+            exhausted = conflicts > self.max_retries
+            if self.fallback is not None and (exhausted or (
+                    self.fallback_after is not None and conflicts >= self.fallback_after)):
+                self.fallbacks += 1
+                return self.fallback(keys=self.keys, args=self.fallback_args, client=self.client)
+            if exhausted:
+                self.failures += 1
+                raise WatchError('Transaction conflicted %d times, giving up' % conflicts)
+            self.retries += 1
+            time.sleep(random.uniform(0, min(self.backoff_cap,
+                                             self.backoff * 2 ** (conflicts - 1))))
+
+
+# commands that block the connection or change its state
+AUTO_PIPELINE_EXCLUDED = {
+    'BLPOP', 'BRPOP', 'BRPOPLPUSH', 'BZPOPMAX', 'BZPOPMIN', 'XREAD', 'XREADGROUP',
+    'WAIT', 'MONITOR', 'SUBSCRIBE', 'PSUBSCRIBE', 'SELECT', 'CLIENT SETNAME',
+    'MULTI', 'EXEC', 'DISCARD', 'WATCH', 'UNWATCH',
+}
+
+
+class _PendingCommand(object):
+    __slots__ = ('args', 'options', 'result', 'error', 'lead', 'done')
+
+    def __init__(self, args, options):
+        self.args = args
+        self.options = options
+        self.result = None
+        self.error = None
+        self.lead = False
+        self.done = threading.Event()
+
+
+class AutoPipeline(object):
+    """
+    Coalesces commands issued concurrently from several threads.
+
+    While another batch is on the wire, the first caller waits up to
+    ``window`` seconds, or until ``max_batch`` commands are queued, then sends
+    the whole queue as one pipelined write on a pooled connection and hands
+    every caller its own reply. Leadership is handed over before the write,
+    so the next batch can gather meanwhile.
+    """
+
+    def __init__(self, client, window=0.0002, max_batch=100):
+        self.client = client
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.commands = 0
+        self._lock = threading.Lock()
+        self._full = threading.Condition(self._lock)
+        self._queue = []
+        self._leading = False
+        self._in_flight = 0
+
+    def execute(self, args, options):
+        command = _PendingCommand(args, options)
+        with self._lock:
+            self._queue.append(command)
+            lead = not self._leading
+            if lead:
+                self._leading = True
+            elif len(self._queue) >= self.max_batch:
+                self._full.notify()
+        if lead:
+            self._lead()
+        command.done.wait()
+        while command.lead:
+            command.lead = False
+            command.done.clear()
+            self._lead()
+            command.done.wait()
+        if command.error is not None:
+            raise command.error
+        return command.result
+
+    def _lead(self):
+        with self._lock:
+            # an idle client sends right away instead of paying the window
+            if self._in_flight and len(self._queue) < self.max_batch:
+                self._full.wait(self.window)
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            if self._queue:
+                successor = self._queue[0]
+                successor.lead = True
+                successor.done.set()
+            else:
+                self._leading = False
+            self.batches += 1
+            self.commands += len(batch)
+            self._in_flight += 1
+        try:
+            self._send(batch)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _send(self, batch):
+        client = self.client
+        pool = client.connection_pool
+        connection = None
+        i = 0
+        retried = False
+        try:
+            connection = pool.get_connection(batch[0].args[0])
+            packed = connection.pack_commands([command.args for command in batch])
+            while True:
+                try:
+                    connection.send_packed_command(packed)
+                    for i, command in enumerate(batch):
+                        try:
+                            command.result = client.parse_response(
+                                connection, command.args[0], **command.options)
+                        except ResponseError as e:
+                            command.error = e
+                    i = len(batch)
+                    break
+                except (ConnectionError, TimeoutError) as e:
+                    # retried once like StrictRedis.execute_command, unless
+                    # some replies were read already
+                    connection.disconnect()
+                    if retried or i or (isinstance(e, TimeoutError) and
+                                        not connection.retry_on_timeout):
+                        raise
+                    retried = True
+        except Exception as e:
+            # nobody else would wake up the callers still waiting
+            if connection is not None:
+                connection.disconnect()
+            for command in batch[i:]:
+                command.error = e
+        finally:
+            if connection is not None:
+                pool.release(connection)
+            for command in batch:
+                command.done.set()
+
+
+READ_CACHE_COMMANDS = frozenset((
+    'GET', 'MGET', 'HGET', 'HMGET', 'HGETALL', 'EXISTS', 'STRLEN', 'GETRANGE',
+    'SMEMBERS', 'SISMEMBER', 'ZSCORE', 'LRANGE', 'ZRANGE'))
+# never invalidate anything
+READ_ONLY_COMMANDS = READ_CACHE_COMMANDS | frozenset((
+    'BITCOUNT', 'BITPOS', 'DUMP', 'GETBIT', 'HEXISTS', 'HKEYS', 'HLEN', 'HSCAN',
+    'HSTRLEN', 'HVALS', 'KEYS', 'LINDEX', 'LLEN', 'OBJECT', 'PFCOUNT', 'PTTL',
+    'RANDOMKEY', 'SCAN', 'SCARD', 'SDIFF', 'SINTER', 'SRANDMEMBER', 'SSCAN', 'SUNION',
+    'TTL', 'TYPE', 'XLEN', 'XRANGE', 'XREVRANGE', 'ZCARD', 'ZCOUNT', 'ZLEXCOUNT',
+    'ZRANGEBYLEX', 'ZRANGEBYSCORE', 'ZRANK', 'ZREVRANGE', 'ZREVRANGEBYLEX',
+    'ZREVRANGEBYSCORE', 'ZREVRANK', 'ZSCAN'))
+# writes to keys that can't be located
+READ_CACHE_CLEARING_COMMANDS = frozenset(('FLUSHDB', 'FLUSHALL', 'SWAPDB'))
+_MISSING = object()
+
+
+def _reply_size(value):
+    if isinstance(value, (bytes, unicode)):
+        return len(value) + 40
+    elif isinstance(value, dict):
+        return sum(_reply_size(k) + _reply_size(v) for k, v in iteritems(value)) + 64
+    elif isinstance(value, (list, tuple, set)):
+        return sum(_reply_size(v) for v in value) + 64
+    return 24
+
+
+class ReadCache(object):
+    """
+    In-process cache of the replies to ``commands``, for one client.
+
+    Holds at most ``max_entries`` replies and ``max_bytes`` (estimated);
+    the least recently used go first. Replies older than ``ttl`` seconds are
+    dropped when read. Entries are invalidated by the keys of every other
+    command sent through the client or its pipelines, and by keyspace
+    notifications once ``listen()`` runs; without it, writes by other
+    clients and keys expiring on the server go unnoticed until ``ttl``.
+    ``hit_ratio``, ``evictions``, ``expirations``, ``invalidations`` and the
+    age of the replies served (``max_hit_age``, ``mean_hit_age``) tell how
+    well it does.
+    """
+
+    def __init__(self, encoder, commands=None, max_entries=10000, max_bytes=64 * 1024 * 1024,
+                 ttl=None):
+        self.encoder = encoder
+        self.commands = frozenset(c.upper() for c in (commands or READ_CACHE_COMMANDS))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.max_hit_age = 0.0
+        self.total_hit_age = 0.0
+        self.bytes = 0
+        # entry key -> (reply, keys, size, stored at); ordered by last use
+        self._entries = OrderedDict()
+        self._by_key = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    @property
+    def mean_hit_age(self):
+        return self.total_hit_age / self.hits if self.hits else 0.0
+
+    def execute(self, execute_command, args, options, prefix=''):
+        # prefix: the namespace args already carry
+        name = args[0].upper()
+        if name not in self.commands:
+            if name in READ_ONLY_COMMANDS:
+                return execute_command(*args, **options)
+            # before, and after in case a concurrent read cached the old value
+            self.invalidate_command(args, prefix)
+            try:
+                return execute_command(*args, **options)
+            finally:
+                self.invalidate_command(args, prefix)
+        encode = self.encoder.encode
+        try:
+            entry_key = (name,) + tuple(encode(arg) for arg in args[1:])
+            if options:
+                entry_key += tuple(sorted(iteritems(options)))
+            hash(entry_key)
+        except (TypeError, DataError):
+            return execute_command(*args, **options)
+        reply = self._get(entry_key)
+        if reply is not _MISSING:
+            return reply
+        version = self._version
+        reply = execute_command(*args, **options)
+        self._put(entry_key, self._keys(args, prefix), reply, version)
+        return _copy_reply(reply)
+
+    def _keys(self, args, prefix=''):
+        locator = get_key_locator(args[0])
+        if locator is not None:
+            encode = self.encoder.encode
+            return [rm_namespace(prefix, encode(args[i])) for i in locator(args)]
+        if args[0].upper() in READ_CACHE_CLEARING_COMMANDS:
+            return None
+        # known commands without keys leave the cache alone, any other
+        # command may write keys we can't locate
+        if COMMANDS.get(args[0].lower()) == []:
+            return []
+        return None
+
+    def _get(self, entry_key):
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                self.misses += 1
+                return _MISSING
+            age = time.time() - entry[3]
+            if self.ttl is not None and age >= self.ttl:
+                self._remove(entry_key)
+                self.expirations += 1
+                self.misses += 1
+                return _MISSING
+            # most recently used last
+            del self._entries[entry_key]
+            self._entries[entry_key] = entry
+            self.hits += 1
+            self.total_hit_age += age
+            if age > self.max_hit_age:
+                self.max_hit_age = age
+            return _copy_reply(entry[0])
+
+    def _put(self, entry_key, keys, reply, version):
+        size = _reply_size(reply) + _reply_size(entry_key)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if version != self._version:
+                # invalidated while we were reading, the reply may be stale
+                return
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            self._entries[entry_key] = (reply, keys, size, time.time())
+            self.bytes += size
+            for key in keys:
+                self._by_key.setdefault(key, set()).add(entry_key)
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_key):
+        reply, keys, size, stored = self._entries.pop(entry_key)
+        self.bytes -= size
+        for key in keys:
+            entry_keys = self._by_key.get(key)
+            if entry_keys is not None:
+                entry_keys.discard(entry_key)
+                if not entry_keys:
+                    del self._by_key[key]
+
+    def invalidate_command(self, args, prefix=''):
+        if args[0].upper() in READ_ONLY_COMMANDS:
+            return
+        keys = self._keys(args, prefix)
+        if keys is None:
+            self.clear()
+        elif keys:
+            self.invalidate(keys)
+
+    def invalidate(self, keys):
+        encode = self.encoder.encode
+        with self._lock:
+            self._version += 1
+            for key in keys:
+                for entry_key in list(self._by_key.get(encode(key), ())):
+                    self._remove(entry_key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._by_key.clear()
+            self.bytes = 0
+
+    def handle_notification(self, message):
+        self.invalidate([message['key']])
+
+    def listen(self, client, sleep_time=0.01):
+        # keyspace notifications of the client's namespace invalidate the
+        # cache from a background thread; the server needs
+        # notify-keyspace-events with at least K and the event classes
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe_keyspace(handler=self.handle_notification)
+        # notifications sent while disconnected are lost
+        pubsub.connection.register_connect_callback(lambda connection: self.clear())
+        return pubsub.run_in_thread(sleep_time, daemon=True)
+
+
+def _copy_reply(reply):
+    # callers may modify what they get back
+    if isinstance(reply, (list, dict, set)):
+        return copy.copy(reply)
+    return reply
+
+
+class HandlerDispatcher(object):
+    """
+    Runs pubsub message handlers on an executor.
+
+    Messages of one channel are handled one at a time and in order; other
+    channels are handled in parallel. ``pending`` is the number of messages
+    submitted but not handled yet, ``max_pending`` its high-water mark.
+    Exceptions raised by handlers are counted in ``errors``.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.submitted = 0
+        self.completed = 0
+        self.errors = 0
+        self.max_pending = 0
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self.submitted - self.completed
+
+    def channel_depths(self):
+        # messages waiting or running, per channel
+        with self._lock:
+            return dict((channel, len(queue) + 1) for channel, queue in iteritems(self._queues))
+
+    def dispatch(self, channel, handler, message):
+        with self._lock:
+            self.submitted += 1
+            self.max_pending = max(self.max_pending, self.submitted - self.completed)
+            queue = self._queues.get(channel)
+            if queue is not None:
+                # the channel is busy, _run picks it up in order
+                queue.append((handler, message))
+                return
+            self._queues[channel] = deque()
+        self._submit(channel, handler, message)
+
+    def _submit(self, channel, handler, message):
+        try:
+            self.executor.submit(self._run, channel, handler, message)
+        except Exception:
+            with self._lock:
+                # nothing will run the channel's messages, drop them so
+                # the channel isn't left busy
+                queue = self._queues.pop(channel, ())
+                self.submitted -= len(queue) + 1
+            raise
+
+    def _run(self, channel, handler, message):
+        try:
+            handler(message)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+        with self._lock:
+            self.completed += 1
+            queue = self._queues[channel]
+            if not queue:
+                del self._queues[channel]
+                return
+            handler, message = queue.popleft()
+        # resubmitted rather than looped so a busy channel can't hog a worker
+        self._submit(channel, handler, message)
+
+
+def _strip_prefix(prefix, value):
+    # what follows prefix (a Namespace) in value, None when it doesn't match
+    if isinstance(value, bytes):
+        prefix = prefix.encoded
+    if value.startswith(prefix):
+        return value[len(prefix):]
+    return None
+
+
+_SUBSCRIBE_REPLY_TYPES = frozenset((b'subscribe', b'psubscribe', 'subscribe', 'psubscribe'))
+
+
 class PubSub(_PubSub):
+    resubscribe_chunk_size = 1000
+
     def __init__(self, connection_pool, shard_hint=None,
-                 ignore_subscribe_messages=False, namespace=''):
+                 ignore_subscribe_messages=False, namespace='', executor=None,
+                 dispatch_workers=None):
         super(PubSub, self).__init__(
             connection_pool, shard_hint, ignore_subscribe_messages)
-        self._namespace = namespace
+        self._namespace, self._args_namespace = make_namespaces(
+            connection_pool, namespace)
+        self._dispatch_workers = dispatch_workers
+        self._own_executor = executor is None and dispatch_workers is not None
+        if self._own_executor:
+            executor = self._make_executor()
+        self.dispatcher = HandlerDispatcher(executor) if executor is not None else None
+
+    def _make_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(self._dispatch_workers)
+
+    def close(self):
+        super(PubSub, self).close()
+        if self._own_executor:
+            # queued handlers still run; the new executor starts no threads
+            # until the pubsub is used again, e.g. run_in_thread() after stop()
+            self.dispatcher.executor.shutdown(wait=False)
+            self.dispatcher.executor = self._make_executor()
+
+    def reset(self):
+        super(PubSub, self).reset()
+        # normalized name -> encoded name as sent, reused when resubscribing
+        self._prefixed_channels = {}
+        self._prefixed_patterns = {}
+        # keyspace/keyevent channel or pattern -> (prefix, handler)
+        self._notifications = {}
+
+    def psubscribe_keyspace(self, pattern='*', handler=None):
+        # __keyspace@<db>__:<namespace><pattern>, the key is in the channel
+        prefix = self._notification_prefix('__keyspace@%s__:%s' % (
+            self._notification_db(), self._namespace))
+        self._subscribe_notifications('PSUBSCRIBE', [prefix + pattern], prefix, handler)
+
+    def punsubscribe_keyspace(self, pattern='*'):
+        self._unsubscribe_notifications('PUNSUBSCRIBE', [
+            '__keyspace@%s__:%s%s' % (self._notification_db(), self._namespace, pattern)])
+
+    def subscribe_keyevent(self, *events, **kwargs):
+        # __keyevent@<db>__:<event>, the key is in the data and keys of other
+        # namespaces are dropped
+        handler = kwargs.pop('handler', None)
+        if kwargs:
+            raise TypeError('unexpected keyword arguments %r' % sorted(kwargs))
+        prefix = self._notification_prefix('__keyevent@%s__:' % self._notification_db())
+        self._subscribe_notifications(
+            'SUBSCRIBE', [prefix + event for event in events or ('*',)], prefix, handler)
+
+    def unsubscribe_keyevent(self, *events):
+        prefix = '__keyevent@%s__:' % self._notification_db()
+        self._unsubscribe_notifications('UNSUBSCRIBE', [prefix + e for e in events or ('*',)])
+
+    def _notification_db(self):
+        if self._namespace and not self._args_namespace:
+            raise RedisError('keyspace notifications need the namespace on the client, '
+                             'not on the connection')
+        return self.connection_pool.connection_kwargs.get('db') or 0
+
+    def _notification_prefix(self, prefix):
+        encoder = self.encoder
+        return Namespace(prefix, encoder.encoding, encoder.encoding_errors)
+
+    def _subscribe_notifications(self, command, names, prefix, handler):
+        if command == 'PSUBSCRIBE':
+            subscribed, cache = self.patterns, self._prefixed_patterns
+        else:
+            subscribed, cache = self.channels, self._prefixed_channels
+        encode, decode = self.encoder.encode, self.encoder.decode
+        names = [decode(encode(name)) for name in names]
+        for name in names:
+            self._notifications[name] = (prefix, handler)
+        # notification names are not namespaced, so skip the rewrite
+        super(PubSub, self).execute_command(command, *names)
+        for name in names:
+            subscribed[name] = handler
+            cache[name] = encode(name)
+
+    def _unsubscribe_notifications(self, command, names):
+        encode, decode = self.encoder.encode, self.encoder.decode
+        names = [decode(encode(name)) for name in names]
+        for name in names:
+            self._notifications.pop(name, None)
+        super(PubSub, self).execute_command(command, *names)
+        self._cache_prefixed(command, names, names)
+
+    def _handle_notification(self, message_type, response, notification):
+        prefix, handler = notification
+        if message_type == 'pmessage':
+            pattern, channel, event = response[1:]
+            key = _strip_prefix(prefix, channel)
+        else:
+            pattern, channel, key = None, response[1], response[2]
+            event = _strip_prefix(prefix, channel)
+            if self._namespace:
+                key = _strip_prefix(self._namespace, key)
+                if key is None:
+                    return None
+        message = {'type': 'keyspace' if message_type == 'pmessage' else 'keyevent',
+                   'pattern': pattern, 'channel': channel, 'data': response[-1],
+                   'key': key, 'event': event}
+        if handler is None:
+            return message
+        if self.dispatcher is not None:
+            self.dispatcher.dispatch(key, handler, message)
+        else:
+            handler(message)
+        return None
+
+    def get_key_events(self, max_count=1000, timeout=0):
+        # (key, event) pairs of one batched read, other messages are dropped
+        return [(m['key'], m['event']) for m in self.get_messages(max_count, timeout, True)
+                if m['type'] in ('keyspace', 'keyevent')]
 
     def execute_command(self, *args, **kwargs):
-        args = args_with_namespace(self._namespace, *args)
-        return super(PubSub, self).execute_command(*args, **kwargs)
+        prefixed = args_with_namespace(self._args_namespace, *args)
+        command = args[0]
+        if command in ('SUBSCRIBE', 'PSUBSCRIBE', 'UNSUBSCRIBE', 'PUNSUBSCRIBE'):
+            self._cache_prefixed(command, args[1:], prefixed[1:])
+        return super(PubSub, self).execute_command(*prefixed, **kwargs)
+
+    def _cache_prefixed(self, command, names, prefixed):
+        if command.startswith('P'):
+            cache = self._prefixed_patterns
+        else:
+            cache = self._prefixed_channels
+        encode, decode = self.encoder.encode, self.encoder.decode
+        if command.endswith('UNSUBSCRIBE'):
+            if not names:
+                cache.clear()
+            for name in names:
+                cache.pop(decode(encode(name)), None)
+        else:
+            for name, full in zip(names, prefixed):
+                cache[decode(encode(name))] = encode(full)
+
+    def on_connect(self, connection):
+        # one write of chunked SUBSCRIBE/PSUBSCRIBE commands, with the names
+        # prefixed when they were first subscribed
+        chunk_size = self.resubscribe_chunk_size
+        commands = []
+        for command, subscribed, cache in (
+                ('SUBSCRIBE', self.channels, self._prefixed_channels),
+                ('PSUBSCRIBE', self.patterns, self._prefixed_patterns)):
+            names = []
+            for name in subscribed:
+                full = cache.get(name)
+                if full is None:
+                    full = cache[name] = self.encoder.encode(
+                        add_namespace(self._args_namespace, name))
+                names.append(full)
+            for i in xrange(0, len(names), chunk_size):
+                commands.append([command] + names[i:i + chunk_size])
+        if commands:
+            connection.send_packed_command(connection.pack_commands(commands))
 
     def handle_message(self, response, ignore_subscribe_messages=False):
         message_type = nativestr(response[0])
+        if message_type in ('subscribe', 'psubscribe') and \
+                (ignore_subscribe_messages or self.ignore_subscribe_messages):
+            return None
         if message_type == 'pmessage':
             response[1] = rm_namespace(self._namespace, response[1])  # pattern
             response[2] = rm_namespace(self._namespace, response[2])  # channel
@@ -394,17 +1774,436 @@ class PubSub(_PubSub):
             pass
         else:
             response[1] = rm_namespace(self._namespace, response[1])  # channel
+        return self._handle_stripped(response, ignore_subscribe_messages)
+
+    def _handle_stripped(self, response, ignore_subscribe_messages=False):
+        if self._notifications:
+            message_type = nativestr(response[0])
+            if message_type in self.PUBLISH_MESSAGE_TYPES:
+                notification = self._notifications.get(response[1])
+                if notification is not None:
+                    return self._handle_notification(message_type, response, notification)
+        if self.dispatcher is not None:
+            message_type = nativestr(response[0])
+            if message_type == 'pmessage':
+                handler = self.patterns.get(response[1])
+                if handler is not None:
+                    self.dispatcher.dispatch(response[2], handler, {
+                        'type': message_type, 'pattern': response[1],
+                        'channel': response[2], 'data': response[3]})
+                    return None
+            elif message_type == 'message':
+                handler = self.channels.get(response[1])
+                if handler is not None:
+                    self.dispatcher.dispatch(response[1], handler, {
+                        'type': message_type, 'pattern': None,
+                        'channel': response[1], 'data': response[2]})
+                    return None
         return super(PubSub, self).handle_message(response, ignore_subscribe_messages)
 
+    def get_messages(self, max_count=1000, timeout=0, ignore_subscribe_messages=False):
+        response = self.parse_response(block=False, timeout=timeout)
+        if response is None:
+            return []
+        responses = [response]
+        connection = self.connection
+        read_buffered = getattr(getattr(connection, '_parser', None), 'read_buffered', None)
+        # whatever is already buffered or waiting on the socket, without blocking
+        while len(responses) < max_count:
+            if read_buffered is not None:
+                read_buffered(responses, max_count)
+                if len(responses) >= max_count:
+                    break
+            if not connection.can_read(timeout=0):
+                break
+            responses.append(self._execute(connection, connection.read_response))
+        return self.handle_messages(responses, ignore_subscribe_messages)
+
+    def handle_messages(self, responses, ignore_subscribe_messages=False):
+        if ignore_subscribe_messages or self.ignore_subscribe_messages:
+            # a resubscribe floods us with confirmations nobody reads
+            responses = [r for r in responses if r[0] not in _SUBSCRIBE_REPLY_TYPES]
+        # channels and patterns sit between the type and the data
+        names = []
+        for response in responses:
+            names.extend(response[1:-1])
+        if self._namespace:
+            rm_namespace_list(self._namespace, names)
+        handle_message = self._handle_stripped
+        channels = self.channels
+        notifications = self._notifications
+        messages = []
+        i = 0
+        for response in responses:
+            message_type = nativestr(response[0])
+            if message_type == 'message':
+                channel = names[i]
+                i += 1
+                if channels.get(channel) is None and channel not in notifications:
+                    messages.append({'type': message_type, 'pattern': None,
+                                     'channel': channel, 'data': response[2]})
+                    continue
+                response[1] = channel
+            else:
+                size = len(response) - 2
+                response[1:-1] = names[i:i + size]
+                i += size
+            message = handle_message(response, ignore_subscribe_messages)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+
+def _command_size(args):
+    # rough size of the packed command, only used for auto flushing
+    size = 16
+    for arg in args:
+        if isinstance(arg, (bytes, bytearray, memoryview, unicode)):
+            size += len(arg) + 16
+        else:
+            size += 32
+    return size
+
+
+def _skip_packed_commands(packed, pos, count):
+    # offset of the end of the count RESP commands packed from pos on
+    for _ in xrange(count):
+        end = packed.index(b'\r\n', pos)
+        nargs = int(packed[pos + 1:end])
+        pos = end + 2
+        for _ in xrange(nargs):
+            end = packed.index(b'\r\n', pos)
+            pos = end + 2 + int(packed[pos + 1:end]) + 2
+    return pos
+
+
+_NO_OPTIONS = {}
+
+
+class _CompactStack(object):
+    # (args, options) view of a compact stack for the stock executors;
+    # only the command names are kept
+    def __init__(self, names, name_indices, options):
+        self.names = names
+        self.name_indices = name_indices
+        self.options = options
+
+    def __len__(self):
+        return len(self.name_indices)
+
+    def __getitem__(self, i):
+        return (self.names[self.name_indices[i]],), self.options.get(i, _NO_OPTIONS)
+
+    def __iter__(self):
+        names, options = self.names, self.options
+        for i, name_index in enumerate(self.name_indices):
+            yield (names[name_index],), options.get(i, _NO_OPTIONS)
+
+
+class _PackedStackConnection(object):
+    # hands the already packed stack to the stock executors instead of
+    # packing the commands again
+    def __init__(self, connection, packed):
+        self._connection = connection
+        self._packed = packed
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def pack_commands(self, commands):
+        if commands and commands[0] == ('MULTI',):
+            return (self._connection.pack_command('MULTI') + [self._packed] +
+                    self._connection.pack_command('EXEC'))
+        return [self._packed]
+
 
 class Pipeline(_Pipeline, StrictRedis):
+    compact = False
+    _cache_writes = ()
 
     def __init__(self, connection_pool, response_callbacks, transaction,
-                 shard_hint, namespace=''):
+                 shard_hint, namespace='', memoryview_keys=False,
+                 auto_flush_commands=None, auto_flush_bytes=None, result_callback=None,
+                 compact=False, read_cache=None):
         super(Pipeline, self).__init__(
             connection_pool, response_callbacks, transaction, shard_hint)
-        self._namespace = namespace
+        self.read_cache = read_cache
+        self._namespace, self._args_namespace = make_namespaces(
+            connection_pool, namespace)
+        self._memoryview_keys = memoryview_keys
+        self._max_keys_per_command = None
+        self.auto_flush_commands = auto_flush_commands
+        self.auto_flush_bytes = auto_flush_bytes
+        self.result_callback = result_callback
+        if compact:
+            self.compact = True
+            # never connected, only used to pack commands like the pool's connections
+            self._packer = connection_pool.connection_class(**connection_pool.connection_kwargs)
+            self._command_names = []
+            self._name_table = {}
+            self._reset_compact()
+
+    def __len__(self):
+        if self.compact:
+            return len(self._name_indices)
+        return len(self.command_stack)
+
+    def _reset_compact(self):
+        self._packed = bytearray()
+        self._name_indices = array(str('H'))
+        self._compact_options = {}
+
+    def reset(self):
+        # again once the writes are done, a concurrent read may have cached
+        # the old values meanwhile
+        for args, prefix in self._cache_writes:
+            self.read_cache.invalidate_command(args, prefix)
+        self._cache_writes = []
+        super(Pipeline, self).reset()
+        self._stack_bytes = 0
+        self._flushed_count = 0
+        self._flushed_results = []
+        self._flushed_error = None
+        self._deferred = []
+        self._exec_reply_keys = None
+        if self.compact:
+            self._reset_compact()
+
+    def multi(self):
+        if self.compact and len(self):
+            raise RedisError('Commands without an initial WATCH have already '
+                             'been issued')
+        return super(Pipeline, self).multi()
 
     def execute_command(self, *args, **kwargs):
-        args = args_with_namespace(self._namespace, *args)
-        return super(Pipeline, self).execute_command(*args, **kwargs)
+        if self.read_cache is not None:
+            self.read_cache.invalidate_command(args)
+            self._cache_writes.append((args, ''))
+        if (self.watching or args[0] == 'WATCH') and not self.explicit_transaction:
+            args = args_with_namespace(self._args_namespace, *args)
+            return self.immediate_execute_command(*args, **kwargs)
+        if self.compact:
+            args = args_with_namespace(self._args_namespace, *args)
+        elif self._args_namespace:
+            # queued as is and rewritten together with the rest of the stack
+            self._deferred.append(len(self.command_stack))
+        return self.pipeline_execute_command(*args, **kwargs)
+
+    def _rewrite_stack(self):
+        deferred = self._deferred
+        if not deferred:
+            return
+        self._deferred = []
+        ns = self._args_namespace
+        stack = self.command_stack
+        # key positions of every command, prefixed with one bulk call
+        positions = []
+        keys = []
+        rewritten = {}
+        for i in deferred:
+            args = stack[i][0]
+            if len(args) < 2:
+                continue
+            locator = get_key_locator(args[0])
+            if locator is not None:
+                for position in locator(args):
+                    positions.append((i, position))
+                    keys.append(args[position])
+            else:
+                rewriter = get_rewriter(args[0])
+                if rewriter is not None:
+                    rewritten[i] = rewriter(ns, args)
+        if keys:
+            for (i, position), key in zip(positions, add_namespace_bulk(ns, keys)):
+                args = rewritten.get(i)
+                if args is None:
+                    args = rewritten[i] = list(stack[i][0])
+                args[position] = key
+        for i, args in rewritten.items():
+            stack[i] = (tuple(args), stack[i][1])
+
+    def _execute_prefixed(self, *args, **options):
+        if self.read_cache is not None:
+            self.read_cache.invalidate_command(args, self._args_namespace)
+            self._cache_writes.append((args, self._args_namespace))
+        return _Pipeline.execute_command(self, *args, **options)
+
+    def parse_response(self, connection, command_name, **options):
+        result = StrictRedis.parse_response(self, connection, command_name, **options)
+        # only the EXEC reply of a transaction is a list
+        if self._exec_reply_keys is not None and isinstance(result, list):
+            result = strip_replies(self._namespace, self._exec_reply_keys, result,
+                                   self._memoryview_keys)
+        if command_name in self.UNWATCH_COMMANDS:
+            self.watching = False
+        elif command_name == 'WATCH':
+            self.watching = True
+        return result
+
+    def pipeline_execute_command(self, *args, **options):
+        if self.compact:
+            self._pack(args, options)
+        else:
+            self.command_stack.append((args, options))
+        if self.auto_flush_commands or self.auto_flush_bytes:
+            if self.compact:
+                self._stack_bytes = len(self._packed)
+            elif self.auto_flush_bytes:
+                self._stack_bytes += _command_size(args)
+            # a transaction started with multi() has to go out in one piece
+            if not self.explicit_transaction and (
+                    (self.auto_flush_commands and len(self) >= self.auto_flush_commands) or
+                    (self.auto_flush_bytes and self._stack_bytes >= self.auto_flush_bytes)):
+                self.flush()
+        return self
+
+    def _pack(self, args, options):
+        name = args[0]
+        name_index = self._name_table.get(name)
+        if name_index is None:
+            name_index = self._name_table[name] = len(self._command_names)
+            self._command_names.append(name)
+        i = len(self._name_indices)
+        self._name_indices.append(name_index)
+        if options:
+            self._compact_options[i] = options
+        # transactions don't send commands that have an EMPTY_RESPONSE
+        if EMPTY_RESPONSE not in options or not (self.transaction or self.explicit_transaction):
+            for chunk in self._packer.pack_command(*args):
+                self._packed.extend(chunk)
+
+    def _stack(self):
+        if self.compact:
+            return _CompactStack(self._command_names, self._name_indices, self._compact_options)
+        return self.command_stack
+
+    def _execute_stack(self, raise_on_error):
+        if not self.compact:
+            return super(Pipeline, self).execute(raise_on_error)
+        commands = self._stack()
+        if not commands:
+            return []
+        if self.scripts:
+            self.load_scripts()
+        if self.transaction or self.explicit_transaction:
+            execute = self._execute_transaction
+        else:
+            execute = self._execute_pipeline
+        conn = self.connection
+        if not conn:
+            conn = self.connection_pool.get_connection('MULTI', self.shard_hint)
+            self.connection = conn
+        packed_conn = _PackedStackConnection(conn, self._packed)
+        # same retry rules as Pipeline.execute
+        try:
+            return execute(packed_conn, commands, raise_on_error)
+        except (ConnectionError, TimeoutError) as e:
+            conn.disconnect()
+            if not conn.retry_on_timeout and isinstance(e, TimeoutError):
+                raise
+            if self.watching:
+                raise WatchError("A ConnectionError occured on while watching "
+                                 "one or more keys")
+            return execute(packed_conn, commands, raise_on_error)
+        finally:
+            self.reset()
+
+    def _execute_transaction(self, connection, commands, raise_on_error):
+        if self._namespace:
+            self._exec_reply_keys = [get_reply_keys(args[0]) for args, options in commands
+                                     if EMPTY_RESPONSE not in options]
+        try:
+            return super(Pipeline, self)._execute_transaction(
+                connection, commands, raise_on_error)
+        finally:
+            self._exec_reply_keys = None
+
+    def _execute_batch(self):
+        self._rewrite_stack()
+        offset, flushed, error = self._flushed_count, self._flushed_results, self._flushed_error
+        commands = self._stack()
+        # resets the pipeline, so the flush state is restored afterwards
+        response = self._execute_stack(raise_on_error=False)
+        for i, r in enumerate(response):
+            if isinstance(r, ResponseError):
+                self.annotate_exception(r, offset + i + 1, commands[i][0])
+                if error is None:
+                    error = r
+        if self.result_callback is not None:
+            if response:
+                self.result_callback(response)
+        else:
+            flushed.extend(response)
+        return offset + len(response), flushed, error
+
+    def flush(self):
+        if len(self):
+            self._flushed_count, self._flushed_results, self._flushed_error = \
+                self._execute_batch()
+
+    def execute(self, raise_on_error=True):
+        self._rewrite_stack()
+        if not self._flushed_count and self.result_callback is None:
+            return self._execute_stack(raise_on_error)
+        _, response, error = self._execute_batch()
+        self.reset()
+        if raise_on_error and error is not None:
+            raise error
+        return response
+
+    def execute_iter(self, raise_on_error=True, chunk_size=1000):
+        offset = self._flushed_count
+        for i, r in enumerate(self._flushed_results):
+            if raise_on_error and isinstance(r, ResponseError):
+                self.reset()
+                raise r
+            yield i, r
+        self._rewrite_stack()
+        if self.transaction or self.explicit_transaction:
+            # EXEC returns every reply at once
+            for i, r in enumerate(self._execute_stack(raise_on_error)):
+                yield offset + i, r
+            return
+        stack = self._stack()
+        if not stack:
+            self.reset()
+            return
+        if self.scripts:
+            self.load_scripts()
+        conn = self.connection
+        if not conn:
+            conn = self.connection_pool.get_connection('MULTI', self.shard_hint)
+            self.connection = conn
+        sent = 0
+        # end of the sent part of a compact stack
+        sent_bytes = 0
+        try:
+            for i in xrange(len(stack)):
+                # keep the next chunk on the wire while this one is read
+                while sent < len(stack) and sent <= i + chunk_size:
+                    count = min(chunk_size, len(stack) - sent)
+                    if self.compact:
+                        end = _skip_packed_commands(self._packed, sent_bytes, count)
+                        conn.send_packed_command([self._packed[sent_bytes:end]])
+                        sent_bytes = end
+                    else:
+                        conn.send_packed_command(conn.pack_commands(
+                            [args for args, _ in stack[sent:sent + count]]))
+                    sent += count
+                args, options = stack[i]
+                if not self.compact:
+                    stack[i] = None
+                try:
+                    r = self.parse_response(conn, args[0], **options)
+                except ResponseError as e:
+                    self.annotate_exception(e, offset + i + 1, args)
+                    if raise_on_error:
+                        raise
+                    r = e
+                yield offset + i, r
+            stack = None
+        finally:
+            if stack is not None:
+                # replies left unread on the socket
+                conn.disconnect()
+            self.reset()
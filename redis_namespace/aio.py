@@ -0,0 +1,617 @@
+"""
+asyncio client for namespaced keys (Python 3.6+).
+
+Commands are rewritten and replies stripped with the same tables as the
+synchronous client; connections speak RESP over asyncio streams.
+"""
+import asyncio
+
+import redis
+from redis.client import EMPTY_RESPONSE, list_or_args
+from redis.connection import BaseParser, Connection as _Packer, SERVER_CLOSED_CONNECTION_ERROR
+from redis.exceptions import (ConnectionError, ExecAbortError, InvalidResponse, RedisError,
+                              ResponseError, TimeoutError, WatchError)
+from redis.utils import HIREDIS_AVAILABLE
+from redis._compat import nativestr
+
+from . import (args_with_namespace, get_reply_keys, make_namespace, rm_namespace,
+               strip_reply, strip_replies)
+
+if HIREDIS_AVAILABLE:
+    import hiredis
+
+
+class Connection(object):
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None,
+                 socket_timeout=None, socket_connect_timeout=None,
+                 encoding='utf-8', encoding_errors='strict', decode_responses=False,
+                 socket_read_size=65536):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.socket_timeout = socket_timeout
+        self.socket_connect_timeout = socket_connect_timeout or socket_timeout
+        self.socket_read_size = socket_read_size
+        # never connected, only packs commands
+        self._packer = _Packer(encoding=encoding, encoding_errors=encoding_errors,
+                               decode_responses=decode_responses)
+        self.encoder = self._packer.encoder
+        self._errors = BaseParser()
+        self._reader = None
+        self._writer = None
+        self._hiredis = None
+
+    def __repr__(self):
+        return '%s<host=%s,port=%s,db=%s>' % (
+            type(self).__name__, self.host, self.port, self.db)
+
+    @property
+    def is_connected(self):
+        return self._writer is not None
+
+    async def connect(self):
+        if self._writer is not None:
+            return
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port),
+                self.socket_connect_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError('Timeout connecting to server')
+        except OSError as e:
+            raise ConnectionError('Error connecting to %s:%s. %s.' % (
+                self.host, self.port, e))
+        if HIREDIS_AVAILABLE:
+            kwargs = {'protocolError': InvalidResponse,
+                      'replyError': self._errors.parse_error}
+            if self.encoder.decode_responses:
+                kwargs['encoding'] = self.encoder.encoding
+            self._hiredis = hiredis.Reader(**kwargs)
+        try:
+            if self.password:
+                await self.execute('AUTH', self.password)
+            if self.db:
+                await self.execute('SELECT', self.db)
+        except Exception:
+            self.disconnect()
+            raise
+
+    def disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = self._hiredis = None
+
+    def pack_commands(self, commands):
+        return self._packer.pack_commands(commands)
+
+    def send_packed_command(self, chunks):
+        if self._writer is None:
+            raise ConnectionError(SERVER_CLOSED_CONNECTION_ERROR)
+        self._writer.writelines(chunks)
+
+    async def execute(self, *args):
+        self.send_packed_command(self._packer.pack_command(*args))
+        return await self.read_response()
+
+    async def read_response(self):
+        if self._reader is None:
+            raise ConnectionError(SERVER_CLOSED_CONNECTION_ERROR)
+        read = self._read_hiredis() if self._hiredis is not None else self._read()
+        try:
+            response = await asyncio.wait_for(read, self.socket_timeout)
+        except asyncio.TimeoutError:
+            self.disconnect()
+            raise TimeoutError('Timeout reading from socket')
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.disconnect()
+            raise ConnectionError('Error while reading from socket: %s' % (e,))
+        if isinstance(response, ConnectionError):
+            self.disconnect()
+            raise response
+        if isinstance(response, ResponseError):
+            raise response
+        return response
+
+    async def _read_hiredis(self):
+        response = self._hiredis.gets()
+        while response is False:
+            data = await self._reader.read(self.socket_read_size)
+            if not data:
+                raise ConnectionError(SERVER_CLOSED_CONNECTION_ERROR)
+            self._hiredis.feed(data)
+            response = self._hiredis.gets()
+        return response
+
+    async def _read(self):
+        line = await self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError(SERVER_CLOSED_CONNECTION_ERROR)
+        byte, response = line[:1], line[1:-2]
+        if byte == b'-':
+            return self._errors.parse_error(response.decode('utf-8', 'replace'))
+        elif byte == b'+':
+            pass
+        elif byte == b':':
+            return int(response)
+        elif byte == b'$':
+            length = int(response)
+            if length == -1:
+                return None
+            response = (await self._reader.readexactly(length + 2))[:-2]
+        elif byte == b'*':
+            length = int(response)
+            if length == -1:
+                return None
+            return [await self._read() for i in range(length)]
+        else:
+            raise InvalidResponse('Protocol Error: %r' % line)
+        return self.encoder.decode(response)
+
+
+class ConnectionPool(object):
+
+    def __init__(self, connection_class=Connection, max_connections=None,
+                 **connection_kwargs):
+        self.connection_class = connection_class
+        self.connection_kwargs = connection_kwargs
+        self.max_connections = max_connections
+        self._available = []
+        self._in_use = set()
+        self._semaphore = None
+
+    def __repr__(self):
+        return '%s<%s>' % (type(self).__name__,
+                           self.connection_class(**self.connection_kwargs))
+
+    def get_encoder(self):
+        return self.connection_class(**self.connection_kwargs).encoder
+
+    async def get_connection(self):
+        if self.max_connections:
+            # created lazily so it binds to the running loop
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.max_connections)
+            await self._semaphore.acquire()
+        try:
+            if self._available:
+                connection = self._available.pop()
+            else:
+                connection = self.connection_class(**self.connection_kwargs)
+            await connection.connect()
+        except Exception:
+            if self._semaphore is not None:
+                self._semaphore.release()
+            raise
+        self._in_use.add(connection)
+        return connection
+
+    def release(self, connection):
+        self._in_use.discard(connection)
+        if connection.is_connected:
+            self._available.append(connection)
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def disconnect(self):
+        for connection in self._available + list(self._in_use):
+            connection.disconnect()
+        self._available = []
+
+
+class StrictRedis(redis.StrictRedis):
+    """
+    asyncio counterpart of ``redis_namespace.StrictRedis``.
+
+    The command methods are redis-py's, so every plain command returns an
+    awaitable. Helpers that post-process replies synchronously (``scan_iter``,
+    ``lock``, ``transaction``, ``pubsub``...) are not supported.
+    """
+
+    def __init__(self, namespace='', host='localhost', port=6379, db=0, password=None,
+                 socket_timeout=None, socket_connect_timeout=None,
+                 connection_pool=None, encoding='utf-8', encoding_errors='strict',
+                 decode_responses=False, max_connections=None):
+        if connection_pool is None:
+            connection_pool = ConnectionPool(
+                host=host, port=port, db=db, password=password,
+                socket_timeout=socket_timeout,
+                socket_connect_timeout=socket_connect_timeout,
+                encoding=encoding, encoding_errors=encoding_errors,
+                decode_responses=decode_responses, max_connections=max_connections)
+        self.connection_pool = connection_pool
+        self.response_callbacks = self.__class__.RESPONSE_CALLBACKS.copy()
+        self._namespace = make_namespace(connection_pool, namespace)
+
+    def __repr__(self):
+        return '%s<%s>' % (type(self).__name__, repr(self.connection_pool))
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return Pipeline(self.connection_pool, self.response_callbacks, transaction,
+                        namespace=self._namespace)
+
+    def pubsub(self, **kwargs):
+        return PubSub(self.connection_pool, namespace=self._namespace, **kwargs)
+
+    async def execute_command(self, *args, **options):
+        args = args_with_namespace(self._namespace, *args)
+        pool = self.connection_pool
+        connection = await pool.get_connection()
+        try:
+            try:
+                connection.send_packed_command(connection.pack_commands([args]))
+                return await self.parse_response(connection, args[0], **options)
+            except (ConnectionError, TimeoutError) as e:
+                connection.disconnect()
+                if isinstance(e, TimeoutError):
+                    raise
+                await connection.connect()
+                connection.send_packed_command(connection.pack_commands([args]))
+                return await self.parse_response(connection, args[0], **options)
+        except ResponseError:
+            raise
+        except BaseException:
+            # cancelled or failed with the reply maybe unread, so the next
+            # user of the connection would get it
+            connection.disconnect()
+            raise
+        finally:
+            pool.release(connection)
+
+    async def parse_response(self, connection, command_name, **options):
+        try:
+            response = await connection.read_response()
+        except ResponseError:
+            if EMPTY_RESPONSE in options:
+                return options[EMPTY_RESPONSE]
+            raise
+        return self._callback(command_name, response, options)
+
+    def _callback(self, command_name, response, options):
+        if self._namespace and response:
+            response = strip_reply(self._namespace, get_reply_keys(command_name), response)
+        if command_name in self.response_callbacks:
+            return self.response_callbacks[command_name](response, **options)
+        return response
+
+
+Redis = StrictRedis
+
+
+class Pipeline(StrictRedis):
+    """
+    Queues commands and sends them in one write on ``await execute()``.
+
+    After ``await watch(...)`` commands run immediately (await them) until
+    ``multi()``, like redis-py's pipelines.
+    """
+
+    def __init__(self, connection_pool, response_callbacks, transaction,
+                 namespace=''):
+        self.connection_pool = connection_pool
+        self.response_callbacks = response_callbacks
+        self.transaction = transaction
+        self._namespace = make_namespace(connection_pool, namespace)
+        self.connection = None
+        self.watching = False
+        self.reset()
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.reset_async()
+
+    def reset(self):
+        self.command_stack = []
+        self.explicit_transaction = False
+        if self.connection is not None:
+            if self.watching:
+                # UNWATCH can't be awaited here, so drop the connection
+                self.connection.disconnect()
+            self.connection_pool.release(self.connection)
+            self.connection = None
+        self.watching = False
+
+    async def reset_async(self):
+        if self.watching and self.connection is not None:
+            try:
+                await self.connection.execute('UNWATCH')
+                self.watching = False
+            except ConnectionError:
+                pass
+        self.reset()
+
+    def multi(self):
+        if self.explicit_transaction:
+            raise RedisError('Cannot issue nested calls to MULTI')
+        if self.command_stack:
+            raise RedisError('Commands without an initial WATCH have already '
+                             'been issued')
+        self.explicit_transaction = True
+
+    def execute_command(self, *args, **options):
+        args = args_with_namespace(self._namespace, *args)
+        if (self.watching or args[0] == 'WATCH') and not self.explicit_transaction:
+            return self._immediate_execute_command(*args, **options)
+        self.command_stack.append((args, options))
+        return self
+
+    async def _immediate_execute_command(self, *args, **options):
+        if self.connection is None:
+            self.connection = await self.connection_pool.get_connection()
+        connection = self.connection
+        try:
+            connection.send_packed_command(connection.pack_commands([args]))
+            response = await self.parse_response(connection, args[0], **options)
+        except ResponseError:
+            raise
+        except BaseException:
+            # including cancellation, the reply may still be on the wire
+            connection.disconnect()
+            self.watching = False
+            raise
+        if args[0] == 'WATCH':
+            self.watching = True
+        elif args[0] in ('UNWATCH', 'DISCARD', 'EXEC'):
+            self.watching = False
+        return response
+
+    async def watch(self, *names):
+        if self.explicit_transaction:
+            raise RedisError('Cannot issue a WATCH after a MULTI')
+        return await self.execute_command('WATCH', *names)
+
+    async def unwatch(self):
+        return self.watching and await self.execute_command('UNWATCH') or True
+
+    async def execute(self, raise_on_error=True):
+        stack = self.command_stack
+        if not stack:
+            return []
+        if self.connection is None:
+            self.connection = await self.connection_pool.get_connection()
+        connection = self.connection
+        try:
+            if self.transaction or self.explicit_transaction:
+                return await self._execute_transaction(connection, stack, raise_on_error)
+            return await self._execute_pipeline(connection, stack, raise_on_error)
+        except (ResponseError, WatchError):
+            raise
+        except (ConnectionError, TimeoutError):
+            connection.disconnect()
+            if self.watching:
+                raise WatchError('A ConnectionError occured on while watching '
+                                 'one or more keys')
+            raise
+        except BaseException:
+            # including cancellation, replies may still be on the wire
+            connection.disconnect()
+            raise
+        finally:
+            self.watching = False
+            self.reset()
+
+    async def _execute_pipeline(self, connection, commands, raise_on_error):
+        connection.send_packed_command(
+            connection.pack_commands([args for args, _ in commands]))
+        response = []
+        for args, options in commands:
+            try:
+                response.append(await self.parse_response(connection, args[0], **options))
+            except ResponseError as e:
+                response.append(e)
+        if raise_on_error:
+            self._raise_first_error(response)
+        return response
+
+    async def _execute_transaction(self, connection, commands, raise_on_error):
+        sent = [(args, options) for args, options in commands
+                if EMPTY_RESPONSE not in options]
+        connection.send_packed_command(connection.pack_commands(
+            [('MULTI',)] + [args for args, _ in sent] + [('EXEC',)]))
+        errors = []
+        try:
+            await connection.read_response()
+        except ResponseError as e:
+            errors.append(e)
+        for i in range(len(sent)):
+            try:
+                await connection.read_response()
+            except ResponseError as e:
+                errors.append(e)
+        try:
+            response = await connection.read_response()
+        except ExecAbortError:
+            if errors:
+                raise errors[0]
+            raise
+        if response is None:
+            raise WatchError('Watched variable changed.')
+        if self._namespace:
+            response = strip_replies(self._namespace,
+                                     [get_reply_keys(args[0]) for args, _ in sent], response)
+        replies = iter(response)
+        data = []
+        for args, options in commands:
+            if EMPTY_RESPONSE in options:
+                data.append(options[EMPTY_RESPONSE])
+                continue
+            r = next(replies)
+            if not isinstance(r, Exception) and args[0] in self.response_callbacks:
+                r = self.response_callbacks[args[0]](r, **options)
+            data.append(r)
+        if raise_on_error:
+            self._raise_first_error(data)
+        return data
+
+    def _raise_first_error(self, response):
+        for r in response:
+            if isinstance(r, ResponseError):
+                raise r
+
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+_CLOSED = object()
+
+
+class PubSub(object):
+    """
+    Subscriber whose messages are read by a background task into a queue of
+    at most ``max_queue_size`` messages.
+
+    When the queue is full, ``overflow='block'`` stops reading the socket
+    (the server buffers, up to its client-output-buffer-limit), while
+    ``'drop_oldest'`` and ``'drop_newest'`` keep reading and count the
+    discarded messages in ``dropped``.
+    """
+    SUBSCRIBE_MESSAGE_TYPES = ('subscribe', 'psubscribe', 'unsubscribe', 'punsubscribe')
+
+    def __init__(self, connection_pool, namespace='', ignore_subscribe_messages=False,
+                 max_queue_size=1000, overflow='block'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of %s' % ', '.join(OVERFLOW_POLICIES))
+        self.connection_pool = connection_pool
+        self._namespace = make_namespace(connection_pool, namespace)
+        self.ignore_subscribe_messages = ignore_subscribe_messages
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.connection = None
+        self.channels = set()
+        self.patterns = set()
+        self.received = 0
+        self.dropped = 0
+        self._queue = None
+        self._reader = None
+        self._error = None
+
+    @property
+    def subscribed(self):
+        return bool(self.channels or self.patterns)
+
+    def qsize(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def subscribe(self, *args):
+        channels = list_or_args(args[0], args[1:]) if args else []
+        await self._execute('SUBSCRIBE', *channels)
+        self.channels.update(channels)
+
+    async def psubscribe(self, *args):
+        patterns = list_or_args(args[0], args[1:]) if args else []
+        await self._execute('PSUBSCRIBE', *patterns)
+        self.patterns.update(patterns)
+
+    async def unsubscribe(self, *args):
+        channels = list_or_args(args[0], args[1:]) if args else []
+        await self._execute('UNSUBSCRIBE', *channels)
+        self.channels.difference_update(channels or self.channels)
+
+    async def punsubscribe(self, *args):
+        patterns = list_or_args(args[0], args[1:]) if args else []
+        await self._execute('PUNSUBSCRIBE', *patterns)
+        self.patterns.difference_update(patterns or self.patterns)
+
+    async def _execute(self, *args):
+        if self.connection is None:
+            self.connection = await self.connection_pool.get_connection()
+            self._queue = asyncio.Queue(self.max_queue_size)
+            self._reader = asyncio.ensure_future(self._read_loop())
+        args = args_with_namespace(self._namespace, *args)
+        self.connection.send_packed_command(self.connection.pack_commands([args]))
+
+    async def _read_loop(self):
+        while True:
+            try:
+                response = await self.connection.read_response()
+            except (ConnectionError, TimeoutError) as e:
+                try:
+                    await self._reconnect()
+                except (ConnectionError, TimeoutError):
+                    self._error = e
+                    self._close_queue()
+                    return
+                continue
+            message = self.handle_message(response)
+            if message is not None:
+                self.received += 1
+                await self._put(message)
+
+    async def _reconnect(self):
+        self.connection.disconnect()
+        await self.connection.connect()
+        if self.channels:
+            await self._execute('SUBSCRIBE', *self.channels)
+        if self.patterns:
+            await self._execute('PSUBSCRIBE', *self.patterns)
+
+    async def _put(self, message):
+        queue = self._queue
+        if self.overflow == 'block':
+            await queue.put(message)
+        elif queue.full():
+            self.dropped += 1
+            if self.overflow == 'drop_oldest':
+                queue.get_nowait()
+                queue.put_nowait(message)
+        else:
+            queue.put_nowait(message)
+
+    def _close_queue(self):
+        # wakes up the consumers even if the queue is full
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_CLOSED)
+
+    def handle_message(self, response):
+        ns = self._namespace
+        message_type = nativestr(response[0])
+        if message_type == 'pmessage':
+            message = {'type': message_type, 'pattern': rm_namespace(ns, response[1]),
+                       'channel': rm_namespace(ns, response[2]), 'data': response[3]}
+        else:
+            message = {'type': message_type, 'pattern': None,
+                       'channel': rm_namespace(ns, response[1]), 'data': response[2]}
+        if message_type in self.SUBSCRIBE_MESSAGE_TYPES and self.ignore_subscribe_messages:
+            return None
+        return message
+
+    async def get_message(self, timeout=None):
+        if self._queue is None:
+            return None
+        try:
+            message = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if message is _CLOSED:
+            # leave it for the other consumers
+            self._queue.put_nowait(_CLOSED)
+            if self._error is not None:
+                raise self._error
+            return None
+        return message
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.get_message()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self.connection is not None:
+            self.connection.disconnect()
+            self.connection_pool.release(self.connection)
+            self.connection = None
+            self._close_queue()
+        self.channels = set()
+        self.patterns = set()
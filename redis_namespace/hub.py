@@ -0,0 +1,422 @@
+"""
+Pubsub for many namespaces over a few shared subscriber connections.
+
+    hub = SubscriberHub(host='localhost', connections=2)
+    tenant = hub.pubsub('tenant1:')
+    tenant.subscribe('orders')
+    hub.run_in_thread()
+    tenant.get_message(timeout=1)
+"""
+from __future__ import unicode_literals
+import threading
+import time
+import zlib
+from collections import deque
+from itertools import chain
+from select import select
+
+from redis.client import list_or_args
+from redis.connection import ConnectionPool
+from redis.exceptions import ConnectionError, TimeoutError
+from redis._compat import iteritems, itervalues
+
+from . import PubSub, add_namespace, connection_namespace, make_namespace, rm_namespace
+
+
+class SubscriberHub(object):
+    """
+    Shares ``connections`` subscriber connections between the handles
+    returned by ``pubsub(namespace)``.
+
+    Every prefixed channel or pattern is subscribed once on the server, on
+    the connection picked by hashing its name, and unsubscribed when its
+    last handle leaves. Messages are routed by their prefixed name, which
+    stays unambiguous when namespaces nest, and the names each handle
+    subscribed with are remembered so channels are never stripped again.
+    """
+
+    def __init__(self, connection_pool=None, connections=1, batch_size=1000, **kwargs):
+        if connection_pool is None:
+            connection_pool = ConnectionPool(**kwargs)
+        if connection_namespace(connection_pool):
+            raise ValueError('SubscriberHub needs a connection pool without a namespace')
+        self.connection_pool = connection_pool
+        self.encoder = connection_pool.get_encoder()
+        self.batch_size = batch_size
+        self.routed = 0
+        self.deliveries = 0
+        self._pubsubs = [PubSub(connection_pool, ignore_subscribe_messages=True)
+                         for _ in range(connections)]
+        # prefixed name -> {handle: name used by the handle}, replaced on
+        # every change so the reader never needs the lock
+        self._channels = {}
+        self._patterns = {}
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._thread = None
+        # set when the reader thread gave up, raised to the handles
+        self.error = None
+
+    def __repr__(self):
+        return '%s<%s>' % (type(self).__name__, self.connection_pool)
+
+    def pubsub(self, namespace='', ignore_subscribe_messages=False):
+        return HubPubSub(self, namespace, ignore_subscribe_messages)
+
+    @property
+    def server_subscriptions(self):
+        return len(self._channels) + len(self._patterns)
+
+    @property
+    def listeners(self):
+        return sum(len(handles) for handles in chain(
+            itervalues(self._channels), itervalues(self._patterns)))
+
+    def _normalize(self, name):
+        return self.encoder.decode(self.encoder.encode(name))
+
+    def _pubsub_for(self, name):
+        return self._pubsubs[zlib.crc32(self.encoder.encode(name)) % len(self._pubsubs)]
+
+    def _add(self, handle, pattern, names):
+        routes = self._patterns if pattern else self._channels
+        new = []
+        with self._lock:
+            for name, full in names:
+                handles = routes.get(full)
+                if handles is None:
+                    new.append(full)
+                    handles = {}
+                handles = dict(handles)
+                handles[handle] = name
+                routes[full] = handles
+            self._send('psubscribe' if pattern else 'subscribe', new)
+
+    def _remove(self, handle, pattern, names):
+        routes = self._patterns if pattern else self._channels
+        gone = []
+        with self._lock:
+            for full in names:
+                handles = routes.get(full)
+                if handles is None or handle not in handles:
+                    continue
+                handles = dict(handles)
+                del handles[handle]
+                if handles:
+                    routes[full] = handles
+                else:
+                    del routes[full]
+                    gone.append(full)
+            self._send('punsubscribe' if pattern else 'unsubscribe', gone)
+
+    def _send(self, command, names):
+        groups = {}
+        for name in names:
+            groups.setdefault(self._pubsub_for(name), []).append(name)
+        for pubsub, group in iteritems(groups):
+            if pubsub.connection is None:
+                # the first command connects, keep the reader off the
+                # connection until the connect and SELECT replies are read
+                with self._poll_lock:
+                    getattr(pubsub, command)(*group)
+            else:
+                getattr(pubsub, command)(*group)
+
+    def poll(self, timeout=0):
+        # reads and routes what the connections have buffered; waits up to
+        # timeout when there is nothing
+        with self._poll_lock:
+            routed = self._read()
+            if not routed and timeout:
+                socks = [p.connection._sock for p in self._pubsubs
+                         if p.connection is not None and p.connection._sock is not None]
+                if socks:
+                    select(socks, [], [], timeout)
+                    routed = self._read()
+                else:
+                    time.sleep(timeout)
+            return routed
+
+    def _read(self):
+        routed = 0
+        for pubsub in self._pubsubs:
+            if pubsub.connection is not None:
+                messages = pubsub.get_messages(self.batch_size)
+                if messages:
+                    routed += self._route(messages)
+        self.routed += routed
+        return routed
+
+    def _route(self, messages):
+        channels, patterns = self._channels, self._patterns
+        routed = deliveries = 0
+        for message in messages:
+            if message['type'] == 'pmessage':
+                handles = patterns.get(message['pattern'])
+            else:
+                handles = channels.get(message['channel'])
+            if not handles:
+                continue
+            # handles subscribed under the same name share one message
+            local = {}
+            for handle, name in iteritems(handles):
+                shared = local.get(name)
+                if shared is None:
+                    if message['type'] == 'pmessage':
+                        shared = {'type': 'pmessage', 'pattern': name,
+                                  'channel': rm_namespace(handle.namespace, message['channel']),
+                                  'data': message['data']}
+                    else:
+                        shared = {'type': 'message', 'pattern': None, 'channel': name,
+                                  'data': message['data']}
+                    local[name] = shared
+                handle._deliver(shared)
+            routed += 1
+            deliveries += len(handles)
+        self.deliveries += deliveries
+        return routed
+
+    def reconnect(self):
+        # the pubsubs resubscribe from on_connect
+        with self._poll_lock:
+            for pubsub in self._pubsubs:
+                if pubsub.connection is not None:
+                    pubsub.connection.disconnect()
+                    pubsub.connection.connect()
+
+    def _fail(self, error):
+        self.error = error
+        _forget(self)
+        handles = set()
+        for routes in (self._channels, self._patterns):
+            for route in itervalues(routes):
+                handles.update(route)
+        for handle in handles:
+            with handle._ready:
+                handle._ready.notify_all()
+
+    def run_in_thread(self, sleep_time=0.1, daemon=True):
+        if self._thread is None:
+            self._thread = HubWorkerThread(self, sleep_time, daemon=daemon)
+            self._thread.start()
+        return self._thread
+
+    def close(self):
+        _forget(self)
+        if self._thread is not None:
+            self._thread.stop()
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._channels = {}
+            self._patterns = {}
+        for pubsub in self._pubsubs:
+            pubsub.close()
+
+
+_shared_hubs = {}
+_shared_hubs_lock = threading.Lock()
+
+
+def _forget(hub):
+    with _shared_hubs_lock:
+        for key, shared in list(iteritems(_shared_hubs)):
+            if shared is hub:
+                del _shared_hubs[key]
+
+
+def shared_hub(connection_pool):
+    """
+    Returns the process-wide hub, reading in a daemon thread, for the
+    server ``connection_pool`` connects to. The pool's namespace, if any,
+    is left to the handles.
+    """
+    connection_class = connection_pool.connection_class
+    kwargs = dict(connection_pool.connection_kwargs)
+    kwargs.pop('namespace', None)
+    key = (connection_class, repr(sorted(iteritems(kwargs))))
+    with _shared_hubs_lock:
+        hub = _shared_hubs.get(key)
+        if hub is None:
+            hub = SubscriberHub(ConnectionPool(connection_class, **kwargs))
+            hub.run_in_thread()
+            _shared_hubs[key] = hub
+        return hub
+
+
+class HubWorkerThread(threading.Thread):
+    """
+    Polls a hub until stopped. Connection errors are retried with an
+    exponential backoff, reconnecting and resubscribing; after
+    ``max_retries`` failures in a row the hub is failed and its handles
+    raise the error. Any other error fails the hub straight away.
+    """
+    max_retries = 10
+    retry_interval = 0.05
+    max_retry_interval = 2.0
+
+    def __init__(self, hub, sleep_time, daemon=True):
+        super(HubWorkerThread, self).__init__()
+        self.daemon = daemon
+        self.hub = hub
+        self.sleep_time = sleep_time
+        self._running = threading.Event()
+        self._running.set()
+
+    def run(self):
+        failures = 0
+        while self._running.is_set():
+            try:
+                if failures:
+                    self.hub.reconnect()
+                self.hub.poll(self.sleep_time)
+                failures = 0
+            except (ConnectionError, TimeoutError) as error:
+                failures += 1
+                if failures > self.max_retries:
+                    self.hub._fail(error)
+                    return
+                time.sleep(min(self.retry_interval * 2 ** (failures - 1),
+                               self.max_retry_interval))
+            except Exception as error:
+                self.hub._fail(error)
+                return
+
+    def stop(self):
+        self._running.clear()
+
+
+class HubPubSub(object):
+    """
+    PubSub-like handle on a ``SubscriberHub``: channels and patterns are
+    prefixed with ``namespace`` and messages carry the names the handle
+    subscribed with. Subscribe and unsubscribe confirmations are generated
+    locally.
+    """
+    PUBLISH_MESSAGE_TYPES = ('message', 'pmessage')
+
+    def __init__(self, hub, namespace='', ignore_subscribe_messages=False):
+        self.hub = hub
+        self.namespace = make_namespace(hub.connection_pool, namespace)
+        self.ignore_subscribe_messages = ignore_subscribe_messages
+        self.channels = {}
+        self.patterns = {}
+        self._messages = deque()
+        self._ready = threading.Condition(threading.Lock())
+
+    def __repr__(self):
+        return '%s<namespace=%s>' % (type(self).__name__, self.namespace)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def subscribed(self):
+        return bool(self.channels or self.patterns)
+
+    def subscribe(self, *args, **kwargs):
+        self._subscribe(False, args, kwargs)
+
+    def psubscribe(self, *args, **kwargs):
+        self._subscribe(True, args, kwargs)
+
+    def unsubscribe(self, *args):
+        self._unsubscribe(False, args)
+
+    def punsubscribe(self, *args):
+        self._unsubscribe(True, args)
+
+    def _subscribe(self, pattern, args, kwargs):
+        if args:
+            args = list_or_args(args[0], args[1:])
+        new = dict.fromkeys(args)
+        new.update(kwargs)
+        subscribed = self.patterns if pattern else self.channels
+        names = []
+        for name, handler in iteritems(new):
+            name = self.hub._normalize(name)
+            subscribed[name] = handler
+            names.append((name, self.hub._normalize(add_namespace(self.namespace, name))))
+        self.hub._add(self, pattern, names)
+        self._confirm('psubscribe' if pattern else 'subscribe', [name for name, _ in names])
+
+    def _unsubscribe(self, pattern, args):
+        subscribed = self.patterns if pattern else self.channels
+        if args:
+            names = [self.hub._normalize(name) for name in list_or_args(args[0], args[1:])]
+        else:
+            names = list(subscribed)
+        names = [name for name in names if name in subscribed]
+        for name in names:
+            del subscribed[name]
+        self.hub._remove(self, pattern, [
+            self.hub._normalize(add_namespace(self.namespace, name)) for name in names])
+        self._confirm('punsubscribe' if pattern else 'unsubscribe', names)
+
+    def _confirm(self, message_type, names):
+        if self.ignore_subscribe_messages:
+            return
+        count = len(self.channels) + len(self.patterns)
+        for name in names:
+            self._put({'type': message_type, 'pattern': None, 'channel': name, 'data': count})
+
+    def _deliver(self, message):
+        if message['type'] == 'pmessage':
+            handler = self.patterns.get(message['pattern'])
+        else:
+            handler = self.channels.get(message['channel'])
+        if handler is not None:
+            handler(message)
+        else:
+            self._put(message)
+
+    def _put(self, message):
+        with self._ready:
+            self._messages.append(message)
+            self._ready.notify()
+
+    def _wait(self, timeout):
+        hub = self.hub
+        if hub.error is not None:
+            raise hub.error
+        if hub._thread is None and hub._poll_lock.acquire(False):
+            # nobody is reading, read for everyone
+            hub._poll_lock.release()
+            hub.poll(timeout)
+            return
+        with self._ready:
+            if not self._messages:
+                self._ready.wait(timeout)
+        if hub.error is not None and not self._messages:
+            raise hub.error
+
+    def get_message(self, ignore_subscribe_messages=False, timeout=0):
+        messages = self.get_messages(1, timeout, ignore_subscribe_messages)
+        return messages[0] if messages else None
+
+    def get_messages(self, max_count=1000, timeout=0, ignore_subscribe_messages=False):
+        if not self._messages:
+            self._wait(timeout)
+        messages = []
+        popleft = self._messages.popleft
+        while self._messages and len(messages) < max_count:
+            message = popleft()
+            if ignore_subscribe_messages and \
+                    message['type'] not in self.PUBLISH_MESSAGE_TYPES:
+                continue
+            messages.append(message)
+        return messages
+
+    def listen(self):
+        while self.subscribed or self._messages:
+            for message in self.get_messages(timeout=1):
+                yield message
+
+    def close(self):
+        self.punsubscribe()
+        self.unsubscribe()
+        with self._ready:
+            self._messages.clear()
@@ -0,0 +1,130 @@
+from __future__ import unicode_literals
+import time
+
+from redis.exceptions import ResponseError
+from redis._compat import basestring, bytes
+
+
+class StreamConsumer(object):
+    """
+    Reads one or more streams as a member of a consumer group.
+
+    Messages are fetched ``count`` at a time with XREADGROUP and returned as
+    ``(stream, message_id, fields)`` tuples. Acks are buffered and sent
+    ``ack_batch_size`` at a time through one non-transactional pipeline.
+    When ``claim_min_idle_time`` (milliseconds) is set, entries left pending
+    that long by other consumers are claimed before new ones are read.
+    """
+
+    def __init__(self, client, streams, group, consumer, count=100, block=None,
+                 ack_batch_size=None, claim_min_idle_time=None, claim_interval=None,
+                 create_group=True):
+        if isinstance(streams, (basestring, bytes)):
+            streams = [streams]
+        self.client = client
+        self.streams = list(streams)
+        self.group = group
+        self.consumer = consumer
+        self.count = count
+        self.block = block
+        self.ack_batch_size = ack_batch_size or count
+        self.claim_min_idle_time = claim_min_idle_time
+        if claim_interval is None and claim_min_idle_time is not None:
+            claim_interval = claim_min_idle_time / 1000.0
+        self.claim_interval = claim_interval
+        self._next_claim = 0
+        self._acks = {}
+        self._ack_count = 0
+        if create_group:
+            self.create_group()
+
+    def create_group(self, id='0'):
+        for stream in self.streams:
+            try:
+                self.client.xgroup_create(stream, self.group, id, mkstream=True)
+            except ResponseError as e:
+                if not str(e).startswith('BUSYGROUP'):
+                    raise
+
+    def read(self, count=None):
+        count = count or self.count
+        messages = []
+        if self.claim_min_idle_time is not None and time.time() >= self._next_claim:
+            self._next_claim = time.time() + self.claim_interval
+            messages = self.claim_stale(count)
+        if len(messages) < count:
+            # don't block when there is already something to hand out
+            block = None if messages else self.block
+            response = self.client.xreadgroup(
+                self.group, self.consumer, dict.fromkeys(self.streams, '>'),
+                count=count - len(messages), block=block)
+            for stream, entries in response or ():
+                messages.extend((stream, message_id, fields) for message_id, fields in entries)
+        return messages
+
+    def claim_stale(self, count=None):
+        count = count or self.count
+        claimed = []
+        for stream in self.streams:
+            pending = self.client.xpending_range(stream, self.group, count=count)
+            message_ids = [p['message_id'] for p in pending
+                           if p['time_since_delivered'] >= self.claim_min_idle_time]
+            if not message_ids:
+                continue
+            message_ids = self.client.xclaim(
+                stream, self.group, self.consumer, self.claim_min_idle_time,
+                message_ids, justid=True)
+            if not message_ids:
+                continue
+            # XCLAIM without JUSTID chokes on entries trimmed from the stream,
+            # so fetch the claimed ones in one round trip instead
+            with self.client.pipeline(transaction=False) as pipe:
+                for message_id in message_ids:
+                    pipe.xrange(stream, message_id, message_id)
+                entries = pipe.execute()
+            for message_id, entry in zip(message_ids, entries):
+                if entry:
+                    claimed.append((stream, message_id, entry[0][1]))
+                else:
+                    self.ack(stream, message_id)
+            if len(claimed) >= count:
+                break
+        return claimed
+
+    def ack(self, stream, *message_ids):
+        self._acks.setdefault(stream, []).extend(message_ids)
+        self._ack_count += len(message_ids)
+        if self._ack_count >= self.ack_batch_size:
+            return self.flush_acks()
+        return 0
+
+    def flush_acks(self):
+        if not self._acks:
+            return 0
+        acks, self._acks, self._ack_count = self._acks, {}, 0
+        with self.client.pipeline(transaction=False) as pipe:
+            for stream, message_ids in acks.items():
+                pipe.xack(stream, self.group, *message_ids)
+            return sum(pipe.execute())
+
+    def close(self):
+        return self.flush_acks()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        # messages are acked once the next one is requested
+        while True:
+            messages = self.read()
+            if len(messages) < self.count:
+                # caught up, don't hold acks while waiting for more
+                self.flush_acks()
+            if not messages and self.block is None:
+                return
+            for stream, message_id, fields in messages:
+                yield stream, message_id, fields
+                self.ack(stream, message_id)
@@ -1,3 +1,5 @@
+import sys
+
 import pytest
 #  import redis
 import redis_namespace as redis
@@ -7,6 +9,10 @@ from distutils.version import StrictVersion
 
 
 NS = u'ns:'
+
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.append('test_aio.py')
 _REDIS_VERSIONS = {}
 
 
@@ -0,0 +1,104 @@
+from __future__ import unicode_literals
+import socket
+import threading
+
+from redis._compat import long, unicode
+
+
+class SimpleString(object):
+    def __init__(self, value):
+        self.value = value
+
+
+OK = SimpleString('OK')
+
+
+def encode_reply(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    elif isinstance(reply, SimpleString):
+        return b'+' + reply.value.encode('utf-8') + b'\r\n'
+    elif isinstance(reply, Exception):
+        return b'-' + unicode(reply).encode('utf-8') + b'\r\n'
+    elif isinstance(reply, (int, long)):
+        return b':' + unicode(reply).encode('utf-8') + b'\r\n'
+    elif isinstance(reply, (list, tuple)):
+        return b'*' + unicode(len(reply)).encode('utf-8') + b'\r\n' + \
+            b''.join(encode_reply(r) for r in reply)
+    if isinstance(reply, unicode):
+        reply = reply.encode('utf-8')
+    return b'$' + unicode(len(reply)).encode('utf-8') + b'\r\n' + reply + b'\r\n'
+
+
+class FakeRedisServer(object):
+    """
+    Minimal RESP server running in a background thread.
+
+    ``replies`` maps an upper-cased command name to a reply or to a callable
+    taking the command arguments; other commands are answered with +OK.
+    Every received command is recorded in ``commands``.
+    """
+
+    def __init__(self, replies=None):
+        self.replies = replies or {}
+        self.commands = []
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(16)
+        self.port = self._sock.getsockname()[1]
+        self._clients = []
+        self._thread = threading.Thread(target=self._accept)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._sock.close()
+        for client in self._clients:
+            try:
+                client.close()
+            except socket.error:
+                pass
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except (socket.error, OSError):
+                return
+            self._clients.append(client)
+            thread = threading.Thread(target=self._serve, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, client):
+        reader = client.makefile('rb')
+        try:
+            while True:
+                command = self._read_command(reader)
+                if command is None:
+                    return
+                self.commands.append(command)
+                reply = self.replies.get(command[0].decode('utf-8').upper(), OK)
+                if callable(reply):
+                    reply = reply(command[1:])
+                client.sendall(encode_reply(reply))
+        except (socket.error, OSError, ValueError):
+            return
+
+    def _read_command(self, reader):
+        line = reader.readline()
+        if not line:
+            return None
+        count = int(line[1:])
+        command = []
+        for _ in range(count):
+            length = int(reader.readline()[1:])
+            command.append(reader.read(length + 2)[:-2])
+        return command
@@ -0,0 +1,303 @@
+import asyncio
+
+import pytest
+import redis
+
+from redis_namespace import aio
+
+from .conftest import NS
+
+
+CLIENTS = []
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        # connections belong to the loop
+        for client in CLIENTS:
+            client.connection_pool.disconnect()
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+
+
+def make_client(**kwargs):
+    client = aio.StrictRedis(namespace=NS, db=9, **kwargs)
+    CLIENTS.append(client)
+    return client
+
+
+@pytest.fixture()
+def ar(request):
+    client = make_client()
+    raw = redis.Redis(db=9)
+    raw.flushdb()
+
+    def teardown():
+        raw.flushdb()
+        CLIENTS.remove(client)
+    request.addfinalizer(teardown)
+    return client
+
+
+@pytest.fixture()
+def raw():
+    return redis.Redis(db=9)
+
+
+class TestAsyncClient(object):
+
+    def test_commands(self, ar, raw):
+        async def commands():
+            assert await ar.set('a', 1) is True
+            assert await ar.get('a') == b'1'
+            assert await ar.mget(['a', 'b']) == [b'1', None]
+            assert await ar.mget([]) == []
+            assert await ar.keys() == [b'a']
+            assert await ar.incr('a') == 2
+        run(commands())
+        assert raw.keys() == [b'ns:a']
+
+    def test_reply_keys_are_stripped(self, ar):
+        async def commands():
+            await ar.rpush('l', 'v')
+            assert await ar.blpop(['l'], timeout=1) == (b'l', b'v')
+            assert await ar.scan() == (0, [])
+        run(commands())
+
+    def test_errors(self, ar):
+        async def commands():
+            await ar.set('a', 1)
+            with pytest.raises(redis.ResponseError):
+                await ar.lpush('a', 1)
+            assert await ar.get('a') == b'1'
+        run(commands())
+
+    def test_georadius(self, ar, raw):
+        async def commands():
+            await ar.geoadd('g', 2.1909389952632, 41.433791470673, 'P')
+            assert await ar.georadius('g', 2.191, 41.433, 1000) == ['P']
+            assert await ar.georadiusbymember('g', 'P', 10) == ['P']
+            await ar.georadius('g', 2.191, 41.433, 1000, store='dest')
+            await ar.georadiusbymember('g', 'P', 10, store_dist='dist')
+        run(commands())
+        assert raw.zrange(NS + 'dest', 0, -1) == [b'P']
+        assert raw.zrange(NS + 'dist', 0, -1) == [b'P']
+        assert not raw.exists('g', 'dest', 'dist')
+
+    def test_decode_responses(self):
+        client = make_client(decode_responses=True)
+
+        async def commands():
+            await client.set('a', '\u4e2d')
+            assert await client.get('a') == '\u4e2d'
+            assert await client.keys() == ['a']
+            await client.delete('a')
+        try:
+            run(commands())
+        finally:
+            CLIENTS.remove(client)
+
+    def test_python_parser(self, ar, monkeypatch):
+        monkeypatch.setattr(aio, 'HIREDIS_AVAILABLE', False)
+
+        async def commands():
+            await ar.rpush('l', 'a', 'b')
+            assert await ar.lrange('l', 0, -1) == [b'a', b'b']
+            assert await ar.keys() == [b'l']
+            assert await ar.get('missing') is None
+            with pytest.raises(redis.ResponseError):
+                await ar.get('l')
+        run(commands())
+
+    def test_concurrent_commands(self, ar):
+        async def commands():
+            await asyncio.gather(*[ar.set('k%d' % i, i) for i in range(50)])
+            values = await asyncio.gather(*[ar.get('k%d' % i) for i in range(50)])
+            assert values == [str(i).encode() for i in range(50)]
+        run(commands())
+
+    def test_cancelled_command(self, request):
+        client = make_client(max_connections=1)
+        request.addfinalizer(lambda: CLIENTS.remove(client))
+
+        async def commands():
+            await client.set('a', 'A')
+            await client.set('b', 'B')
+            task = asyncio.ensure_future(client.blpop('nolist', 1))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.blpop('nolist', 1), 0.05)
+            assert await client.get('a') == b'A'
+            assert await client.get('b') == b'B'
+            pipe = client.pipeline(transaction=False)
+            pipe.blpop('nolist', 1)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(pipe.execute(), 0.05)
+            assert await client.get('a') == b'A'
+            await client.delete('a', 'b')
+        run(commands())
+
+    def test_connection_error(self):
+        client = aio.StrictRedis(port=1)
+        with pytest.raises(redis.ConnectionError):
+            run(client.get('a'))
+
+
+class TestAsyncPipeline(object):
+
+    def test_pipeline(self, ar):
+        async def commands():
+            async with ar.pipeline(transaction=False) as pipe:
+                pipe.set('a', 1).get('a').keys().mget([])
+                assert await pipe.execute() == [True, b'1', [b'a'], []]
+        run(commands())
+
+    def test_transaction(self, ar):
+        async def commands():
+            await ar.rpush('l', 'v')
+            async with ar.pipeline() as pipe:
+                pipe.set('a', 1).keys('a').blpop(['l'], 1).mget([])
+                assert await pipe.execute() == [True, [b'a'], (b'l', b'v'), []]
+        run(commands())
+
+    def test_transaction_error(self, ar):
+        async def commands():
+            await ar.set('a', 1)
+            pipe = ar.pipeline()
+            pipe.lpush('a', 1).get('a')
+            with pytest.raises(redis.ResponseError):
+                await pipe.execute()
+            pipe.lpush('a', 1).get('a')
+            response = await pipe.execute(raise_on_error=False)
+            assert isinstance(response[0], redis.ResponseError)
+            assert response[1] == b'1'
+        run(commands())
+
+    def test_watch(self, ar):
+        other = redis.Redis(db=9)
+
+        async def commands():
+            await ar.set('a', 1)
+            async with ar.pipeline() as pipe:
+                await pipe.watch('a')
+                value = int(await pipe.get('a'))
+                pipe.multi()
+                pipe.set('a', value + 1)
+                assert await pipe.execute() == [True]
+            async with ar.pipeline() as pipe:
+                await pipe.watch('a')
+                other.set('ns:a', 5)
+                pipe.multi()
+                pipe.set('a', 3)
+                with pytest.raises(redis.WatchError):
+                    await pipe.execute()
+            assert await ar.get('a') == b'5'
+        run(commands())
+
+
+async def wait_received(pubsub, count):
+    for _ in range(200):
+        if pubsub.received >= count:
+            return
+        await asyncio.sleep(0.005)
+
+
+class TestAsyncPubSub(object):
+
+    def test_subscribe(self, ar, raw):
+        async def commands():
+            p = ar.pubsub()
+            await p.subscribe('chan')
+            assert await p.get_message(timeout=1) == {
+                'type': 'subscribe', 'pattern': None, 'channel': b'chan', 'data': 1}
+            assert raw.publish('ns:chan', 'hi') == 1
+            assert await p.get_message(timeout=1) == {
+                'type': 'message', 'pattern': None, 'channel': b'chan', 'data': b'hi'}
+            await p.unsubscribe()
+            assert (await p.get_message(timeout=1))['type'] == 'unsubscribe'
+            assert not p.subscribed
+            p.close()
+        run(commands())
+
+    def test_psubscribe(self, ar, raw):
+        async def commands():
+            p = ar.pubsub(ignore_subscribe_messages=True)
+            await p.psubscribe('c*')
+            await wait_received(p, 1)
+            raw.publish('ns:chan', 'hi')
+            raw.publish('chan', 'other namespace')
+            assert await p.get_message(timeout=1) == {
+                'type': 'pmessage', 'pattern': b'c*', 'channel': b'chan', 'data': b'hi'}
+            assert await p.get_message(timeout=0.05) is None
+            p.close()
+        run(commands())
+
+    def test_iterate(self, ar, raw):
+        async def commands():
+            p = ar.pubsub(ignore_subscribe_messages=True)
+            await p.subscribe('a', 'b')
+            raw.publish('ns:a', 1)
+            raw.publish('ns:b', 2)
+            messages = []
+            async for message in p:
+                messages.append((message['channel'], message['data']))
+                if len(messages) == 2:
+                    p.close()
+            assert messages == [(b'a', b'1'), (b'b', b'2')]
+        run(commands())
+
+    @pytest.mark.parametrize('overflow,expected', [
+        ('drop_oldest', [b'3', b'4']),
+        ('drop_newest', [b'0', b'1']),
+    ])
+    def test_drop_on_overflow(self, ar, raw, overflow, expected):
+        async def commands():
+            p = ar.pubsub(ignore_subscribe_messages=True, max_queue_size=2,
+                          overflow=overflow)
+            await p.subscribe('chan')
+            await asyncio.sleep(0.01)
+            for i in range(5):
+                raw.publish('ns:chan', i)
+            await wait_received(p, 5)
+            assert p.dropped == 3
+            assert p.qsize() == 2
+            assert [(await p.get_message())['data'] for _ in range(2)] == expected
+            p.close()
+        run(commands())
+
+    def test_block_on_overflow(self, ar, raw):
+        async def commands():
+            p = ar.pubsub(ignore_subscribe_messages=True, max_queue_size=2)
+            await p.subscribe('chan')
+            await asyncio.sleep(0.01)
+            for i in range(5):
+                raw.publish('ns:chan', i)
+            await asyncio.sleep(0.02)
+            assert p.qsize() == 2
+            assert [(await p.get_message(timeout=1))['data'] for _ in range(5)] == \
+                [str(i).encode() for i in range(5)]
+            assert p.dropped == 0
+            p.close()
+        run(commands())
+
+    def test_resubscribe_on_reconnect(self, ar, raw):
+        async def commands():
+            p = ar.pubsub(ignore_subscribe_messages=True)
+            await p.subscribe('chan')
+            await asyncio.sleep(0.01)
+            p.connection.disconnect()
+            await asyncio.sleep(0.05)
+            raw.publish('ns:chan', 'again')
+            assert (await p.get_message(timeout=1))['data'] == b'again'
+            p.close()
+        run(commands())
+
+    def test_invalid_overflow(self, ar):
+        with pytest.raises(ValueError):
+            ar.pubsub(overflow='spill')
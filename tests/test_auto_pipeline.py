@@ -0,0 +1,84 @@
+from __future__ import unicode_literals
+import threading
+
+import pytest
+import redis
+
+import redis_namespace
+
+from .conftest import _get_client
+
+
+@pytest.fixture()
+def ar(request):
+    client = _get_client(redis_namespace.Redis, request, auto_pipeline=True,
+                         auto_pipeline_window=0.05, auto_pipeline_batch=8)
+    client.auto_pipeline.batches = client.auto_pipeline.commands = 0
+    return client
+
+
+def run_threads(count, target):
+    barrier = threading.Barrier(count) if hasattr(threading, 'Barrier') else None
+    results = [None] * count
+
+    def run(i):
+        if barrier is not None:
+            barrier.wait()
+        results[i] = target(i)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestAutoPipeline(object):
+
+    def test_disabled_by_default(self, r):
+        assert r.auto_pipeline is None
+
+    def test_single_thread(self, ar):
+        assert ar.set('a', 1) is True
+        assert ar.get('a') == b'1'
+        assert ar.keys() == [b'a']
+        assert ar.auto_pipeline.batches == 3
+
+    def test_concurrent_commands_are_coalesced(self, ar):
+        results = run_threads(20, lambda i: ar.set('k%d' % i, i) and ar.get('k%d' % i))
+        assert results == [str(i).encode() for i in range(20)]
+        assert ar.auto_pipeline.commands == 40
+        assert ar.auto_pipeline.batches < 40
+        assert sorted(ar.keys()) == sorted(('k%d' % i).encode() for i in range(20))
+
+    def test_errors_go_to_their_caller(self, ar):
+        ar.set('a', 1)
+
+        def command(i):
+            try:
+                return ar.lpush('a', 1) if i == 0 else ar.get('a')
+            except redis.ResponseError as e:
+                return e
+        results = run_threads(4, command)
+        assert isinstance(results[0], redis.ResponseError)
+        assert results[1:] == [b'1'] * 3
+
+    def test_blocking_commands_are_not_batched(self, ar):
+        ar.rpush('a', 1)
+        assert ar.blpop('a', timeout=1) == (b'a', b'1')
+        assert ar.auto_pipeline.commands == 1
+
+    def test_connection_error(self):
+        client = redis_namespace.Redis(namespace='ns:', port=1, auto_pipeline=True)
+        with pytest.raises(redis.ConnectionError):
+            client.get('a')
+
+    def test_reconnects_idle_connections(self, ar, r):
+        ar.set('a', 1)
+        r.execute_command('CLIENT', 'KILL', 'TYPE', 'normal', 'SKIPME', 'yes')
+        assert ar.get('a') == b'1'
+
+    def test_transaction_commands_are_not_batched(self, ar):
+        ar.execute_command('watch', 'a')
+        ar.execute_command('unwatch')
+        assert ar.auto_pipeline.commands == 0
@@ -0,0 +1,130 @@
+from __future__ import unicode_literals
+import os
+import pytest
+import redis
+
+import redis_namespace
+from redis_namespace import KeySpec, command_key_specs, load_command_specs
+
+from .conftest import NS
+from .fake_server import FakeRedisServer
+
+
+COMMAND_REPLY = [
+    ['get', 2, ['readonly', 'fast'], 1, 1, 1],
+    ['fake.touch', -2, ['readonly', 'fast'], 1, -1, 1],
+    ['fake.mset', -3, ['write'], 1, -1, 2],
+    ['fake.range', -4, ['write'], 2, 3, 1],
+    ['fake.movable', -3, ['write', 'movablekeys'], 1, 1, 1],
+    ['fake.nokeys', 1, ['fast'], 0, 0, 0],
+]
+
+
+def fake_replies(version='99.0.0'):
+    return {
+        'INFO': 'redis_version:%s\r\n' % version,
+        'COMMAND': COMMAND_REPLY,
+    }
+
+
+@pytest.fixture()
+def restore_commands(request):
+    namespaced = dict(redis_namespace.NAMESPACED_COMMANDS)
+    server = dict(redis_namespace.SERVER_COMMANDS)
+
+    def teardown():
+        for table, saved in ((redis_namespace.NAMESPACED_COMMANDS, namespaced),
+                             (redis_namespace.SERVER_COMMANDS, server)):
+            table.clear()
+            table.update(saved)
+        redis_namespace.compile_commands()
+    request.addfinalizer(teardown)
+
+
+class TestCommandKeySpecs(object):
+
+    def test_command_key_specs(self):
+        specs = command_key_specs(COMMAND_REPLY)
+        assert specs == {
+            'get': (1, 1, 1),
+            'fake.touch': (1, -1, 1),
+            'fake.mset': (1, -1, 2),
+            'fake.range': (2, 3, 1),
+        }
+
+    def test_apply_command_specs(self, restore_commands):
+        redis_namespace.apply_command_specs(command_key_specs(COMMAND_REPLY))
+        assert redis_namespace.COMMANDS['get'] == ['first']
+        assert redis_namespace.COMMANDS['fake.touch'] == ['all']
+        assert redis_namespace.COMMANDS['fake.mset'] == ['alternate']
+        assert redis_namespace.COMMANDS['fake.range'] == [KeySpec(2, 3, 1)]
+        assert 'fake.movable' not in redis_namespace.COMMANDS
+        assert 'fake.touch' not in redis_namespace.NAMESPACED_COMMANDS
+
+        args_with_namespace = redis_namespace.args_with_namespace
+        assert args_with_namespace(NS, 'FAKE.TOUCH', 'a', 'b') == \
+            ('FAKE.TOUCH', 'ns:a', 'ns:b')
+        assert args_with_namespace(NS, 'FAKE.RANGE', 'x', 'a', 'b', 'y') == \
+            ('FAKE.RANGE', 'x', 'ns:a', 'ns:b', 'y')
+
+    def test_first_server_wins(self, restore_commands):
+        redis_namespace.apply_command_specs({'get': (2, 2, 1), 'fake.touch': (1, -1, 1)})
+        redis_namespace.apply_command_specs({'fake.touch': (1, 1, 1)})
+        assert redis_namespace.COMMANDS['get'] == ['first']
+        assert redis_namespace.COMMANDS['fake.touch'] == ['all']
+        # the tables take precedence over what servers report
+        redis_namespace.NAMESPACED_COMMANDS['fake.touch'] = ['first']
+        redis_namespace.compile_commands()
+        assert redis_namespace.COMMANDS['fake.touch'] == ['first']
+
+    def test_load_from_server(self, restore_commands, tmpdir):
+        with FakeRedisServer(fake_replies()) as server:
+            client = redis_namespace.Redis(
+                namespace=NS, host='127.0.0.1', port=server.port,
+                command_specs=True, command_specs_dir=str(tmpdir))
+            assert [c[0] for c in server.commands] == [b'INFO', b'COMMAND']
+            client.execute_command('FAKE.TOUCH', 'a', 'b')
+            assert server.commands[-1] == [b'FAKE.TOUCH', b'ns:a', b'ns:b']
+
+            # once per connection pool
+            redis_namespace.Redis(namespace=NS, connection_pool=client.connection_pool,
+                                  command_specs=True, command_specs_dir=str(tmpdir))
+            assert len(server.commands) == 3
+            client.connection_pool.disconnect()
+        assert os.path.exists(str(tmpdir.join('commands-99.0.0.json')))
+
+    def test_disk_cache(self, restore_commands, tmpdir):
+        with FakeRedisServer(fake_replies()) as server:
+            pool = redis.ConnectionPool(host='127.0.0.1', port=server.port)
+            load_command_specs(pool, str(tmpdir))
+            pool.disconnect()
+        redis_namespace.SERVER_COMMANDS.pop('fake.touch')
+        redis_namespace.compile_commands()
+
+        with FakeRedisServer(fake_replies()) as server:
+            pool = redis.ConnectionPool(host='127.0.0.1', port=server.port)
+            load_command_specs(pool, str(tmpdir))
+            assert [c[0] for c in server.commands] == [b'INFO']
+            assert redis_namespace.COMMANDS['fake.touch'] == ['all']
+            pool.disconnect()
+
+    def test_namespaced_connection(self, restore_commands, tmpdir):
+        with FakeRedisServer(fake_replies()) as server:
+            pool = redis.ConnectionPool(
+                connection_class=redis_namespace.NamespacedConnection,
+                namespace=NS, host='127.0.0.1', port=server.port)
+            client = redis_namespace.Redis(connection_pool=pool, command_specs=True,
+                                           command_specs_dir=str(tmpdir))
+            client.execute_command('FAKE.RANGE', 'x', 'a', 'b', 'y')
+            assert server.commands[-1] == [b'FAKE.RANGE', b'x', b'ns:a', b'ns:b', b'y']
+            pool.disconnect()
+
+    def test_real_server(self, restore_commands, tmpdir):
+        pool = redis.ConnectionPool(host='localhost', port=6379, db=9)
+        load_command_specs(pool, str(tmpdir))
+        assert redis_namespace.COMMANDS['touch'] == ['all']
+        client = redis_namespace.Redis(namespace=NS, connection_pool=pool)
+        client.set('a', 1)
+        assert client.execute_command('TOUCH', 'a', 'b') == 1
+        client.flushdb()
+        pool.disconnect()
@@ -1743,6 +1743,12 @@ class TestRedisCommands(object):
         # instead of save the geo score, the distance is saved.
         assert r.zscore('places_barcelona', 'place1') == 88.05060698409301
 
+    @skip_if_server_version_lt('3.2.0')
+    def test_georadiusbymember_store(self, r):
+        r.geoadd('barcelona', 2.1909389952632, 41.433791470673, 'STORE')
+        r.georadiusbymember('barcelona', 'STORE', 10, store='places_barcelona')
+        assert r.zrange('places_barcelona', 0, -1) == [b'STORE']
+
     @skip_if_server_version_lt('3.2.0')
     def test_georadiusmember(self, r):
         values = (2.1909389952632, 41.433791470673, 'place1') +\
@@ -491,3 +491,90 @@ class TestConnection(object):
             'UnixDomainSocketConnection',
             'path=/path/to/socket,db=0',
         )
+
+
+class TestNamespacedConnection(object):
+    def pack(self, connection, *args):
+        return b''.join(bytes(chunk) for chunk in connection.pack_command(*args))
+
+    def assert_packs_like(self, *args):
+        namespaced = redis_namespace.NamespacedConnection(namespace='ns:')
+        plain = redis.Connection()
+        expected = redis_namespace.args_with_namespace('ns:', *args)
+        assert self.pack(namespaced, *args) == self.pack(plain, *expected)
+
+    def test_pack_command(self):
+        self.assert_packs_like('GET', 'a')
+        self.assert_packs_like('SET', b'a', 'b', 'EX', 10)
+        self.assert_packs_like('MSET', 'a', 1, 'b', 2)
+        self.assert_packs_like('BLPOP', 'a', 'b', 0)
+        self.assert_packs_like('EVALSHA', 'sha', 2, 'a', 'b', 'arg')
+        self.assert_packs_like('ZUNIONSTORE', 'd', 2, 'a', 'b', 'WEIGHTS', 1, 2)
+        self.assert_packs_like('MEMORY USAGE', 'a')
+        self.assert_packs_like('SCAN', 0, 'COUNT', 10)
+        self.assert_packs_like('XREAD', 'COUNT', 1, 'STREAMS', 'a', 'b', 0, 0)
+        self.assert_packs_like('XGROUP CREATE', 'a', 'g', '$')
+        self.assert_packs_like('SORT', 'a', 'BY', 'w:*', 'GET', '#', 'GET', 'u:*',
+                               'STORE', 'd')
+        self.assert_packs_like('INFO')
+
+    def test_pack_buffer_keys(self):
+        namespaced = redis_namespace.NamespacedConnection(namespace='ns:')
+        plain = redis.Connection()
+        assert self.pack(namespaced, 'GET', memoryview(b'a')) == \
+            self.pack(plain, 'GET', b'ns:a')
+
+    def test_pack_large_key(self):
+        namespaced = redis_namespace.NamespacedConnection(namespace='ns:')
+        plain = redis.Connection()
+        key = b'k' * 10000
+        assert self.pack(namespaced, 'SET', key, 'v') == \
+            self.pack(plain, 'SET', b'ns:' + key, 'v')
+
+    def test_pack_commands(self):
+        namespaced = redis_namespace.NamespacedConnection(namespace='ns:')
+        plain = redis.Connection()
+        commands = [('SET', 'a', 1), ('GET', 'a')]
+        expected = [redis_namespace.args_with_namespace('ns:', *c) for c in commands]
+        assert b''.join(namespaced.pack_commands(commands)) == \
+            b''.join(plain.pack_commands(expected))
+
+    @pytest.fixture()
+    def nr(self, request):
+        pool = redis.ConnectionPool(
+            connection_class=redis_namespace.NamespacedConnection,
+            namespace='ns:', host='localhost', port=6379, db=9)
+        client = redis_namespace.Redis(connection_pool=pool)
+        client.flushdb()
+
+        def teardown():
+            client.flushdb()
+            pool.disconnect()
+        request.addfinalizer(teardown)
+        return client
+
+    def test_commands(self, nr):
+        raw = redis.Redis(host='localhost', port=6379, db=9)
+        nr.set('a', 1)
+        nr.mset({'b': 2})
+        assert raw.get('ns:a') == b'1'
+        assert nr.get('a') == b'1'
+        assert nr.mget('a', 'b') == [b'1', b'2']
+        assert sorted(nr.keys()) == [b'a', b'b']
+
+    def test_pipeline(self, nr):
+        raw = redis.Redis(host='localhost', port=6379, db=9)
+        with nr.pipeline() as pipe:
+            pipe.set('a', 1).incr('a').get('a')
+            assert pipe.execute() == [True, 2, b'2']
+        assert raw.get('ns:a') == b'2'
+
+    def test_pubsub(self, nr):
+        p = nr.pubsub(ignore_subscribe_messages=True)
+        p.subscribe('foo')
+        p.get_message(timeout=1)
+        assert nr.publish('foo', 'bar') == 1
+        message = p.get_message(timeout=1)
+        assert message['channel'] == b'foo'
+        assert message['data'] == b'bar'
+        p.close()
@@ -54,3 +54,37 @@ class TestInvalidUserInput(object):
 
         with pytest.raises(redis.DataError):
             r.set('a', Foo())
+
+
+class TestBinaryKeys(object):
+    def test_non_utf8_key(self, r, bns):
+        raw = redis.Redis(host='localhost', port=6379, db=9)
+        key = b'\xff\xfe\x00'
+        r.set(key, 'value')
+        assert raw.get(bns + key) == b'value'
+        assert r.get(key) == b'value'
+
+    def test_buffer_keys(self, r, bns):
+        raw = redis.Redis(host='localhost', port=6379, db=9)
+        r.set(bytearray(b'a'), 'value')
+        assert raw.get(bns + b'a') == b'value'
+        assert r.get(memoryview(b'a')) == b'value'
+
+
+class TestMemoryviewKeys(object):
+    @pytest.fixture()
+    def r(self, request):
+        return _get_client(redis_namespace.Redis, request=request, memoryview_keys=True)
+
+    def test_keys(self, r):
+        r.set('a', 1)
+        r.set('b', 2)
+        keys = r.keys()
+        assert all(isinstance(k, memoryview) for k in keys)
+        assert sorted(k.tobytes() for k in keys) == [b'a', b'b']
+
+    def test_blpop(self, r):
+        r.rpush('a', '1')
+        key, value = r.blpop('a', timeout=1)
+        assert key == b'a'
+        assert value == b'1'
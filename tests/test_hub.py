@@ -0,0 +1,273 @@
+from __future__ import unicode_literals
+import time
+
+import pytest
+import redis
+
+import redis_namespace
+from redis_namespace.hub import HubWorkerThread, SubscriberHub, shared_hub
+
+
+@pytest.fixture()
+def hub(request):
+    hub = SubscriberHub(host='localhost', port=6379, db=9)
+    request.addfinalizer(hub.close)
+    return hub
+
+
+@pytest.fixture()
+def raw():
+    return redis.Redis(host='localhost', port=6379, db=9)
+
+
+class SlowConnection(redis.Connection):
+    connects = 0
+
+    def _connect(self):
+        self.connects += 1
+        # leaves the reader thread time to find the connection unconnected
+        time.sleep(0.05)
+        return super(SlowConnection, self)._connect()
+
+
+def wait_for_messages(handle, count, timeout=1):
+    messages = []
+    deadline = time.time() + timeout
+    while len(messages) < count and time.time() < deadline:
+        messages.extend(handle.get_messages(timeout=0.01))
+    return messages
+
+
+def message(channel, data, pattern=None):
+    return {'type': 'pmessage' if pattern else 'message', 'pattern': pattern,
+            'channel': channel, 'data': data}
+
+
+class TestSubscriberHub(object):
+
+    def test_namespaces_share_a_connection(self, hub, raw):
+        a = hub.pubsub('a:', ignore_subscribe_messages=True)
+        b = hub.pubsub('b:', ignore_subscribe_messages=True)
+        a.subscribe('chan')
+        b.subscribe('chan')
+        assert raw.publish('a:chan', 'for a') == 1
+        assert raw.publish('b:chan', 'for b') == 1
+        assert wait_for_messages(a, 1) == [message(b'chan', b'for a')]
+        assert wait_for_messages(b, 1) == [message(b'chan', b'for b')]
+        assert hub.connection_pool._created_connections == 1
+
+    def test_nested_namespaces(self, hub, raw):
+        outer = hub.pubsub('a:', ignore_subscribe_messages=True)
+        inner = hub.pubsub('a:b:', ignore_subscribe_messages=True)
+        outer.subscribe('b:c')
+        inner.subscribe('c')
+        assert raw.publish('a:b:c', 'x') == 1
+        assert wait_for_messages(outer, 1) == [message(b'b:c', b'x')]
+        assert wait_for_messages(inner, 1) == [message(b'c', b'x')]
+
+    def test_patterns(self, hub, raw):
+        a = hub.pubsub('a:', ignore_subscribe_messages=True)
+        b = hub.pubsub('b:', ignore_subscribe_messages=True)
+        a.psubscribe('c*')
+        b.psubscribe('c*')
+        raw.publish('a:chan', 'x')
+        assert wait_for_messages(a, 1) == [message(b'chan', b'x', pattern=b'c*')]
+        assert b.get_messages() == []
+
+    def test_subscriptions_are_shared(self, hub, raw):
+        first = hub.pubsub('a:', ignore_subscribe_messages=True)
+        second = hub.pubsub('a:', ignore_subscribe_messages=True)
+        first.subscribe('chan')
+        second.subscribe('chan')
+        assert hub.server_subscriptions == 1
+        assert raw.pubsub_numsub('a:chan') == [(b'a:chan', 1)]
+        raw.publish('a:chan', 'x')
+        assert wait_for_messages(first, 1) == [message(b'chan', b'x')]
+        assert wait_for_messages(second, 1) == [message(b'chan', b'x')]
+        first.close()
+        hub.poll(0.05)
+        assert raw.pubsub_numsub('a:chan') == [(b'a:chan', 1)]
+        second.unsubscribe('chan')
+        hub.poll(0.05)
+        assert hub.server_subscriptions == 0
+        assert raw.pubsub_numsub('a:chan') == [(b'a:chan', 0)]
+
+    def test_subscribe_messages_are_local(self, hub):
+        p = hub.pubsub('a:')
+        p.subscribe('x', 'y')
+        p.psubscribe('z*')
+        p.unsubscribe('x')
+        assert [(m['type'], m['channel'], m['data']) for m in p.get_messages()] == [
+            ('subscribe', b'x', 2), ('subscribe', b'y', 2),
+            ('psubscribe', b'z*', 3), ('unsubscribe', b'x', 2)]
+
+    def test_handlers_in_thread(self, hub, raw):
+        received = []
+        p = hub.pubsub('a:')
+        p.subscribe(chan=received.append)
+        hub.run_in_thread(sleep_time=0.01)
+        raw.publish('a:chan', 'x')
+        deadline = time.time() + 1
+        while not received and time.time() < deadline:
+            time.sleep(0.01)
+        assert received == [message(b'chan', b'x')]
+
+    def test_subscribe_while_the_thread_runs(self, raw, request):
+        hub = SubscriberHub(host='localhost', port=6379, db=9, connections=2,
+                            connection_class=SlowConnection)
+        request.addfinalizer(hub.close)
+        thread = hub.run_in_thread(sleep_time=0.001)
+        p = hub.pubsub('a:', ignore_subscribe_messages=True)
+        p.subscribe('c1', 'c2', 'c3')
+        assert thread.is_alive()
+        raw.publish('a:c1', 'x')
+        assert p.get_message(timeout=1) == message(b'c1', b'x')
+        # connected by the subscribing thread only
+        assert [ps.connection.connects for ps in hub._pubsubs if ps.connection] == \
+            [1] * hub.connection_pool._created_connections
+
+    def test_get_message_waits_for_the_thread(self, hub, raw):
+        p = hub.pubsub('a:', ignore_subscribe_messages=True)
+        p.subscribe('chan')
+        hub.run_in_thread(sleep_time=0.01)
+        raw.publish('a:chan', 'x')
+        assert p.get_message(timeout=1) == message(b'chan', b'x')
+
+    def test_several_connections(self, raw, request):
+        hub = SubscriberHub(host='localhost', port=6379, db=9, connections=4)
+        request.addfinalizer(hub.close)
+        p = hub.pubsub('a:', ignore_subscribe_messages=True)
+        channels = ['c%d' % i for i in range(20)]
+        p.subscribe(*channels)
+        for channel in channels:
+            raw.publish('a:' + channel, channel)
+        messages = wait_for_messages(p, 20)
+        assert sorted(m['channel'] for m in messages) == \
+            sorted(c.encode() for c in channels)
+        assert hub.connection_pool._created_connections == 4
+
+    def test_decode_responses(self, raw, request):
+        hub = SubscriberHub(host='localhost', port=6379, db=9, decode_responses=True)
+        request.addfinalizer(hub.close)
+        p = hub.pubsub('a:', ignore_subscribe_messages=True)
+        p.psubscribe('c*')
+        raw.publish('a:chan', 'x')
+        assert wait_for_messages(p, 1) == [message('chan', 'x', pattern='c*')]
+
+    def test_namespaced_pool_is_rejected(self):
+        pool = redis.ConnectionPool(connection_class=redis_namespace.NamespacedConnection,
+                                    namespace='ns:')
+        with pytest.raises(ValueError):
+            SubscriberHub(pool)
+
+
+@pytest.fixture()
+def shared(request):
+    clients = {}
+
+    def make(namespace, **kwargs):
+        client = redis_namespace.StrictRedis(namespace=namespace, host='localhost',
+                                             port=6379, db=9, **kwargs)
+        clients[namespace] = client
+        return client
+
+    def teardown():
+        for hub in set(shared_hub(c.connection_pool) for c in clients.values()):
+            hub.close()
+    request.addfinalizer(teardown)
+    return make
+
+
+class TestSharedPubSub(object):
+
+    def test_listeners_share_one_subscription(self, shared, raw):
+        first = shared('a:').pubsub(shared=True, ignore_subscribe_messages=True)
+        second = shared('a:').pubsub(shared=True, ignore_subscribe_messages=True)
+        assert first.hub is second.hub
+        first.subscribe('chan')
+        second.subscribe('chan')
+        assert raw.pubsub_numsub('a:chan') == [(b'a:chan', 1)]
+        assert first.hub.listeners == 2
+        assert raw.publish('a:chan', 'x') == 1
+        m1 = first.get_message(timeout=1)
+        m2 = second.get_message(timeout=1)
+        assert m1 == message(b'chan', b'x')
+        # decoded once for every listener
+        assert m1 is m2
+        assert first.hub.deliveries == 2
+        first.unsubscribe('chan')
+        assert raw.pubsub_numsub('a:chan') == [(b'a:chan', 1)]
+        second.unsubscribe('chan')
+        deadline = time.time() + 1
+        while raw.pubsub_numsub('a:chan')[0][1] and time.time() < deadline:
+            time.sleep(0.01)
+        assert raw.pubsub_numsub('a:chan') == [(b'a:chan', 0)]
+
+    def test_namespaces_share_the_hub(self, shared, raw):
+        a = shared('a:').pubsub(shared=True, ignore_subscribe_messages=True)
+        b = shared('b:').pubsub(shared=True, ignore_subscribe_messages=True)
+        assert a.hub is b.hub
+        a.psubscribe('c*')
+        b.psubscribe('c*')
+        raw.publish('b:chan', 'x')
+        assert b.get_message(timeout=1) == message(b'chan', b'x', pattern=b'c*')
+        assert a.get_message(timeout=0.05) is None
+
+    def test_reconnects(self, shared, raw):
+        p = shared('a:').pubsub(shared=True, ignore_subscribe_messages=True)
+        p.subscribe('chan')
+        # down for a while
+        port = p.hub._pubsubs[0].connection.port
+        p.hub._pubsubs[0].connection.port = 1
+        raw.execute_command('CLIENT', 'KILL', 'TYPE', 'pubsub')
+        time.sleep(0.2)
+        p.hub._pubsubs[0].connection.port = port
+        deadline = time.time() + 2
+        while raw.pubsub_numsub('a:chan')[0][1] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        assert p.hub._thread.is_alive()
+        assert raw.publish('a:chan', 'x') == 1
+        assert p.get_message(timeout=1) == message(b'chan', b'x')
+
+    def test_gives_up(self, shared, raw, monkeypatch):
+        monkeypatch.setattr(HubWorkerThread, 'max_retries', 2)
+        monkeypatch.setattr(HubWorkerThread, 'retry_interval', 0.01)
+        p = shared('a:').pubsub(shared=True, ignore_subscribe_messages=True)
+        hub = p.hub
+        p.subscribe('chan')
+        # the server can't be reached again
+        for pubsub in hub._pubsubs:
+            pubsub.connection.port = 1
+        raw.execute_command('CLIENT', 'KILL', 'TYPE', 'pubsub')
+        hub._thread.join(2)
+        assert not hub._thread.is_alive()
+        with pytest.raises(redis.ConnectionError):
+            p.get_message(timeout=0.05)
+        assert shared('a:').pubsub(shared=True).hub is not hub
+        hub.close()
+
+    def test_fails_on_other_errors(self, shared, monkeypatch):
+        p = shared('a:').pubsub(shared=True, ignore_subscribe_messages=True)
+        hub = p.hub
+        p.subscribe('chan')
+
+        def poll(timeout):
+            raise ValueError('bad reply')
+        monkeypatch.setattr(hub, 'poll', poll)
+        hub._thread.join(2)
+        assert not hub._thread.is_alive()
+        with pytest.raises(ValueError):
+            p.get_message(timeout=0.05)
+        assert shared('a:').pubsub(shared=True).hub is not hub
+        hub.close()
+
+    def test_namespaced_connection(self, raw, request):
+        pool = redis.ConnectionPool(
+            connection_class=redis_namespace.NamespacedConnection,
+            namespace='ns:', host='localhost', port=6379, db=9)
+        client = redis_namespace.StrictRedis(connection_pool=pool)
+        p = client.pubsub(shared=True, ignore_subscribe_messages=True)
+        request.addfinalizer(p.hub.close)
+        p.subscribe('chan')
+        assert raw.publish('ns:chan', 'x') == 1
+        assert p.get_message(timeout=1) == message(b'chan', b'x')
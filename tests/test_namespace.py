@@ -0,0 +1,304 @@
+from __future__ import unicode_literals
+import pytest
+import redis
+
+import redis_namespace
+from redis_namespace import (KeyCache, Namespace, add_namespace,
+                             add_namespace_bulk, args_with_namespace, response_rm_namespace,
+                             rm_namespace)
+
+from .conftest import NS, _get_client
+
+
+class TestArgsWithNamespace(object):
+
+    def test_no_namespace(self):
+        assert args_with_namespace('', 'GET', 'a') == ('GET', 'a')
+
+    def test_unknown_command(self):
+        assert args_with_namespace(NS, 'INFO', 'server') == ('INFO', 'server')
+
+    def test_first(self):
+        assert args_with_namespace(NS, 'SET', 'a', 'b', 'EX', 10) == \
+            ('SET', 'ns:a', 'b', 'EX', 10)
+
+    def test_lowercase_command_name(self):
+        assert args_with_namespace(NS, 'get', 'a') == ('get', 'ns:a')
+        assert args_with_namespace(NS, 'Get', 'a') == ('Get', 'ns:a')
+
+    def test_all(self):
+        assert args_with_namespace(NS, 'DEL', 'a', 'b', 'c') == \
+            ('DEL', 'ns:a', 'ns:b', 'ns:c')
+
+    def test_exclude_first(self):
+        assert args_with_namespace(NS, 'BITOP', 'AND', 'd', 'a', 'b') == \
+            ('BITOP', 'AND', 'ns:d', 'ns:a', 'ns:b')
+
+    def test_exclude_last(self):
+        assert args_with_namespace(NS, 'BLPOP', 'a', 'b', 0) == \
+            ('BLPOP', 'ns:a', 'ns:b', 0)
+
+    def test_exclude_options(self):
+        args = ('ZUNIONSTORE', 'd', 2, 'a', 'b', 'AGGREGATE', 'MAX')
+        assert args_with_namespace(NS, *args) == \
+            ('ZUNIONSTORE', 'ns:d', 2, 'ns:a', 'ns:b', 'AGGREGATE', 'MAX')
+
+    def test_alternate(self):
+        assert args_with_namespace(NS, 'MSET', 'a', 1, 'b', 2) == \
+            ('MSET', 'ns:a', 1, 'ns:b', 2)
+
+    def test_eval_style(self):
+        args = ('EVALSHA', 'sha', 2, 'a', 'b', 'arg')
+        assert args_with_namespace(NS, *args) == \
+            ('EVALSHA', 'sha', 2, 'ns:a', 'ns:b', 'arg')
+
+    def test_scan_style(self):
+        assert args_with_namespace(NS, 'SCAN', 0) == \
+            ('SCAN', 0, 'match', 'ns:*')
+        assert args_with_namespace(NS, 'SCAN', 0, 'MATCH', 'a*', 'COUNT', 5) == \
+            ('SCAN', 0, 'MATCH', 'ns:a*', 'COUNT', 5)
+
+    def test_sort(self):
+        args = ('SORT', 'a', 'BY', 'w:*', 'LIMIT', 0, 10, 'GET', 'u:*->name',
+                'GET', '#', 'DESC', 'ALPHA', 'STORE', 'd')
+        assert args_with_namespace(NS, *args) == \
+            ('SORT', 'ns:a', 'BY', 'ns:w:*', 'LIMIT', 0, 10, 'GET', 'ns:u:*->name',
+             'GET', '#', 'DESC', 'ALPHA', 'STORE', 'ns:d')
+        assert args_with_namespace(NS, 'SORT_RO', 'a', 'GET', 'u:*') == \
+            ('SORT_RO', 'ns:a', 'GET', 'ns:u:*')
+
+    def test_streams(self):
+        args = ('XREAD', 'COUNT', 2, 'STREAMS', 'a', 'b', 0, 0)
+        assert args_with_namespace(NS, *args) == \
+            ('XREAD', 'COUNT', 2, 'STREAMS', 'ns:a', 'ns:b', 0, 0)
+        args = ('XREADGROUP', 'GROUP', 'streams', 'c', 'STREAMS', 'a', '>')
+        assert args_with_namespace(NS, *args) == \
+            ('XREADGROUP', 'GROUP', 'streams', 'c', 'STREAMS', 'ns:a', '>')
+        assert args_with_namespace(NS, 'XGROUP CREATE', 'a', 'g', '$') == \
+            ('XGROUP CREATE', 'ns:a', 'g', '$')
+
+    def test_multi_word_command(self):
+        assert args_with_namespace(NS, 'MEMORY USAGE', 'a') == \
+            ('MEMORY USAGE', 'ns:a')
+        assert args_with_namespace(NS, 'PUBSUB CHANNELS', '*') == \
+            ('PUBSUB CHANNELS', '*')
+
+
+class TestRegisterCommand(object):
+
+    @pytest.fixture()
+    def cleanup(self, request):
+        def teardown():
+            redis_namespace.NAMESPACED_COMMANDS.pop('mycmd', None)
+            redis_namespace.OTHER_COMMANDS.pop('mycmd', None)
+            redis_namespace.compile_commands()
+        request.addfinalizer(teardown)
+
+    def test_register_command(self, cleanup):
+        assert args_with_namespace(NS, 'MYCMD', 'a', 'b') == ('MYCMD', 'a', 'b')
+        redis_namespace.register_command('MYCMD', ['all'])
+        assert redis_namespace.NAMESPACED_COMMANDS['mycmd'] == ['all']
+        assert args_with_namespace(NS, 'MYCMD', 'a', 'b') == \
+            ('MYCMD', 'ns:a', 'ns:b')
+        assert args_with_namespace(NS, 'mycmd', 'a') == ('mycmd', 'ns:a')
+
+    def test_compile_after_table_change(self, cleanup):
+        redis_namespace.NAMESPACED_COMMANDS['mycmd'] = ['first']
+        redis_namespace.compile_commands()
+        assert args_with_namespace(NS, 'MYCMD', 'a', 'b') == \
+            ('MYCMD', 'ns:a', 'b')
+
+    def test_register_command_not_namespaced(self, cleanup):
+        redis_namespace.register_command('MYCMD', ['first'], namespaced=False)
+        assert 'mycmd' not in redis_namespace.NAMESPACED_COMMANDS
+        redis_namespace.compile_commands()
+        assert args_with_namespace(NS, 'MYCMD', 'a', 'b') == \
+            ('MYCMD', 'ns:a', 'b')
+
+
+class TestAddNamespace(object):
+
+    def test_text_key(self):
+        assert add_namespace(NS, 'a') == 'ns:a'
+
+    def test_bytes_key(self):
+        assert add_namespace(NS, b'a') == b'ns:a'
+
+    def test_binary_key_is_not_decoded(self):
+        assert add_namespace(NS, b'\xff\xfe') == b'ns:\xff\xfe'
+
+    def test_buffer_keys(self):
+        assert add_namespace(NS, bytearray(b'a')) == b'ns:a'
+        assert add_namespace(NS, memoryview(b'xay')[1:2]) == b'ns:a'
+
+    def test_nested_keys(self):
+        assert add_namespace(NS, ['a', b'b']) == ['ns:a', b'ns:b']
+        assert add_namespace(NS, {'a': 1}) == {'ns:a': 1}
+
+    def test_non_key_values_are_untouched(self):
+        assert add_namespace(NS, None) is None
+        assert add_namespace(NS, 1) == 1
+
+    def test_pre_encoded_namespace(self):
+        ns = Namespace('\u4e2d:', encoding='gbk')
+        assert ns == '\u4e2d:'
+        assert ns.encoded == '\u4e2d:'.encode('gbk')
+        assert add_namespace(ns, b'a') == '\u4e2d:'.encode('gbk') + b'a'
+        assert add_namespace(ns, 'a') == '\u4e2d:a'
+
+    def test_namespace_from_bytes(self):
+        ns = Namespace(b'ns:')
+        assert ns == 'ns:'
+        assert ns.encoded == b'ns:'
+
+
+class TestRmNamespace(object):
+
+    def test_text_key(self):
+        assert rm_namespace(NS, 'ns:a') == 'a'
+
+    def test_bytes_key(self):
+        assert rm_namespace(NS, b'ns:a') == b'a'
+
+    def test_prefix_is_verified(self):
+        assert rm_namespace(NS, b'other:a') == b'other:a'
+        assert rm_namespace(NS, 'other:a') == 'other:a'
+
+    def test_non_ascii_namespace_uses_byte_length(self):
+        ns = Namespace('\u4e2d:')
+        key = '\u4e2d:a'.encode('utf-8')
+        assert rm_namespace(ns, key) == b'a'
+
+    def test_memoryviews(self):
+        key = b'ns:abc'
+        stripped = rm_namespace(NS, key, memoryviews=True)
+        assert isinstance(stripped, memoryview)
+        assert stripped.obj is key
+        assert stripped == b'abc'
+
+    def test_list_is_stripped_in_place(self):
+        keys = [b'ns:a', 'ns:b', b'other', [b'ns:c'], 1]
+        assert rm_namespace(NS, keys) is keys
+        assert keys == [b'a', 'b', b'other', [b'c'], 1]
+
+    def test_response_rm_namespace(self):
+        assert response_rm_namespace(NS, 'KEYS', [b'ns:a', b'ns:b']) == \
+            [b'a', b'b']
+        assert response_rm_namespace(NS, 'BLPOP', [b'ns:a', b'v']) == \
+            [b'a', b'v']
+        assert response_rm_namespace(NS, 'SCAN', [b'0', [b'ns:a']]) == \
+            [b'0', [b'a']]
+        response = [[b'ns:a', [[b'1-0', [b'f', b'ns:v']]]]]
+        assert response_rm_namespace(NS, 'XREAD', response) == \
+            [[b'a', [[b'1-0', [b'f', b'ns:v']]]]]
+
+
+class TestKeyCache(object):
+
+    @pytest.fixture()
+    def cr(self, request):
+        client = _get_client(redis_namespace.Redis, request, key_cache_size=2)
+        client.key_cache.clear()
+        return client
+
+    def test_disabled_by_default(self, r):
+        assert r.key_cache is None
+
+    def test_prefixed_key_is_encoded(self):
+        ns = Namespace(NS)
+        ns.key_cache = KeyCache(ns, 8)
+        assert add_namespace(ns, 'a') == b'ns:a'
+        assert add_namespace(ns, b'b') == b'ns:b'
+        assert add_namespace(ns, 'a') == b'ns:a'
+        assert ns.key_cache.hits == 1
+        assert ns.key_cache.misses == 2
+
+    def test_bounded(self):
+        ns = Namespace(NS)
+        ns.key_cache = KeyCache(ns, 2)
+        for key in ('a', 'b', 'c', 'a'):
+            add_namespace(ns, key)
+        assert ns.key_cache.currsize == 2
+        assert ns.key_cache.hits == 0
+        assert ns.key_cache.misses == 4
+
+    def test_commands(self, cr):
+        cr.set('a', 1)
+        assert cr.get('a') == b'1'
+        assert cr.key_cache.hits == 1
+        assert cr.key_cache.misses == 1
+
+    def test_shared_with_pipeline(self, cr):
+        cr.set('a', 1)
+        with cr.pipeline() as pipe:
+            assert pipe.key_cache is cr.key_cache
+            pipe.get('a')
+            assert pipe.execute() == [b'1']
+        assert cr.key_cache.hits == 1
+
+
+class TestAddNamespaceBulk(object):
+
+    def test_text_keys(self):
+        assert add_namespace_bulk(NS, ('a', 'b')) == ['ns:a', 'ns:b']
+
+    def test_bytes_keys(self):
+        assert add_namespace_bulk(NS, [b'a', b'\xff']) == [b'ns:a', b'ns:\xff']
+
+    def test_mixed_keys(self):
+        assert add_namespace_bulk(NS, ['a', b'b', 1, '']) == \
+            ['ns:a', b'ns:b', 1, '']
+
+    def test_key_cache(self):
+        ns = Namespace(NS)
+        ns.key_cache = KeyCache(ns, 8)
+        assert add_namespace_bulk(ns, ['a', 'a']) == [b'ns:a', b'ns:a']
+        assert ns.key_cache.hits == 1
+
+    def test_numpy_array(self):
+        numpy = pytest.importorskip('numpy')
+        assert add_namespace_bulk(NS, numpy.array([b'a', b'bc'])) == \
+            [b'ns:a', b'ns:bc']
+        assert add_namespace_bulk(NS, numpy.array(['a', 'bc'])) == \
+            ['ns:a', 'ns:bc']
+
+
+class TestBulkCommands(object):
+
+    @pytest.fixture()
+    def br(self, request):
+        return _get_client(redis_namespace.Redis, request, max_keys_per_command=3)
+
+    @pytest.fixture()
+    def raw(self):
+        return redis.Redis(host='localhost', port=6379, db=9)
+
+    def test_mset_mget(self, br, raw):
+        mapping = dict(('k%d' % i, i) for i in range(10))
+        assert br.mset(mapping) is True
+        assert raw.get('ns:k9') == b'9'
+        keys = sorted(mapping)
+        assert br.mget(keys) == [str(mapping[k]).encode() for k in keys]
+        assert br.mget('k0', 'k1', 'missing') == [b'0', b'1', None]
+        assert br.mget([]) == []
+
+    def test_delete_exists_unlink(self, br):
+        keys = ['k%d' % i for i in range(10)]
+        br.mset(dict.fromkeys(keys, 1))
+        assert br.exists(*keys) == 10
+        assert br.delete(*keys[:5]) == 5
+        assert br.unlink(*keys) == 5
+        assert br.exists(*keys) == 0
+
+    def test_numpy_keys(self, br):
+        numpy = pytest.importorskip('numpy')
+        keys = numpy.array(['k%d' % i for i in range(7)])
+        br.mset(dict.fromkeys(keys.tolist(), 1))
+        assert br.mget(keys) == [b'1'] * 7
+        assert br.delete(keys) == 7
+
+    def test_pipeline_is_not_chunked(self, br):
+        keys = ['k%d' % i for i in range(10)]
+        with br.pipeline() as pipe:
+            pipe.mset(dict.fromkeys(keys, 1)).mget(keys).delete(*keys)
+            assert pipe.execute() == [True, [b'1'] * 10, 10]
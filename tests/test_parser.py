@@ -0,0 +1,141 @@
+from __future__ import unicode_literals
+import pytest
+import redis
+
+import redis_namespace
+from redis.utils import HIREDIS_AVAILABLE
+
+from .conftest import NS
+
+
+PARSERS = [redis_namespace.NamespacedPythonParser]
+if HIREDIS_AVAILABLE:
+    PARSERS.append(redis_namespace.NamespacedHiredisParser)
+
+
+@pytest.fixture(params=PARSERS)
+def pr(request):
+    pool = redis.ConnectionPool(host='localhost', port=6379, db=9,
+                                parser_class=request.param)
+    client = redis_namespace.Redis(namespace=NS, connection_pool=pool)
+    client.flushdb()
+
+    def teardown():
+        client.flushdb()
+        pool.disconnect()
+    request.addfinalizer(teardown)
+    return client
+
+
+@pytest.fixture()
+def raw(request):
+    return redis.Redis(host='localhost', port=6379, db=9)
+
+
+class TestNamespacedParser(object):
+
+    def test_default_parser(self, r):
+        parser_class = r.connection_pool.connection_kwargs['parser_class']
+        assert parser_class is redis_namespace.DefaultParser
+
+    def test_keys(self, pr, raw):
+        pr.set('a', 1)
+        pr.set('b', 2)
+        raw.set('other', 3)
+        assert sorted(pr.keys()) == [b'a', b'b']
+
+    def test_keys_without_namespace_are_untouched(self, pr, raw):
+        raw.set('other', 3)
+        assert pr.execute_command('KEYS', '*') == []
+        pr.set('a', 1)
+        assert pr.execute_command('SCAN', 0, 'MATCH', '*') == (0, [b'a'])
+
+    def test_scan(self, pr):
+        pr.set('a', 1)
+        pr.set('b', 2)
+        cursor, keys = pr.scan()
+        assert cursor == 0
+        assert sorted(keys) == [b'a', b'b']
+
+    def test_blpop(self, pr):
+        pr.rpush('b', '1')
+        assert pr.blpop(['a', 'b'], timeout=1) == (b'b', b'1')
+
+    def test_error_replies(self, pr):
+        pr.set('a', 1)
+        with pytest.raises(redis.ResponseError) as e:
+            pr.blpop('a', timeout=1)
+        assert 'WRONGTYPE' in str(e.value)
+        with pytest.raises(redis.ResponseError):
+            pr.scan('notanumber')
+        pipe = pr.pipeline(transaction=False)
+        pipe.blpop('a', timeout=1).get('a')
+        result = pipe.execute(raise_on_error=False)
+        assert isinstance(result[0], redis.ResponseError)
+        assert result[1] == b'1'
+
+    def test_pubsub_channels(self, pr):
+        p = pr.pubsub()
+        p.subscribe('foo')
+        assert pr.pubsub_channels() == [b'foo']
+        p.close()
+
+    def test_pubsub_get_messages(self, pr):
+        p = pr.pubsub(ignore_subscribe_messages=True)
+        p.subscribe('foo')
+        for i in range(20):
+            pr.publish('foo', NS + str(i))
+        messages = []
+        for _ in range(10):
+            if len(messages) == 20:
+                break
+            batch = p.get_messages(max_count=7, timeout=0.1)
+            assert len(batch) <= 7
+            messages.extend(batch)
+        assert [(m['channel'], m['data']) for m in messages] == \
+            [(b'foo', (NS + str(i)).encode('utf-8')) for i in range(20)]
+        p.close()
+
+    def test_xread(self, pr):
+        message_id = pr.xadd('s', {'field': NS + 'value'})
+        assert pr.xread({'s': 0}) == \
+            [['s', [(message_id, {b'field': (NS + 'value').encode('utf-8')})]]]
+
+    def test_values_are_not_stripped(self, pr):
+        pr.set('a', NS + 'value')
+        assert pr.get('a') == (NS + 'value').encode('utf-8')
+
+    def test_error_reply(self, pr):
+        pr.set('a', 1)
+        with pytest.raises(redis.ResponseError):
+            pr.lpush('a', 1)
+        assert pr.keys() == [b'a']
+
+    def test_key_equal_to_namespace(self, pr, raw):
+        raw.set(NS, 1)
+        assert pr.keys() == [b'']
+
+
+class TestNamespacedParserDecoding(object):
+
+    @pytest.fixture(params=PARSERS)
+    def pr(self, request):
+        pool = redis.ConnectionPool(host='localhost', port=6379, db=9,
+                                    parser_class=request.param,
+                                    decode_responses=True)
+        client = redis_namespace.Redis(namespace=NS, connection_pool=pool)
+        client.flushdb()
+
+        def teardown():
+            client.flushdb()
+            pool.disconnect()
+        request.addfinalizer(teardown)
+        return client
+
+    def test_keys(self, pr):
+        pr.set('a', 1)
+        assert pr.keys() == ['a']
+
+    def test_blpop(self, pr):
+        pr.rpush('a', '1')
+        assert pr.blpop('a', timeout=1) == ('a', '1')
@@ -4,6 +4,8 @@ import pytest
 import redis
 from redis._compat import unichr, unicode
 
+import redis_namespace
+
 
 class TestPipeline(object):
     def test_pipeline(self, r):
@@ -273,3 +275,260 @@ class TestPipeline(object):
 
             assert pipe == pipe2
             assert response == [True, [0, 0, 15, 15, 14], b'1']
+
+    def test_pipeline_sort(self, r):
+        r.rpush('a', '2', '3', '1')
+        r.mset({'score:1': 8, 'score:2': 3, 'score:3': 5,
+                'user:1': 'u1', 'user:2': 'u2', 'user:3': 'u3'})
+        with r.pipeline() as pipe:
+            pipe.sort('a', by='score:*', get=('user:*', '#'), store='sorted')
+            pipe.lrange('sorted', 0, -1)
+            assert pipe.execute() == \
+                [6, [b'u2', b'2', b'u3', b'3', b'u1', b'1']]
+
+    def test_pipeline_strips_namespace(self, r):
+        r.set('a', 1)
+        r.rpush('l', 1)
+        with r.pipeline(transaction=False) as pipe:
+            assert pipe.keys('a').execute() == [[b'a']]
+        with r.pipeline() as pipe:
+            pipe.keys('a').get('a').blpop('l', 1).blpop('l', 1)
+            assert pipe.execute() == [[b'a'], b'1', (b'l', b'1'), None]
+
+    def test_rewrite_is_deferred(self, r):
+        r.rpush('l', 1)
+        with r.pipeline() as pipe:
+            pipe.set('a', 1).mget('a', 'b').scan(0).execute_command('SORT', 'l', 'GET', '#')
+            assert [args for args, _ in pipe.command_stack] == [
+                ('SET', 'a', 1), ('MGET', 'ns:a', 'ns:b'), ('SCAN', 0), ('SORT', 'l', 'GET', '#')]
+            pipe._rewrite_stack()
+            assert [args for args, _ in pipe.command_stack] == [
+                ('SET', 'ns:a', 1), ('MGET', 'ns:a', 'ns:b'), ('SCAN', 0, 'match', 'ns:*'),
+                ('SORT', 'ns:l', 'GET', '#')]
+            response = pipe.execute()
+            assert sorted(response[2][1]) == [b'a', b'l']
+            assert response[:2] + response[3:] == [True, [b'1', None], [b'1']]
+
+
+class TestAutoFlushPipeline(object):
+    def test_auto_flush_commands(self, r):
+        with r.pipeline(auto_flush_commands=3) as pipe:
+            for i in range(7):
+                pipe.set('k%d' % i, i)
+            assert len(pipe) == 1
+            assert r.get('k5') == b'5'
+            assert r.get('k6') is None
+            pipe.get('k6')
+            assert pipe.execute() == [True] * 7 + [b'6']
+            assert pipe.execute() == []
+
+    def test_auto_flush_bytes(self, r):
+        with r.pipeline(transaction=False, auto_flush_bytes=1000) as pipe:
+            pipe.set('a', 'x' * 2000)
+            assert len(pipe) == 0
+            pipe.get('a')
+            assert pipe.execute() == [True, b'x' * 2000]
+
+    def test_result_callback(self, r):
+        batches = []
+        with r.pipeline(transaction=False, auto_flush_commands=2,
+                        result_callback=batches.append) as pipe:
+            for i in range(3):
+                pipe.set('k%d' % i, i)
+            pipe.keys('k0')
+            assert pipe.execute() == []
+        assert batches == [[True, True], [True, [b'k0']]]
+
+    def test_errors(self, r):
+        r.set('a', 1)
+        with r.pipeline(transaction=False, auto_flush_commands=2) as pipe:
+            pipe.lpush('a', 1).set('b', 1).set('c', 1)
+            with pytest.raises(redis.ResponseError) as ex:
+                pipe.execute()
+            assert str(ex.value).startswith('Command # 1 (LPUSH ns:a 1) of pipeline')
+        with r.pipeline(transaction=False, auto_flush_commands=2) as pipe:
+            pipe.set('b', 1).set('c', 1).lpush('a', 1)
+            response = pipe.execute(raise_on_error=False)
+            assert response[:2] == [True, True]
+            assert str(response[2]).startswith('Command # 3 (LPUSH ns:a 1)')
+
+    def test_explicit_transaction_is_not_split(self, r):
+        with r.pipeline(auto_flush_commands=2) as pipe:
+            pipe.watch('a')
+            pipe.multi()
+            pipe.set('a', 1).set('b', 1).set('c', 1)
+            assert len(pipe) == 3
+            assert pipe.execute() == [True, True, True]
+
+
+class TestExecuteIter(object):
+    def test_execute_iter(self, r):
+        with r.pipeline(transaction=False) as pipe:
+            for i in range(5):
+                pipe.set('k%d' % i, i)
+            pipe.keys('k1')
+            assert list(pipe.execute_iter(chunk_size=2)) == \
+                [(0, True), (1, True), (2, True), (3, True), (4, True), (5, [b'k1'])]
+            assert len(pipe) == 0
+            assert list(pipe.execute_iter()) == []
+
+    def test_transaction(self, r):
+        with r.pipeline() as pipe:
+            pipe.set('a', 1).get('a')
+            assert list(pipe.execute_iter()) == [(0, True), (1, b'1')]
+
+    def test_after_auto_flush(self, r):
+        with r.pipeline(transaction=False, auto_flush_commands=2) as pipe:
+            pipe.set('a', 1).set('b', 2).get('a')
+            assert list(pipe.execute_iter()) == [(0, True), (1, True), (2, b'1')]
+
+    def test_errors(self, r):
+        r.set('a', 1)
+        with r.pipeline(transaction=False) as pipe:
+            pipe.set('b', 1).lpush('a', 1).get('b')
+            responses = pipe.execute_iter()
+            assert next(responses) == (0, True)
+            with pytest.raises(redis.ResponseError) as ex:
+                next(responses)
+            assert str(ex.value).startswith('Command # 2 (LPUSH ns:a 1)')
+            pipe.set('b', 1).lpush('a', 1).get('b')
+            responses = list(pipe.execute_iter(raise_on_error=False))
+            assert isinstance(responses[1][1], redis.ResponseError)
+            assert responses[2] == (2, b'1')
+
+    def test_stop_early(self, r):
+        with r.pipeline(transaction=False) as pipe:
+            for i in range(10):
+                pipe.set('k%d' % i, i)
+            for i, response in pipe.execute_iter(chunk_size=3):
+                break
+            # the unread replies don't leak into the next command
+            assert pipe.get('k0').execute() == [b'0']
+            # chunks that were never sent are dropped
+            assert r.get('k9') is None
+
+
+@pytest.fixture(params=[True, False], ids=['transaction', 'no_transaction'])
+def compact_pipe(request, r):
+    with r.pipeline(transaction=request.param, compact=True) as pipe:
+        yield pipe
+
+
+class TestCompactPipeline(object):
+    def test_execute(self, r, compact_pipe):
+        r.set('a', 1)
+        compact_pipe.set('b', 2).get('a').keys('b').mget([]).mget('a', 'b')
+        assert len(compact_pipe) == 5
+        assert compact_pipe.command_stack == []
+        assert compact_pipe.execute() == [True, b'1', [b'b'], [], [b'1', b'2']]
+        assert len(compact_pipe) == 0
+        assert compact_pipe.execute() == []
+
+    def test_packed_with_namespace(self, compact_pipe):
+        compact_pipe.get('a')
+        assert bytes(compact_pipe._packed) == b'*2\r\n$3\r\nGET\r\n$4\r\nns:a\r\n'
+
+    def test_errors(self, r, compact_pipe):
+        r.set('a', 1)
+        compact_pipe.set('b', 1).lpush('a', 1)
+        with pytest.raises(redis.ResponseError) as ex:
+            compact_pipe.execute()
+        assert str(ex.value).startswith('Command # 2 (LPUSH) of pipeline')
+
+    def test_watch(self, r):
+        r.set('a', 1)
+        with r.pipeline(compact=True) as pipe:
+            pipe.watch('a')
+            assert pipe.get('a') == b'1'
+            pipe.multi()
+            pipe.incr('a')
+            assert pipe.execute() == [2]
+
+    def test_auto_flush_bytes(self, r):
+        with r.pipeline(transaction=False, compact=True, auto_flush_bytes=100) as pipe:
+            pipe.set('a', 'x' * 50)
+            assert len(pipe) == 1
+            pipe.set('b', 'x' * 50)
+            assert len(pipe) == 0
+            pipe.get('a')
+            assert pipe.execute() == [True, True, b'x' * 50]
+
+    def test_execute_iter(self, r):
+        with r.pipeline(transaction=False, compact=True) as pipe:
+            pipe.set('a', 1).keys('a')
+            assert list(pipe.execute_iter()) == [(0, True), (1, [b'a'])]
+
+    def test_execute_iter_in_chunks(self, r):
+        with r.pipeline(transaction=False, compact=True) as pipe:
+            for i in range(10):
+                pipe.set('k%d' % i, '\r\n%d' % i)
+            pipe.mget(['k%d' % i for i in range(10)])
+            responses = pipe.execute_iter(chunk_size=3)
+            assert next(responses) == (0, True)
+            # only the first two chunks are on the wire
+            assert r.get('k6') is None
+            assert list(responses)[-1] == \
+                (10, [('\r\n%d' % i).encode() for i in range(10)])
+
+    def test_namespaced_connection(self, request):
+        pool = redis.ConnectionPool(
+            connection_class=redis_namespace.NamespacedConnection, namespace='ns:',
+            host='localhost', port=6379, db=9)
+        request.addfinalizer(pool.disconnect)
+        client = redis_namespace.Redis(connection_pool=pool)
+        with client.pipeline(compact=True) as pipe:
+            pipe.set('a', 1).keys('a')
+            assert bytes(pipe._packed).count(b'ns:a') == 2
+            assert pipe.execute() == [True, [b'a']]
+        client.delete('a')
+
+
+class TestOptimisticTransaction(object):
+    def incr_with_conflicts(self, r, conflicts):
+        other = redis.Redis(host='localhost', port=6379, db=9)
+        calls = []
+
+        def incr(pipe):
+            calls.append(1)
+            value = int(pipe.get('a') or 0)
+            if len(calls) <= conflicts:
+                other.incr('ns:a', 10)
+            pipe.multi()
+            pipe.set('a', value + 1)
+            return value + 1
+        return incr
+
+    def test_commit(self, r):
+        tx = r.optimistic_transaction(self.incr_with_conflicts(r, 0), 'a',
+                                      value_from_callable=True)
+        assert tx.watches == ['ns:a']
+        assert tx() == 1
+        assert tx.commits == 1
+        assert tx.conflicts == 0
+
+    def test_retry(self, r):
+        tx = r.optimistic_transaction(self.incr_with_conflicts(r, 2), 'a',
+                                      backoff=0.0001)
+        assert tx.execute() == [True]
+        assert r.get('a') == b'21'
+        assert (tx.conflicts, tx.retries, tx.commits) == (2, 2, 1)
+
+    def test_give_up(self, r):
+        tx = r.optimistic_transaction(self.incr_with_conflicts(r, 5), 'a',
+                                      max_retries=2, backoff=0.0001)
+        with pytest.raises(redis.WatchError):
+            tx.execute()
+        assert (tx.conflicts, tx.retries, tx.failures) == (3, 2, 1)
+        assert r.get('a') == b'30'
+
+    def test_fallback(self, r):
+        incr = r.register_script("return redis.call('INCRBY', KEYS[1], ARGV[1])")
+        tx = r.optimistic_transaction(self.incr_with_conflicts(r, 5), 'a',
+                                      fallback=incr, fallback_args=[1], fallback_after=2,
+                                      backoff=0.0001)
+        assert tx.execute() == 21
+        assert (tx.conflicts, tx.retries, tx.fallbacks) == (2, 1, 1)
+
+    def test_unexpected_argument(self, r):
+        with pytest.raises(TypeError):
+            r.optimistic_transaction(lambda pipe: None, 'a', retries=1)
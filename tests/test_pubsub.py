@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 import pytest
+import threading
 import time
 
 import redis
@@ -294,6 +295,329 @@ class TestPubSubMessages(object):
         assert expect in info.exconly()
 
 
+class TestPubSubGetMessages(object):
+    def setup_method(self, method):
+        self.messages = []
+
+    def message_handler(self, message):
+        self.messages.append(message)
+
+    def wait_for_messages(self, p, count, **kwargs):
+        messages = []
+        deadline = time.time() + 1
+        while len(messages) < count and time.time() < deadline:
+            messages.extend(p.get_messages(timeout=0.01, **kwargs))
+        return messages
+
+    def test_get_messages(self, r):
+        p = r.pubsub()
+        p.subscribe('foo')
+        p.psubscribe('f*')
+        for i in range(3):
+            r.publish('foo', i)
+        messages = self.wait_for_messages(p, 8)
+        assert messages[:2] == [make_message('subscribe', 'foo', 1),
+                                make_message('psubscribe', 'f*', 2)]
+        assert [m for m in messages if m['type'] == 'message'] == \
+            [make_message('message', 'foo', str(i)) for i in range(3)]
+        assert [m for m in messages if m['type'] == 'pmessage'] == \
+            [make_message('pmessage', 'foo', str(i), pattern='f*') for i in range(3)]
+
+    def test_max_count(self, r):
+        p = r.pubsub()
+        p.subscribe('foo')
+        for i in range(5):
+            r.publish('foo', i)
+        time.sleep(0.05)
+        first = p.get_messages(max_count=3)
+        assert [m['data'] for m in first] == [1, b'0', b'1']
+        assert [m['data'] for m in p.get_messages()] == [b'2', b'3', b'4']
+
+    def test_no_messages(self, r):
+        p = r.pubsub()
+        p.subscribe('foo')
+        assert len(p.get_messages(timeout=0.1)) == 1
+        assert p.get_messages() == []
+
+    def test_handlers_and_unsubscribe(self, r):
+        p = r.pubsub(ignore_subscribe_messages=True)
+        p.subscribe('bar', foo=self.message_handler)
+        r.publish('foo', 'handled')
+        r.publish('bar', 'returned')
+        assert self.wait_for_messages(p, 1) == [make_message('message', 'bar', 'returned')]
+        assert self.messages == [make_message('message', 'foo', 'handled')]
+        p.unsubscribe('foo')
+        assert self.wait_for_messages(p, 1) == []
+        assert list(p.channels) == [b'bar']
+
+    def test_decode_responses(self):
+        r = _get_client(redis_namespace.Redis, decode_responses=True)
+        p = r.pubsub(ignore_subscribe_messages=True)
+        p.psubscribe('f*')
+        r.publish('foo', 'test message')
+        assert self.wait_for_messages(p, 1) == [{
+            'type': 'pmessage', 'pattern': 'f*', 'channel': 'foo',
+            'data': 'test message'}]
+
+
+def wait_until(condition, timeout=1):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+class TestPubSubDispatch(object):
+
+    def test_channels_are_ordered_and_parallel(self, r):
+        release = threading.Event()
+        handled = {'slow': [], 'fast': []}
+
+        def slow(message):
+            release.wait(1)
+            handled['slow'].append(message['data'])
+
+        def fast(message):
+            handled['fast'].append(message['data'])
+
+        p = r.pubsub(ignore_subscribe_messages=True, dispatch_workers=4)
+        p.subscribe(slow=slow)
+        p.psubscribe(**{'f*': fast})
+        for i in range(10):
+            r.publish('slow', i)
+            r.publish('fast', i)
+        expected = [str(i).encode() for i in range(10)]
+        assert wait_until(lambda: p.get_messages(timeout=0.01) == [] and
+                          handled['fast'] == expected)
+        # the blocked channel kept its queue while the other one ran
+        assert handled['slow'] == []
+        assert p.dispatcher.channel_depths() == {b'slow': 10}
+        assert p.dispatcher.pending == 10
+        assert p.dispatcher.max_pending >= 10
+        release.set()
+        assert wait_until(lambda: p.dispatcher.pending == 0)
+        assert handled['slow'] == expected
+        assert p.dispatcher.channel_depths() == {}
+        p.close()
+
+    def test_errors_are_counted(self, r):
+        def fail(message):
+            raise ValueError(message['data'])
+
+        p = r.pubsub(ignore_subscribe_messages=True, dispatch_workers=1)
+        p.subscribe(foo=fail)
+        r.publish('foo', 1)
+        r.publish('foo', 2)
+        assert wait_until(lambda: wait_for_message(p, 0.01) is None and
+                          p.dispatcher.completed == 2)
+        assert p.dispatcher.errors == 2
+        p.close()
+
+    def test_run_in_thread(self, r):
+        handled = []
+        p = r.pubsub(dispatch_workers=2)
+        p.subscribe(foo=handled.append)
+        thread = p.run_in_thread(sleep_time=0.01)
+        r.publish('foo', 'bar')
+        assert wait_until(lambda: handled)
+        thread.stop()
+        thread.join(1)
+        assert handled == [make_message('message', 'foo', 'bar')]
+
+    def test_run_in_thread_again(self, r):
+        handled = []
+        p = r.pubsub(ignore_subscribe_messages=True, dispatch_workers=2)
+        p.subscribe(foo=handled.append)
+        thread = p.run_in_thread(sleep_time=0.01)
+        thread.stop()
+        thread.join(1)
+        # stopping the thread closed the pubsub
+        p.subscribe(foo=handled.append)
+        thread = p.run_in_thread(sleep_time=0.01)
+        r.publish('foo', 'bar')
+        assert wait_until(lambda: handled)
+        thread.stop()
+        thread.join(1)
+        assert handled == [make_message('message', 'foo', 'bar')]
+        assert p.dispatcher.errors == 0
+
+    def test_messages_without_handler_are_returned(self, r):
+        p = r.pubsub(ignore_subscribe_messages=True, dispatch_workers=1)
+        p.subscribe('foo')
+        r.publish('foo', 'bar')
+        assert wait_for_message(p) == make_message('message', 'foo', 'bar')
+        assert p.dispatcher.submitted == 0
+        p.close()
+
+    def test_failed_submit_frees_the_channel(self):
+        class Executor(object):
+            broken = True
+
+            def submit(self, fn, *args):
+                if self.broken:
+                    raise RuntimeError('cannot schedule new futures after shutdown')
+                fn(*args)
+
+        handled = []
+        executor = Executor()
+        dispatcher = redis_namespace.HandlerDispatcher(executor)
+        with pytest.raises(RuntimeError):
+            dispatcher.dispatch(b'foo', handled.append, 1)
+        assert dispatcher.pending == 0
+        assert dispatcher.channel_depths() == {}
+        executor.broken = False
+        dispatcher.dispatch(b'foo', handled.append, 2)
+        assert handled == [2]
+        assert dispatcher.pending == 0
+
+
+class TestPubSubResubscribe(object):
+
+    def test_resubscribe_in_chunks(self, r, monkeypatch):
+        p = r.pubsub(ignore_subscribe_messages=True)
+        monkeypatch.setattr(p, 'resubscribe_chunk_size', 1000)
+        channels = ['c%d' % i for i in range(2500)]
+        p.subscribe(*channels)
+        p.psubscribe('p*')
+        assert p.get_messages(max_count=10000, timeout=0.1) == []
+        sent = []
+        pack_commands = p.connection.pack_commands
+
+        def record(commands):
+            sent.extend(commands)
+            return pack_commands(commands)
+        monkeypatch.setattr(p.connection, 'pack_commands', record)
+        p.connection.disconnect()
+        assert p.get_messages(max_count=10000, timeout=0.1) == []
+        assert [(c[0], len(c) - 1) for c in sent] == [
+            ('SUBSCRIBE', 1000), ('SUBSCRIBE', 1000), ('SUBSCRIBE', 500),
+            ('PSUBSCRIBE', 1)]
+        assert sorted(n for c in sent[:3] for n in c[1:]) == \
+            sorted((NS + c).encode('utf-8') for c in channels)
+        assert sent[3][1] == (NS + 'p*').encode('utf-8')
+        assert r.publish('c2499', 'x') == 1
+        messages = []
+        deadline = time.time() + 1
+        while not messages and time.time() < deadline:
+            messages = p.get_messages(max_count=10000, timeout=0.01)
+        assert messages == [make_message('message', 'c2499', 'x')]
+        p.close()
+
+    def test_confirmations_after_reconnect(self, r):
+        p = r.pubsub()
+        p.subscribe('foo', 'bar')
+        assert len(p.get_messages(timeout=0.1)) == 2
+        p.connection.disconnect()
+        messages = p.get_messages(timeout=0.1)
+        assert sorted((m['type'], m['channel']) for m in messages) == \
+            [('subscribe', b'bar'), ('subscribe', b'foo')]
+
+    def test_prefixed_names_are_cached(self, r):
+        p = r.pubsub()
+        p.subscribe('foo', 'bar')
+        p.psubscribe('f*')
+        ns = NS.encode('utf-8')
+        assert p._prefixed_channels == {b'foo': ns + b'foo', b'bar': ns + b'bar'}
+        p.unsubscribe('foo')
+        assert list(p._prefixed_channels) == [b'bar']
+        p.punsubscribe()
+        assert p._prefixed_patterns == {}
+        p.close()
+
+
+@pytest.fixture()
+def notifications(request):
+    raw = redis.Redis(host='localhost', port=6379, db=9)
+    previous = raw.config_get('notify-keyspace-events')['notify-keyspace-events']
+    raw.config_set('notify-keyspace-events', 'KEA')
+    request.addfinalizer(lambda: raw.config_set('notify-keyspace-events', previous))
+    return raw
+
+
+def wait_for_key_events(p, count, timeout=1):
+    events = []
+    deadline = time.time() + timeout
+    while len(events) < count and time.time() < deadline:
+        events.extend(p.get_key_events(timeout=0.01))
+    return events
+
+
+class TestPubSubKeyspace(object):
+
+    def test_keyspace(self, r, notifications):
+        p = r.pubsub(ignore_subscribe_messages=True)
+        p.psubscribe_keyspace()
+        wait_for_message(p)
+        notifications.set('other', 1)
+        r.set('foo', 1)
+        message = wait_for_message(p)
+        assert message == {'type': 'keyspace', 'pattern': b'__keyspace@9__:ns:*',
+                           'channel': b'__keyspace@9__:ns:foo', 'data': b'set',
+                           'key': b'foo', 'event': b'set'}
+        p.close()
+
+    def test_keyspace_pattern(self, r, notifications):
+        p = r.pubsub()
+        p.psubscribe_keyspace('user:*')
+        r.set('item', 1)
+        r.set('user:1', 1)
+        r.delete('user:1')
+        assert wait_for_key_events(p, 2) == [(b'user:1', b'set'), (b'user:1', b'del')]
+        p.punsubscribe_keyspace('user:*')
+        r.set('user:2', 1)
+        assert wait_for_key_events(p, 1, timeout=0.1) == []
+        p.close()
+
+    def test_keyevent(self, r, notifications):
+        p = r.pubsub()
+        p.subscribe_keyevent('set', 'expired')
+        notifications.set('other', 1)
+        r.set('foo', 1)
+        r.set('bar', 1, px=1)
+        events = wait_for_key_events(p, 3)
+        assert sorted(events) == [(b'bar', b'expired'), (b'bar', b'set'), (b'foo', b'set')]
+        p.unsubscribe_keyevent('set', 'expired')
+        assert p.get_messages(timeout=0.1)[0]['type'] == 'unsubscribe'
+        p.close()
+
+    def test_handler(self, r, notifications):
+        messages = []
+        p = r.pubsub(ignore_subscribe_messages=True)
+        p.subscribe_keyevent('del', handler=messages.append)
+        r.set('foo', 1)
+        r.delete('foo')
+        wait_for_message(p)
+        assert [(m['type'], m['key'], m['event']) for m in messages] == \
+            [('keyevent', b'foo', b'del')]
+        p.close()
+
+    def test_resubscribe(self, r, notifications):
+        p = r.pubsub(ignore_subscribe_messages=True)
+        p.psubscribe_keyspace()
+        p.subscribe_keyevent('set')
+        wait_for_message(p)
+        p.connection.disconnect()
+        wait_for_message(p)
+        r.set('foo', 1)
+        assert sorted(wait_for_key_events(p, 2)) == [(b'foo', b'set'), (b'foo', b'set')]
+        p.close()
+
+    def test_decode_responses(self, request, notifications):
+        r = _get_client(redis_namespace.Redis, request, decode_responses=True)
+        p = r.pubsub()
+        p.psubscribe_keyspace()
+        r.set('foo', 1)
+        assert wait_for_key_events(p, 1) == [('foo', 'set')]
+        p.close()
+
+    def test_namespaced_connection(self):
+        pool = redis.ConnectionPool(connection_class=redis_namespace.NamespacedConnection,
+                                    namespace=NS, db=9)
+        p = redis_namespace.Redis(connection_pool=pool).pubsub()
+        with pytest.raises(redis.RedisError):
+            p.psubscribe_keyspace()
+
+
 class TestPubSubAutoDecoding(object):
     "These tests only validate that we get unicode values back"
 
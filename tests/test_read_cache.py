@@ -0,0 +1,251 @@
+from __future__ import unicode_literals
+import time
+
+import pytest
+import redis
+
+import redis_namespace
+
+from .conftest import NS, _get_client
+from .fake_server import FakeRedisServer
+
+
+def fake_replies():
+    return {
+        'GET': lambda args: b'value of ' + args[0],
+        'MGET': lambda args: [b'value of ' + arg for arg in args],
+        'HGETALL': [b'field', b'value'],
+        'TTL': 10,
+        'DEL': 1,
+        'EXISTS': 0,
+        'GEORADIUS': 1,
+    }
+
+
+@pytest.fixture()
+def server(request):
+    server = FakeRedisServer(fake_replies())
+    request.addfinalizer(server.close)
+    return server
+
+
+def make_client(server, **kwargs):
+    kwargs.setdefault('read_cache', True)
+    return redis_namespace.StrictRedis(namespace=NS, host='127.0.0.1', port=server.port,
+                                       **kwargs)
+
+
+def commands(server, name):
+    return [c[1:] for c in server.commands if c[0] == name]
+
+
+class TestReadCache(object):
+
+    def test_disabled_by_default(self, server):
+        client = make_client(server, read_cache=False)
+        assert client.read_cache is None
+        client.get('a')
+        client.get('a')
+        assert len(commands(server, b'GET')) == 2
+
+    def test_hits(self, server):
+        client = make_client(server)
+        assert client.get('a') == b'value of ns:a'
+        assert client.get('a') == b'value of ns:a'
+        assert client.get(b'a') == b'value of ns:a'
+        assert commands(server, b'GET') == [[b'ns:a']]
+        cache = client.read_cache
+        assert (cache.hits, cache.misses) == (2, 1)
+        assert cache.hit_ratio == 2 / 3.0
+        assert len(cache) == 1
+        assert cache.bytes > 0
+
+    def test_writes_invalidate(self, server):
+        client = make_client(server)
+        client.get('a')
+        client.mget(['a', 'b'])
+        client.get('c')
+        client.set('a', 1)
+        assert client.read_cache.invalidations == 2
+        client.get('a')
+        client.mget(['a', 'b'])
+        client.get('c')
+        assert commands(server, b'GET') == [[b'ns:a'], [b'ns:c'], [b'ns:a']]
+        assert len(commands(server, b'MGET')) == 2
+
+    def test_bulk_writes_invalidate(self, server):
+        client = make_client(server, read_cache_max_entries=10)
+        client.get('a')
+        client.get('b')
+        assert client.mget('a', 'b') == [b'value of ns:a', b'value of ns:b']
+        client.mget('a', 'b')
+        assert len(commands(server, b'MGET')) == 1
+        client.mset({'b': 1})
+        assert len(client.read_cache) == 1
+        client.delete('a')
+        assert len(client.read_cache) == 0
+
+    def test_reads_do_not_invalidate(self, server):
+        client = make_client(server)
+        client.get('a')
+        client.ttl('a')
+        client.get('a')
+        assert len(commands(server, b'GET')) == 1
+
+    def test_flushdb_clears(self, server):
+        client = make_client(server)
+        client.get('a')
+        client.flushdb()
+        assert len(client.read_cache) == 0
+
+    def test_unknown_commands_clear(self, server):
+        client = make_client(server)
+        client.get('a')
+        client.ping()
+        assert len(client.read_cache) == 1
+        client.execute_command('CLIENT', 'SETNAME', 'x')
+        assert len(client.read_cache) == 0
+
+    def test_georadius_store_invalidates(self, server):
+        client = make_client(server)
+        client.get('a')
+        client.exists('dest')
+        client.georadius('g', 0, 0, 1, store='dest')
+        assert len(client.read_cache) == 1
+        client.exists('dest')
+        assert len(commands(server, b'EXISTS')) == 2
+        assert commands(server, b'GEORADIUS')[0][-2:] == [b'STORE', b'ns:dest']
+
+    def test_pipeline_writes_invalidate(self, server):
+        client = make_client(server)
+        client.get('a')
+        with client.pipeline(transaction=False) as pipe:
+            pipe.set('a', 1).get('b')
+            assert len(client.read_cache) == 0
+            pipe.execute()
+        client.get('a')
+        assert len(commands(server, b'GET')) == 3
+
+    def test_options_and_copies(self, server):
+        client = make_client(server)
+        reply = client.hgetall('h')
+        assert reply == {b'field': b'value'}
+        reply['other'] = 1
+        assert client.hgetall('h') == {b'field': b'value'}
+        assert len(commands(server, b'HGETALL')) == 1
+
+    def test_configured_commands(self, server):
+        client = make_client(server, read_cache_commands=['hgetall'])
+        client.get('a')
+        client.get('a')
+        client.hgetall('h')
+        client.hgetall('h')
+        assert len(commands(server, b'GET')) == 2
+        assert len(commands(server, b'HGETALL')) == 1
+
+    def test_lru_eviction(self, server):
+        client = make_client(server, read_cache_max_entries=2)
+        client.get('a')
+        client.get('b')
+        client.get('a')
+        client.get('c')
+        cache = client.read_cache
+        assert cache.evictions == 1
+        client.get('a')
+        client.get('b')
+        assert commands(server, b'GET') == [[b'ns:a'], [b'ns:b'], [b'ns:c'], [b'ns:b']]
+
+    def test_byte_bound(self, server):
+        client = make_client(server, read_cache_max_bytes=300)
+        for key in 'abcdef':
+            client.get(key)
+        cache = client.read_cache
+        assert 0 < cache.bytes <= 300
+        assert cache.evictions == 6 - len(cache)
+
+    def test_ttl(self, server):
+        client = make_client(server, read_cache_ttl=0.02)
+        client.get('a')
+        client.get('a')
+        time.sleep(0.03)
+        client.get('a')
+        cache = client.read_cache
+        assert cache.expirations == 1
+        assert len(commands(server, b'GET')) == 2
+        assert 0 <= cache.max_hit_age < 0.02
+
+    def test_staleness(self, server):
+        client = make_client(server)
+        client.get('a')
+        time.sleep(0.01)
+        client.get('a')
+        cache = client.read_cache
+        assert cache.max_hit_age >= 0.01
+        assert cache.mean_hit_age == cache.max_hit_age
+
+    def test_notification(self, server):
+        client = make_client(server)
+        client.get('a')
+        client.get('b')
+        client.read_cache.handle_notification({'type': 'keyspace', 'key': b'a', 'event': b'set'})
+        client.get('a')
+        client.get('b')
+        assert commands(server, b'GET') == [[b'ns:a'], [b'ns:b'], [b'ns:a']]
+
+    def test_invalidated_during_read(self, server):
+        client = make_client(server)
+        cache = client.read_cache
+
+        def execute(*args, **options):
+            reply = client._execute_command(*args, **options)
+            cache.invalidate(['a'])
+            return reply
+        assert cache.execute(execute, ('GET', 'a'), {}) == b'value of ns:a'
+        assert len(cache) == 0
+
+
+def stopper(thread):
+    def stop():
+        thread.stop()
+        thread.join()
+    return stop
+
+
+@pytest.fixture()
+def notifications(request):
+    raw = redis.Redis(host='localhost', port=6379, db=9)
+    previous = raw.config_get('notify-keyspace-events')['notify-keyspace-events']
+    raw.config_set('notify-keyspace-events', 'KA')
+    request.addfinalizer(lambda: raw.config_set('notify-keyspace-events', previous))
+    return raw
+
+
+class TestReadCacheNotifications(object):
+
+    def test_listen(self, request, notifications):
+        client = _get_client(redis_namespace.Redis, request, read_cache=True)
+        notifications.set(NS + 'a', 1)
+        thread = client.read_cache.listen(client)
+        request.addfinalizer(stopper(thread))
+        assert client.get('a') == b'1'
+        assert len(client.read_cache) == 1
+        notifications.set('other', 2)
+        notifications.set(NS + 'a', 2)
+        deadline = time.time() + 1
+        while len(client.read_cache) and time.time() < deadline:
+            time.sleep(0.01)
+        assert client.get('a') == b'2'
+        assert client.read_cache.invalidations == 1
+
+    def test_reconnect_clears(self, request, notifications):
+        client = _get_client(redis_namespace.Redis, request, read_cache=True)
+        notifications.set(NS + 'a', 1)
+        thread = client.read_cache.listen(client)
+        request.addfinalizer(stopper(thread))
+        client.get('a')
+        assert len(client.read_cache) == 1
+        notifications.execute_command('CLIENT', 'KILL', 'TYPE', 'pubsub')
+        deadline = time.time() + 1
+        while len(client.read_cache) and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(client.read_cache) == 0
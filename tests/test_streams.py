@@ -0,0 +1,83 @@
+from __future__ import unicode_literals
+import time
+
+import pytest
+import redis
+
+from redis_namespace import StreamConsumer
+
+from .conftest import skip_if_server_version_lt
+
+
+@pytest.fixture()
+def raw():
+    return redis.Redis(host='localhost', port=6379, db=9)
+
+
+@skip_if_server_version_lt('5.0.0')
+class TestStreams(object):
+
+    def test_stream_is_namespaced(self, r, raw):
+        r.xadd('s', {'a': 1})
+        assert raw.keys() == [b'ns:s']
+        assert r.xlen('s') == 1
+
+    def test_xread_multiple_streams(self, r):
+        m1 = r.xadd('a', {'f': 1})
+        m2 = r.xadd('b', {'f': 2})
+        response = r.xread({'a': 0, 'b': 0})
+        assert sorted(response) == [['a', [(m1, {b'f': b'1'})]],
+                                    ['b', [(m2, {b'f': b'2'})]]]
+
+    def test_xreadgroup(self, r):
+        m1 = r.xadd('s', {'f': 1})
+        r.xgroup_create('s', 'g', 0)
+        assert r.xreadgroup('g', 'c', {'s': '>'}) == [['s', [(m1, {b'f': b'1'})]]]
+        assert r.xpending('s', 'g')['pending'] == 1
+        assert r.xack('s', 'g', m1) == 1
+        assert r.xinfo_groups('s')[0]['pending'] == 0
+
+
+@skip_if_server_version_lt('5.0.0')
+class TestStreamConsumer(object):
+
+    def test_creates_group(self, r):
+        consumer = r.stream_consumer('s', 'g', 'c')
+        assert r.xinfo_groups('s')[0]['name'] == b'g'
+        # creating it again is fine
+        consumer.create_group()
+
+    def test_read_and_ack_in_batches(self, r):
+        ids = [r.xadd('s', {'i': i}) for i in range(5)]
+        consumer = r.stream_consumer('s', 'g', 'c', count=2, ack_batch_size=3)
+        messages = consumer.read()
+        assert messages == [('s', ids[0], {b'i': b'0'}), ('s', ids[1], {b'i': b'1'})]
+        assert consumer.ack('s', ids[0], ids[1]) == 0
+        assert r.xpending('s', 'g')['pending'] == 2
+        consumer.read()
+        assert consumer.ack('s', ids[2]) == 3
+        assert r.xpending('s', 'g')['pending'] == 1
+        assert consumer.close() == 0
+
+    def test_iterate(self, r):
+        for i in range(5):
+            r.xadd('s', {'i': i})
+        with r.stream_consumer('s', 'g', 'c', count=2) as consumer:
+            assert [fields for _, _, fields in consumer] == \
+                [{b'i': str(i).encode()} for i in range(5)]
+        assert r.xpending('s', 'g')['pending'] == 0
+
+    def test_claim_stale(self, r):
+        ids = [r.xadd('s', {'i': i}) for i in range(3)]
+        StreamConsumer(r, 's', 'g', 'dead').read()
+        r.xdel('s', ids[1])
+        time.sleep(0.02)
+        consumer = r.stream_consumer('s', 'g', 'c', claim_min_idle_time=10)
+        r.xadd('s', {'i': 3})
+        messages = consumer.read()
+        assert [fields for _, _, fields in messages] == \
+            [{b'i': b'0'}, {b'i': b'2'}, {b'i': b'3'}]
+        # the deleted entry is acked instead of being handed out
+        consumer.flush_acks()
+        pending = r.xpending_range('s', 'g', count=10)
+        assert [p['consumer'] for p in pending] == [b'c'] * 3